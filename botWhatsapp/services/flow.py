@@ -1,6 +1,7 @@
 from botWhatsapp.models import WhatsAppUser, Agente
 from botWhatsapp.tasks import buscar_nfe_tms_task
-from manifesto.tasks import enviar_baixa_esl_task
+from core.chave_nfe import TAMANHO as TAMANHO_CHAVE, decodificar, limpar, motivo_invalida
+from manifesto.integracao_esl import enfileirar_baixa
 from manifesto.models import BaixaNF, NotaFiscal
 
 
@@ -31,6 +32,14 @@ def processar_mensagem(user, mensagem, midia=None):
     # NÚMERO NF-e
     # =========================
     if user.estado == 'AGUARDANDO_NUMERO_NFE':
+        # Aceita também a chave de 44 dígitos: validada aqui, antes de qualquer busca no TMS
+        digitos = limpar(mensagem)
+        if len(digitos) == TAMANHO_CHAVE:
+            erro = motivo_invalida(digitos)
+            if erro:
+                return f"❌ Chave inválida: {erro}\nDigite novamente:"
+            mensagem = str(decodificar(digitos).numero)
+
         user.temp_nfe_numero = mensagem
         user.estado = 'AGUARDANDO_VALOR_NFE'
         user.save()
@@ -104,7 +113,7 @@ def processar_mensagem(user, mensagem, midia=None):
             save=True
         )
 
-        enviar_baixa_esl_task.delay(baixa.id)
+        enfileirar_baixa(baixa)
 
         user.estado = 'AGUARDANDO_NUMERO_NFE'
         user.temp_nfe_dados = None
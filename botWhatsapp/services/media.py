@@ -1,21 +1,27 @@
 # botWhatsapp/services/media.py
 
 import requests
-from django.core.files.base import ContentFile
 from django.conf import settings
 
+from core.uploads import baixar_imagem
+
 
 def baixar_midia_whatsapp(media_id):
+    """
+    Baixa a mídia em streaming para um arquivo temporário (nunca inteira na memória).
+    Levanta UploadRejeitado se não for foto ou passar de COMPROVANTE_TAMANHO_MAXIMO.
+    """
     url = f"{settings.MEGA_API_BASE_URL}/rest/getMedia/{settings.MEGA_API_INSTANCE}/{media_id}"
 
     headers = {
         "Authorization": f"Bearer {settings.MEGA_API_TOKEN}"
     }
 
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
+    response = requests.get(url, headers=headers, stream=True, timeout=(5, 60))
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
 
-    return ContentFile(
-        response.content,
-        name=f"{media_id}.jpg"
-    )
+    return baixar_imagem(response, f"{media_id}.jpg")
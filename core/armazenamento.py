@@ -0,0 +1,220 @@
+# core/armazenamento.py
+"""
+Upload dos comprovantes para o FTP público com sessões reaproveitadas.
+
+Cada processo (worker Celery, gunicorn) mantém um pool de sessões já logadas e posicionadas
+na pasta de destino, então login e CWD são pagos uma vez por sessão e não uma vez por foto.
+Sessão parada há mais de FTP_POOL_OCIOSO s passa por um NOOP antes de ser usada; a que
+morreu é descartada e trocada por uma nova. No máximo FTP_POOL_TAMANHO uploads simultâneos
+por processo. Toda falha vira ErroArmazenamento com a etapa que falhou.
+"""
+import ftplib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+
+# Blocos maiores que o padrão do ftplib (8 KB): menos chamadas de sistema por foto
+TAMANHO_BLOCO = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_pid = None
+
+
+class ErroArmazenamento(Exception):
+    """Upload não concluído (conexão, login, pasta, pool esgotado ou STOR recusado)."""
+
+
+class PoolFTP:
+    def __init__(self, host, porta, usuario, senha, diretorios, url_base,
+                 tamanho=4, timeout=30, ocioso_max=30, espera=60):
+        self.host = host
+        self.porta = porta
+        self.usuario = usuario
+        self.senha = senha
+        self.diretorios = list(diretorios)
+        self.url_base = url_base
+        self.tamanho = tamanho
+        self.timeout = timeout
+        self.ocioso_max = ocioso_max
+        self.espera = espera
+        # LIFO: a sessão usada por último é a que tem menos chance de ter caído por ociosidade
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(tamanho)
+        self._trava = threading.Lock()
+        self.estatisticas = Counter()
+
+    def _contar(self, nome):
+        with self._trava:
+            self.estatisticas[nome] += 1
+
+    # --- sessões ---
+
+    def _abrir(self):
+        ftp = ftplib.FTP(timeout=self.timeout)
+        try:
+            ftp.connect(self.host, self.porta)
+        except ftplib.all_errors as e:
+            raise ErroArmazenamento(f"Conexão com {self.host}:{self.porta} falhou: {e}")
+
+        try:
+            ftp.login(user=self.usuario, passwd=self.senha)
+        except ftplib.all_errors as e:
+            self._fechar(ftp)
+            raise ErroArmazenamento(f"Login no FTP recusado: {e}")
+
+        # Alguns servidores já logam dentro da public_html: tenta as pastas em ordem
+        erro = None
+        for diretorio in self.diretorios:
+            try:
+                ftp.cwd(diretorio)
+                break
+            except ftplib.error_perm as e:
+                erro = e
+        else:
+            if self.diretorios:
+                self._fechar(ftp)
+                raise ErroArmazenamento(f"Nenhuma pasta de destino acessível ({', '.join(self.diretorios)}): {erro}")
+
+        self._contar('logins')
+        return ftp
+
+    def _fechar(self, ftp):
+        try:
+            ftp.close()
+        except Exception:
+            pass
+
+    def _viva(self, ftp, ultimo_uso):
+        if time.monotonic() - ultimo_uso < self.ocioso_max:
+            return True
+        try:
+            ftp.voidcmd('NOOP')
+            return True
+        except ftplib.all_errors:
+            return False
+
+    def _pegar(self):
+        while True:
+            try:
+                ftp, ultimo_uso = self._livres.get_nowait()
+            except queue.Empty:
+                return self._abrir()
+            if self._viva(ftp, ultimo_uso):
+                self._contar('reusos')
+                return ftp
+            self._contar('descartadas')
+            self._fechar(ftp)
+
+    @contextmanager
+    def sessao(self):
+        """Empresta uma sessão logada; volta para o pool se o bloco terminar sem erro."""
+        if not self._vagas.acquire(timeout=self.espera):
+            raise ErroArmazenamento(f"Nenhuma sessão FTP livre em {self.espera}s")
+        ftp = None
+        try:
+            ftp = self._pegar()
+            yield ftp
+        except BaseException:
+            # Estado da sessão desconhecido (STOR pela metade): não volta para o pool
+            if ftp is not None:
+                self._fechar(ftp)
+            raise
+        else:
+            self._livres.put((ftp, time.monotonic()))
+        finally:
+            self._vagas.release()
+
+    def encerrar(self):
+        """Fecha as sessões paradas (QUIT educado)."""
+        while True:
+            try:
+                ftp, _ = self._livres.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                self._fechar(ftp)
+
+    # --- upload ---
+
+    def enviar(self, dados, nome_arquivo):
+        """
+        STOR do arquivo na pasta de destino. Retorna a URL pública ou levanta ErroArmazenamento.
+        `dados` pode ser bytes ou um arquivo aberto em modo binário (enviado em blocos, sem ler inteiro).
+        Se a sessão reaproveitada cair no meio do envio, tenta uma vez com uma sessão nova.
+        """
+        arquivo = dados if hasattr(dados, 'read') else BytesIO(dados)
+        for tentativa in (1, 2):
+            try:
+                arquivo.seek(0)
+                with self.sessao() as ftp:
+                    ftp.storbinary(f"STOR {nome_arquivo}", arquivo, blocksize=TAMANHO_BLOCO)
+            except ErroArmazenamento:
+                self._contar('falhas')
+                raise
+            except ftplib.error_perm as e:
+                # 5xx: sem permissão, nome inválido, disco cheio... repetir não resolve
+                self._contar('falhas')
+                raise ErroArmazenamento(f"STOR {nome_arquivo} recusado: {e}")
+            except ftplib.all_errors as e:
+                if tentativa == 2:
+                    self._contar('falhas')
+                    raise ErroArmazenamento(f"Upload de {nome_arquivo} falhou: {e}")
+                self._contar('reconexoes')
+                logger.warning(f"⚠️ Upload de {nome_arquivo} falhou ({e}); tentando com outra sessão")
+                continue
+            self._contar('uploads')
+            return f"{self.url_base}{nome_arquivo}"
+
+    def enviar_varios(self, arquivos):
+        """
+        arquivos: [(bytes ou arquivo, nome_arquivo)] enviados em paralelo (até `tamanho` por vez).
+        Retorna {nome_arquivo: URL ou ErroArmazenamento}; uma falha não derruba as outras.
+        """
+        def _enviar(arquivo):
+            dados, nome = arquivo
+            try:
+                return nome, self.enviar(dados, nome)
+            except ErroArmazenamento as e:
+                return nome, e
+
+        if not arquivos:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.tamanho, len(arquivos))) as executor:
+            return dict(executor.map(_enviar, arquivos))
+
+
+def _criar_pool():
+    return PoolFTP(
+        host=settings.FTP_HOST,
+        porta=settings.FTP_PORTA,
+        usuario=settings.FTP_USER,
+        senha=settings.FTP_PASS,
+        diretorios=settings.FTP_DIRETORIOS,
+        url_base=settings.FTP_BASE_URL,
+        tamanho=settings.FTP_POOL_TAMANHO,
+        timeout=settings.FTP_TIMEOUT,
+        ocioso_max=settings.FTP_POOL_OCIOSO,
+        espera=settings.FTP_POOL_ESPERA,
+    )
+
+
+def get_pool():
+    """Pool do processo atual (recriado após fork do worker: sockets não são compartilhados)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        _pool = _criar_pool()
+        _pool_pid = pid
+    return _pool
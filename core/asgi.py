@@ -2,12 +2,16 @@ import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.core.asgi import get_asgi_application
-import manifesto.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+# Carrega o Django antes de importar os consumers (eles usam models/simplejwt)
+django_asgi_app = get_asgi_application()
+
+import manifesto.routing
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             manifesto.routing.websocket_urlpatterns
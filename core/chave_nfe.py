@@ -0,0 +1,89 @@
+# core/chave_nfe.py
+"""
+Decodificação local da chave de acesso da NF-e (44 dígitos), sem consulta à ESL.
+
+Layout: cUF(2) AAMM(4) CNPJ(14) modelo(2) série(3) número(9) tpEmis(1) código(8) DV(1).
+O DV é o módulo 11 dos 43 primeiros dígitos, pesos 2..9 da direita para a esquerda.
+"""
+from collections import namedtuple
+
+TAMANHO = 44
+
+CODIGOS_UF = {
+    '11', '12', '13', '14', '15', '16', '17',
+    '21', '22', '23', '24', '25', '26', '27', '28', '29',
+    '31', '32', '33', '35',
+    '41', '42', '43',
+    '50', '51', '52', '53',
+}
+MODELOS = {'55', '65'}  # NF-e e NFC-e
+# Só 0-9 ASCII: str.isdigit aceita '٣', '³' etc., que quebrariam `calcular_dv` e os int() dos campos
+DIGITOS = frozenset('0123456789')
+
+# Pesos da esquerda para a direita (o último dígito antes do DV leva peso 2)
+_PESOS = tuple(2 + (i % 8) for i in range(TAMANHO - 1))[::-1]
+# Dígitos ASCII: valor = byte - 48, então Σ(byte·peso) - 48·Σpeso dá a soma sem converter dígito a dígito
+_AJUSTE_ASCII = 48 * sum(_PESOS)
+
+ChaveNFe = namedtuple(
+    'ChaveNFe',
+    'chave uf ano mes cnpj modelo serie numero tipo_emissao codigo dv',
+)
+
+
+def limpar(valor):
+    """Só os dígitos (aceita chave digitada com espaços, pontos ou lida do código de barras)."""
+    return ''.join(c for c in str(valor or '') if c in DIGITOS)
+
+
+def calcular_dv(primeiros_43):
+    soma = sum(map(int.__mul__, primeiros_43.encode(), _PESOS)) - _AJUSTE_ASCII
+    resto = soma % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def motivo_invalida(chave):
+    """Mensagem curta com o problema da chave, ou None se ela é válida."""
+    if not chave or len(chave) != TAMANHO or not DIGITOS.issuperset(chave):
+        return "A chave deve ter 44 dígitos."
+    if chave[:2] not in CODIGOS_UF:
+        return "UF da chave não existe."
+    if not 1 <= int(chave[4:6]) <= 12:
+        return "Mês de emissão da chave inválido."
+    if chave[20:22] not in MODELOS:
+        return "A chave não é de NF-e (modelo 55/65)."
+    if calcular_dv(chave[:43]) != int(chave[43]):
+        return "Dígito verificador não confere (chave digitada errada?)."
+    return None
+
+
+def _montar(chave):
+    return ChaveNFe(
+        chave=chave,
+        uf=chave[:2],
+        ano=2000 + int(chave[2:4]),
+        mes=int(chave[4:6]),
+        cnpj=chave[6:20],
+        modelo=chave[20:22],
+        serie=int(chave[22:25]),
+        numero=int(chave[25:34]),
+        tipo_emissao=chave[34],
+        codigo=chave[35:43],
+        dv=int(chave[43]),
+    )
+
+
+def decodificar(chave):
+    """ChaveNFe com os campos da chave, ou None se ela for inválida."""
+    chave = limpar(chave)
+    if motivo_invalida(chave):
+        return None
+    return _montar(chave)
+
+
+def decodificar_lote(chaves):
+    """
+    {chave: ChaveNFe ou None} para uma lista de chaves.
+    Deduplica antes de validar, então chaves repetidas (mesma nota em várias páginas) custam uma vez.
+    """
+    return {chave: decodificar(chave) for chave in set(chaves)}
@@ -0,0 +1,129 @@
+# core/esl/cache.py
+"""
+Cache no Redis das consultas aos relatórios analíticos da ESL (2972 e 9873).
+
+A chave é o id do relatório + o payload de busca normalizado, então a mesma
+nota/manifesto consultado de novo (re-sync, nova busca) não gasta chamada na ESL.
+Resultados vazios também são guardados ("não encontrado"), com TTL menor.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+
+import redis
+from django.conf import settings
+
+from core.esl import cliente as esl
+from core.redis_cliente import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHAVE_ESTATISTICAS = "esl:cache:estatisticas"
+
+
+def _normalizar(valor):
+    # 123, "123" e " 123 " geram a mesma chave; ordem das chaves do dict não importa
+    if isinstance(valor, dict):
+        return {str(k): _normalizar(v) for k, v in sorted(valor.items())}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(v) for v in valor]
+    if valor is None:
+        return None
+    return str(valor).strip()
+
+
+def chave_cache(relatorio_id, search, page=1, per=100):
+    normalizado = _normalizar({"search": search, "page": page, "per": per})
+    digest = hashlib.sha1(json.dumps(normalizado, sort_keys=True).encode()).hexdigest()
+    return f"esl:cache:relatorio:{relatorio_id}:{digest}"
+
+
+def _contar(relatorio_id, evento):
+    try:
+        get_redis().hincrby(CHAVE_ESTATISTICAS, f"{relatorio_id}:{evento}", 1)
+    except redis.RedisError:
+        pass
+
+
+def _ler(relatorio_id, chave):
+    """Dados em cache (lista) ou None se não houver / Redis fora."""
+    try:
+        em_cache = get_redis().get(chave)
+    except redis.RedisError as e:
+        logger.warning(f"⚠️ Cache ESL indisponível ({e}). Consultando direto.")
+        em_cache = None
+    if em_cache is None:
+        _contar(relatorio_id, 'miss')
+        return None
+    dados = json.loads(em_cache)
+    _contar(relatorio_id, 'hit' if dados else 'hit_negativo')
+    return dados
+
+
+def _gravar(relatorio_id, chave, dados):
+    ttl = settings.ESL_CACHE_TTL.get(relatorio_id) if dados else settings.ESL_CACHE_TTL_NEGATIVO
+    if ttl:
+        try:
+            get_redis().set(chave, json.dumps(dados), ex=ttl)
+        except redis.RedisError:
+            pass
+
+
+def consultar_relatorio_cache(relatorio_id, search, page=1, per=100, usar_cache=True):
+    """
+    Igual a `cliente.consultar_relatorio`, mas devolve os dados já decodificados
+    (lista de registros) e passa pelo cache.
+    Levanta `requests.HTTPError` se a ESL responder com erro (erros não entram no cache).
+    """
+    chave = chave_cache(relatorio_id, search, page, per)
+
+    if usar_cache:
+        dados = _ler(relatorio_id, chave)
+        if dados is not None:
+            return dados
+
+    response = esl.consultar_relatorio(relatorio_id, search, page=page, per=per)
+    response.raise_for_status()
+    dados = response.json() or []
+    _gravar(relatorio_id, chave, dados)
+    return dados
+
+
+async def consultar_relatorio_cache_async(cliente, relatorio_id, search, page=1, per=100, usar_cache=True):
+    """
+    Mesmo cache, para o pipeline assíncrono (`cliente` é um `ClienteESLAsync`).
+    Levanta `httpx.HTTPStatusError` se a ESL responder com erro.
+    """
+    chave = chave_cache(relatorio_id, search, page, per)
+
+    if usar_cache:
+        dados = await asyncio.to_thread(_ler, relatorio_id, chave)
+        if dados is not None:
+            return dados
+
+    response = await cliente.consultar_relatorio(relatorio_id, search, page=page, per=per)
+    response.raise_for_status()
+    dados = response.json() or []
+    await asyncio.to_thread(_gravar, relatorio_id, chave, dados)
+    return dados
+
+
+def invalidar(relatorio_id, search, page=1, per=100):
+    try:
+        get_redis().delete(chave_cache(relatorio_id, search, page, per))
+    except redis.RedisError:
+        pass
+
+
+def estatisticas():
+    """Contadores acumulados: {relatorio_id: {'hit': n, 'hit_negativo': n, 'miss': n}}."""
+    try:
+        brutos = get_redis().hgetall(CHAVE_ESTATISTICAS)
+    except redis.RedisError:
+        return {}
+    resultado = {}
+    for campo, total in brutos.items():
+        relatorio_id, evento = campo.decode().split(':', 1)
+        resultado.setdefault(relatorio_id, {})[evento] = int(total)
+    return resultado
@@ -0,0 +1,158 @@
+# core/esl/cliente.py
+"""
+Cliente HTTP único para a ESL Cloud.
+
+Todas as chamadas ao TMS passam por aqui. Cada processo (worker Celery, gunicorn)
+mantém uma única `requests.Session` com pool keep-alive, então o handshake
+TCP+TLS é pago uma vez por processo e não uma vez por nota.
+"""
+import json
+import os
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+from core.esl import disjuntor, limitador
+from core.esl.limitador import LimiteESLExcedido
+
+logger = logging.getLogger(__name__)
+
+_sessao = None
+_sessao_pid = None
+
+
+def _criar_sessao():
+    retry = Retry(
+        total=settings.ESL_RETRIES,
+        connect=settings.ESL_RETRIES,
+        read=settings.ESL_RETRIES,
+        status=settings.ESL_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        # POST não é idempotente: só repete quando a conexão nem chegou a ser feita
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.ESL_POOL_CONEXOES,
+        pool_maxsize=settings.ESL_POOL_CONEXOES,
+        max_retries=retry,
+    )
+    sessao = requests.Session()
+    sessao.mount('https://', adapter)
+    sessao.mount('http://', adapter)
+    return sessao
+
+
+def get_sessao():
+    """Retorna a sessão do processo atual (recriada após fork do worker)."""
+    global _sessao, _sessao_pid
+    pid = os.getpid()
+    if _sessao is None or _sessao_pid != pid:
+        _sessao = _criar_sessao()
+        _sessao_pid = pid
+    return _sessao
+
+
+def _token(endpoint):
+    if endpoint == 'relatorio':
+        return settings.ESL_TOKEN_RELATORIOS
+    return settings.ESL_TOKEN_API
+
+
+def _retry_after(response):
+    """Segundos pedidos no header Retry-After (número ou data HTTP), ou None."""
+    valor = response.headers.get('Retry-After')
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def avaliar_resposta(endpoint, token, status_code, duracao, retry_after=None):
+    """
+    Alimenta o disjuntor com o resultado da chamada e trata o 429 da ESL:
+    pausa o bucket do endpoint para todos e levanta LimiteESLExcedido com a espera pedida.
+    """
+    if status_code == 429:
+        disjuntor.registrar(endpoint, falhou=False)  # a ESL está de pé, só pediu calma
+        raise LimiteESLExcedido(endpoint, limitador.pausar(endpoint, token, retry_after))
+
+    falhou = status_code >= 500 or duracao > settings.ESL_DISJUNTOR['lentidao']
+    disjuntor.registrar(endpoint, falhou)
+
+
+def requisitar(endpoint, method, path, headers=None, espera_maxima=None, **kwargs):
+    """
+    Ponto único de saída para a ESL.
+    `endpoint` escolhe token, timeout e bucket de limite ('relatorio', 'ocorrencias', 'graphql').
+    Retorna o `requests.Response`; o tratamento do status fica com quem chamou.
+    Levanta `limitador.LimiteESLExcedido` se o orçamento global exigir esperar mais que `espera_maxima`
+    ou se a ESL responder 429, e `disjuntor.ESLIndisponivel` (subclasse) com o disjuntor aberto.
+    """
+    token = _token(endpoint)
+    disjuntor.verificar(endpoint)
+    limitador.aguardar_vez(endpoint, token, espera_maxima)
+
+    headers_finais = {"Authorization": f"Bearer {token}"}
+    if headers:
+        headers_finais.update(headers)
+    kwargs.setdefault('timeout', settings.ESL_TIMEOUTS[endpoint])
+
+    url = f"{settings.ESL_BASE_URL}{path}"
+    inicio = time.monotonic()
+    try:
+        response = get_sessao().request(method, url, headers=headers_finais, **kwargs)
+    except requests.RequestException:
+        disjuntor.registrar(endpoint, falhou=True)
+        raise
+
+    avaliar_resposta(endpoint, token, response.status_code, time.monotonic() - inicio, _retry_after(response))
+    return response
+
+
+# =====================================================
+# ENDPOINTS
+# =====================================================
+
+def consultar_relatorio(relatorio_id, search, page=1, per=100):
+    """Relatórios analíticos (2972 = manifestos, 9873 = notas). A ESL exige GET com corpo JSON."""
+    payload = {"search": search, "page": str(page), "per": str(per)}
+    return requisitar(
+        'relatorio', 'GET', f"/api/analytics/reports/{relatorio_id}/data",
+        headers={"Content-Type": "application/json"},
+        data=json.dumps(payload),
+    )
+
+
+def listar_ocorrencias(params):
+    return requisitar('ocorrencias', 'GET', "/api/invoice_occurrences", params=params)
+
+
+def enviar_ocorrencia(payload):
+    return requisitar(
+        'ocorrencias', 'POST', "/api/invoice_occurrences",
+        headers={"Content-Type": "application/json"},
+        json=payload,
+    )
+
+
+def graphql(query, variables):
+    return requisitar(
+        'graphql', 'POST', "/graphql",
+        headers={"Content-Type": "application/json"},
+        json={"query": query, "variables": variables},
+    )
@@ -0,0 +1,98 @@
+# core/esl/cliente_async.py
+"""
+Cliente assíncrono (httpx) para a ESL Cloud.
+
+Usado pelo pipeline de sincronização em asyncio: um único `httpx.AsyncClient`
+com pool keep-alive é compartilhado por todas as corrotinas do event loop,
+e cada requisição passa pelo mesmo bucket global do Redis que o cliente síncrono.
+"""
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+from django.conf import settings
+
+from core.esl import disjuntor, limitador
+from core.esl.cliente import _retry_after, _token, avaliar_resposta
+
+logger = logging.getLogger(__name__)
+
+
+class ClienteESLAsync:
+    """
+    Uso:
+        async with ClienteESLAsync() as cliente:
+            resposta = await cliente.listar_ocorrencias({...})
+    """
+
+    def __init__(self, max_conexoes=None, espera_maxima=None):
+        self.max_conexoes = max_conexoes or settings.ESL_ASYNC_MAX_CONEXOES
+        self.espera_maxima = espera_maxima
+        self._http = None
+        # Requisições em voo por endpoint limitadas à rajada do bucket: a fila fica aqui
+        # (de graça, no loop) e não em reservas longas no Redis
+        self._vagas = {}
+
+    def _vaga(self, endpoint):
+        if endpoint not in self._vagas:
+            limite = settings.ESL_LIMITES.get(endpoint) or {}
+            self._vagas[endpoint] = asyncio.Semaphore(max(int(limite.get('rajada', self.max_conexoes)), 1))
+        return self._vagas[endpoint]
+
+    async def __aenter__(self):
+        self._http = httpx.AsyncClient(
+            base_url=settings.ESL_BASE_URL,
+            limits=httpx.Limits(
+                max_connections=self.max_conexoes,
+                max_keepalive_connections=self.max_conexoes,
+            ),
+            # Só repete falhas de conexão; status 5xx fica com quem chamou
+            transport=httpx.AsyncHTTPTransport(retries=settings.ESL_RETRIES),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._http.aclose()
+        self._http = None
+
+    async def requisitar(self, endpoint, method, path, headers=None, **kwargs):
+        """Mesmo contrato de `cliente.requisitar`, retornando um `httpx.Response`."""
+        token = _token(endpoint)
+        headers_finais = {"Authorization": f"Bearer {token}"}
+        if headers:
+            headers_finais.update(headers)
+        conexao, leitura = settings.ESL_TIMEOUTS[endpoint]
+        kwargs.setdefault('timeout', httpx.Timeout(leitura, connect=conexao))
+
+        await asyncio.to_thread(disjuntor.verificar, endpoint)
+        async with self._vaga(endpoint):
+            await limitador.aguardar_vez_async(endpoint, token, self.espera_maxima)
+            inicio = time.monotonic()
+            try:
+                response = await self._http.request(method, path, headers=headers_finais, **kwargs)
+            except httpx.TransportError:
+                await asyncio.to_thread(disjuntor.registrar, endpoint, True)
+                raise
+
+        await asyncio.to_thread(
+            avaliar_resposta, endpoint, token, response.status_code,
+            time.monotonic() - inicio, _retry_after(response),
+        )
+        return response
+
+    # =====================================================
+    # ENDPOINTS
+    # =====================================================
+
+    async def consultar_relatorio(self, relatorio_id, search, page=1, per=100):
+        payload = {"search": search, "page": str(page), "per": str(per)}
+        return await self.requisitar(
+            'relatorio', 'GET', f"/api/analytics/reports/{relatorio_id}/data",
+            headers={"Content-Type": "application/json"},
+            content=json.dumps(payload),
+        )
+
+    async def listar_ocorrencias(self, params):
+        return await self.requisitar('ocorrencias', 'GET', "/api/invoice_occurrences", params=params)
@@ -0,0 +1,168 @@
+# core/esl/disjuntor.py
+"""
+Disjuntor (circuit breaker) por endpoint da ESL, com estado no Redis.
+
+- fechado:     chamadas passam; falhas/lentidão são contadas numa janela de tempo.
+- aberto:      a taxa de falha passou do limite; ninguém chama a ESL até `aberto_ate`
+               (falha rápida com ESLIndisponivel, que as tasks tratam como adiamento).
+- meio_aberto: terminado o tempo aberto, um único worker faz a sonda. Sucesso fecha o
+               disjuntor; falha reabre com tempo dobrado (até ESL_DISJUNTOR_ABERTO_MAXIMO).
+
+Todos os workers enxergam o mesmo estado, então uma queda da ESL não deixa cada
+processo descobrir sozinho, esperando 30 s de timeout por chamada.
+"""
+import hashlib
+import logging
+
+import redis
+from django.conf import settings
+
+from core.esl.limitador import LimiteESLExcedido
+from core.redis_cliente import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Retorna {liberado (0/1), segundos até tentar de novo}
+_SCRIPT_VERIFICAR = """
+local t = redis.call('TIME')
+local agora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local sonda_timeout = tonumber(ARGV[1])
+local dados = redis.call('HMGET', KEYS[1], 'estado', 'aberto_ate', 'sonda_ate')
+local estado = dados[1] or 'fechado'
+if estado == 'fechado' then
+    return {1, '0'}
+end
+if estado == 'aberto' then
+    local aberto_ate = tonumber(dados[2]) or 0
+    if agora < aberto_ate then
+        return {0, tostring(aberto_ate - agora)}
+    end
+else
+    local sonda_ate = tonumber(dados[3]) or 0
+    if agora < sonda_ate then
+        return {0, tostring(sonda_ate - agora)}
+    end
+end
+-- Este chamador vira a sonda do meio_aberto (ou substitui uma sonda que não voltou)
+redis.call('HSET', KEYS[1], 'estado', 'meio_aberto', 'sonda_ate', tostring(agora + sonda_timeout))
+return {1, '0'}
+"""
+
+# ARGV: falhou (0/1), janela, minimo_chamadas, taxa_falha, tempo_aberto, tempo_aberto_maximo
+# Retorna o estado após o registro
+_SCRIPT_REGISTRAR = """
+local t = redis.call('TIME')
+local agora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local falhou = tonumber(ARGV[1])
+local janela = tonumber(ARGV[2])
+local minimo = tonumber(ARGV[3])
+local taxa_falha = tonumber(ARGV[4])
+local tempo_aberto = tonumber(ARGV[5])
+local tempo_maximo = tonumber(ARGV[6])
+
+local dados = redis.call('HMGET', KEYS[1], 'estado', 'inicio_janela', 'total', 'falhas', 'aberturas')
+local estado = dados[1] or 'fechado'
+local inicio = tonumber(dados[2]) or agora
+local total = tonumber(dados[3]) or 0
+local falhas = tonumber(dados[4]) or 0
+local aberturas = tonumber(dados[5]) or 0
+
+local function abrir()
+    local duracao = math.min(tempo_maximo, tempo_aberto * (2 ^ aberturas))
+    redis.call('HSET', KEYS[1], 'estado', 'aberto', 'aberto_ate', tostring(agora + duracao),
+               'aberturas', aberturas + 1, 'inicio_janela', tostring(agora), 'total', 0, 'falhas', 0)
+    return 'aberto'
+end
+
+if estado == 'meio_aberto' then
+    if falhou == 1 then
+        return abrir()
+    end
+    redis.call('HSET', KEYS[1], 'estado', 'fechado', 'aberturas', 0,
+               'inicio_janela', tostring(agora), 'total', 0, 'falhas', 0)
+    return 'fechado'
+end
+
+if estado == 'aberto' then
+    -- Resposta atrasada de antes da abertura: não muda nada
+    return 'aberto'
+end
+
+if agora - inicio > janela then
+    inicio, total, falhas = agora, 0, 0
+end
+total = total + 1
+falhas = falhas + falhou
+if total >= minimo and falhas / total >= taxa_falha then
+    return abrir()
+end
+redis.call('HSET', KEYS[1], 'estado', 'fechado', 'inicio_janela', tostring(inicio), 'total', total, 'falhas', falhas)
+redis.call('EXPIRE', KEYS[1], math.ceil(janela + tempo_maximo) + 60)
+return 'fechado'
+"""
+
+_scripts = {}
+
+
+class ESLIndisponivel(LimiteESLExcedido):
+    """
+    O disjuntor do endpoint está aberto. É um LimiteESLExcedido: quem já adia a task
+    com `countdown=e.espera` passa a esperar a ESL voltar sem mudar nada.
+    """
+
+    def __init__(self, endpoint, espera):
+        super().__init__(endpoint, espera)
+        self.args = (f"ESL indisponível em '{endpoint}' (disjuntor aberto). Tente novamente em {espera:.1f}s.",)
+
+
+def _chave(endpoint):
+    # Um disjuntor por ESL: outra base (ex.: a ESL falsa do benchmark) não abre o da produção
+    digest = hashlib.sha1(settings.ESL_BASE_URL.encode()).hexdigest()[:12]
+    return f"esl:disjuntor:{endpoint}:{digest}"
+
+
+def _script(nome, fonte):
+    if nome not in _scripts:
+        _scripts[nome] = get_redis().register_script(fonte)
+    return _scripts[nome]
+
+
+def verificar(endpoint):
+    """Levanta ESLIndisponivel se o disjuntor não deixa chamar o endpoint agora."""
+    config = settings.ESL_DISJUNTOR
+    try:
+        liberado, espera = _script('verificar', _SCRIPT_VERIFICAR)(
+            keys=[_chave(endpoint)],
+            args=[config['sonda_timeout']],
+        )
+    except redis.RedisError as e:
+        logger.warning(f"⚠️ Disjuntor ESL indisponível ({e}). Seguindo sem ele.")
+        return
+    if not int(liberado):
+        raise ESLIndisponivel(endpoint, float(espera))
+
+
+def registrar(endpoint, falhou):
+    """Conta o resultado de uma chamada (`falhou` inclui respostas lentas demais)."""
+    config = settings.ESL_DISJUNTOR
+    try:
+        estado = _script('registrar', _SCRIPT_REGISTRAR)(
+            keys=[_chave(endpoint)],
+            args=[
+                int(bool(falhou)), config['janela'], config['minimo_chamadas'],
+                config['taxa_falha'], config['tempo_aberto'], config['tempo_aberto_maximo'],
+            ],
+        )
+    except redis.RedisError:
+        return
+    if falhou and estado in (b'aberto', 'aberto'):
+        logger.error(f"🔌 Disjuntor da ESL aberto para '{endpoint}'. Chamadas suspensas temporariamente.")
+
+
+def estado(endpoint):
+    """Estado atual do disjuntor (para admin/diagnóstico)."""
+    try:
+        dados = get_redis().hgetall(_chave(endpoint))
+    except redis.RedisError:
+        return {}
+    return {k.decode(): v.decode() for k, v in dados.items()}
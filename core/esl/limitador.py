@@ -0,0 +1,148 @@
+# core/esl/limitador.py
+"""
+Limitador de taxa global da ESL (token bucket no Redis).
+
+O bucket é único por endpoint + token e compartilhado por todos os workers,
+então duas sincronizações em paralelo dividem o mesmo orçamento em vez de
+cada uma dormir o seu próprio `time.sleep`.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from core.redis_cliente import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Usa o relógio do Redis para que todos os workers enxerguem o mesmo "agora".
+# Funciona por reserva: se a espera cabe em `espera_maxima`, o token já fica reservado
+# (o saldo pode ficar negativo) e quem chamou só dorme até a sua vez, sem disputar de novo.
+# KEYS[2] guarda até quando a própria ESL pediu pausa (429/Retry-After): ninguém passa antes disso.
+# Retorna {reservou (0/1), segundos de espera}.
+_SCRIPT_TOKEN_BUCKET = """
+local taxa = tonumber(ARGV[1])
+local rajada = tonumber(ARGV[2])
+local espera_maxima = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local agora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local dados = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(dados[1]) or rajada
+local ts = tonumber(dados[2]) or agora
+tokens = math.min(rajada, tokens + math.max(0, agora - ts) * taxa)
+local espera = 0
+if tokens < 1 then
+    espera = (1 - tokens) / taxa
+end
+local pausa_ate = tonumber(redis.call('GET', KEYS[2]))
+if pausa_ate and pausa_ate - agora > espera then
+    espera = pausa_ate - agora
+end
+local reservou = 0
+if espera <= espera_maxima then
+    tokens = tokens - 1
+    reservou = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(agora))
+redis.call('EXPIRE', KEYS[1], math.ceil((rajada + espera_maxima * taxa) / taxa) + 60)
+return {reservou, tostring(espera)}
+"""
+
+_script = None
+
+
+class LimiteESLExcedido(Exception):
+    """O orçamento global do endpoint acabou; `espera` diz em quantos segundos tentar de novo."""
+
+    def __init__(self, endpoint, espera):
+        self.endpoint = endpoint
+        self.espera = espera
+        super().__init__(f"Limite da ESL atingido em '{endpoint}'. Tente novamente em {espera:.1f}s.")
+
+
+def _chave(endpoint, token, sufixo=''):
+    digest = hashlib.sha1(token.encode()).hexdigest()[:12]
+    return f"esl:limite:{endpoint}:{digest}{sufixo}"
+
+
+def reservar(endpoint, token, espera_maxima):
+    """
+    Reserva a próxima vaga do bucket se ela sair em até `espera_maxima` segundos.
+    Retorna (reservou, espera).
+    """
+    global _script
+    limite = settings.ESL_LIMITES.get(endpoint)
+    if not limite:
+        return True, 0
+
+    try:
+        if _script is None:
+            _script = get_redis().register_script(_SCRIPT_TOKEN_BUCKET)
+        reservou, espera = _script(
+            keys=[_chave(endpoint, token), _chave(endpoint, token, ':pausa')],
+            args=[limite['taxa'], limite['rajada'], espera_maxima],
+        )
+        return bool(int(reservou)), float(espera)
+    except redis.RedisError as e:
+        # Sem Redis não travamos a operação: segue sem limitar e registra
+        logger.warning(f"⚠️ Limitador ESL indisponível ({e}). Seguindo sem controle de taxa.")
+        return True, 0
+
+
+def aguardar_vez(endpoint, token, espera_maxima=None):
+    """
+    Espera apenas o que o orçamento global exige.
+    Se a vaga só sair depois de `espera_maxima`, levanta LimiteESLExcedido para a task se
+    reagendar (countdown) em vez de segurar o slot do worker dormindo.
+    """
+    if espera_maxima is None:
+        espera_maxima = settings.ESL_LIMITE_ESPERA_MAXIMA
+
+    reservou, espera = reservar(endpoint, token, espera_maxima)
+    if not reservou:
+        raise LimiteESLExcedido(endpoint, espera)
+    if espera > 0:
+        time.sleep(espera)
+
+
+def pausar(endpoint, token, retry_after=None):
+    """
+    A ESL respondeu 429: segura o bucket do endpoint para todos os workers.
+    Usa o Retry-After quando vier; sem ele, backoff exponencial pelos 429 seguidos
+    (ESL_BACKOFF_BASE * 2^n, até ESL_BACKOFF_MAXIMO). Retorna os segundos de pausa.
+    """
+    try:
+        cliente = get_redis()
+        seguidas = cliente.incr(_chave(endpoint, token, ':429'))
+        cliente.expire(_chave(endpoint, token, ':429'), int(settings.ESL_BACKOFF_MAXIMO * 2))
+
+        if retry_after is None:
+            retry_after = settings.ESL_BACKOFF_BASE * (2 ** (seguidas - 1))
+        segundos = min(float(retry_after), settings.ESL_BACKOFF_MAXIMO)
+
+        segundos_redis, micro = cliente.time()
+        ate = segundos_redis + micro / 1_000_000 + segundos
+        cliente.set(_chave(endpoint, token, ':pausa'), ate, ex=int(segundos) + 1)
+    except redis.RedisError:
+        segundos = float(retry_after or settings.ESL_BACKOFF_BASE)
+
+    logger.warning(f"🐢 ESL pediu pausa em '{endpoint}' (429). Segurando as chamadas por {segundos:.0f}s.")
+    return segundos
+
+
+async def aguardar_vez_async(endpoint, token, espera_maxima=None):
+    """
+    Versão para o event loop: mesma reserva no bucket global, mas a espera é um
+    `asyncio.sleep` (as outras corrotinas seguem rodando enquanto esta aguarda a vez).
+    """
+    if espera_maxima is None:
+        espera_maxima = settings.ESL_ASYNC_ESPERA_MAXIMA
+
+    reservou, espera = await asyncio.to_thread(reservar, endpoint, token, espera_maxima)
+    if not reservou:
+        raise LimiteESLExcedido(endpoint, espera)
+    if espera > 0:
+        await asyncio.sleep(espera)
@@ -0,0 +1,314 @@
+# core/esl/servidor_falso.py
+"""
+Servidor local que imita a ESL Cloud para medir a sincronização sem tocar a produção.
+
+Implementa os relatórios 2972 (manifestos) e 9873 (notas), /api/invoice_occurrences
+(paginação do manifesto por `start`, feed por `after_id`, ambos devolvendo `next_id`, e o POST
+das baixas) e o /graphql do manifestStartTransport (com aliases). Latência, taxa de erro 5xx
+e limite de requisições (429 com Retry-After) são configuráveis.
+
+Uso: `iniciar(gerar_fixture(notas_por_manifesto=200), latencia=0.05)` sobe o servidor numa
+thread e devolve o objeto com `.url`, `.contadores` e `.parar()`.
+Só biblioteca padrão: roda em qualquer máquina de desenvolvimento.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from core.chave_nfe import calcular_dv
+
+
+# =====================================================
+# FIXTURES
+# =====================================================
+
+def _chave(uf, ano, mes, cnpj, numero, codigo):
+    base = f"{uf}{ano % 100:02d}{mes:02d}{cnpj}55001{numero:09d}1{codigo:08d}"
+    return base + str(calcular_dv(base))
+
+
+def gerar_fixture(manifestos=1, notas_por_manifesto=50, cpf='00000000191', numero_inicial=None,
+                  data_servico=None, emissao=(2049, 12), semente=0):
+    """
+    Massa de dados coerente para o servidor: `manifestos` manifestos do motorista `cpf`,
+    cada um com `notas_por_manifesto` NF-e de chave válida emitidas no mês `emissao` (ano, mês).
+    O mês padrão fica longe de dados reais, então o cache do 9873 nunca mistura as duas coisas.
+    """
+    aleatorio = random.Random(semente)
+    numero_inicial = numero_inicial or aleatorio.randint(10 ** 8, 10 ** 9 - 1)
+    data_servico = data_servico or date.today()
+    ano, mes = emissao
+    cnpj = f"{aleatorio.randint(10 ** 7, 10 ** 8 - 1)}0001{aleatorio.randint(10, 99)}"
+
+    fixture = {'manifestos': [], 'notas': {}, 'eventos': []}
+    numero_nota = aleatorio.randint(1, 10 ** 6)
+    for i in range(manifestos):
+        sequence_code = numero_inicial + i
+        manifesto = {
+            'id': 500000 + sequence_code % 500000,
+            'sequence_code': sequence_code,
+            'service_date': data_servico.isoformat(),
+            'mft_mdr_iil_document': cpf,
+            'mft_crn_psn_nickname': 'FILIAL BENCHMARK',
+            'chaves': [],
+        }
+        for _ in range(notas_por_manifesto):
+            numero_nota += 1
+            chave = _chave('35', ano, mes, cnpj, numero_nota, aleatorio.randint(0, 10 ** 8 - 1))
+            manifesto['chaves'].append(chave)
+            fixture['notas'][chave] = {
+                'key': chave,
+                'number': str(numero_nota),
+                'issue_date': date(ano, mes, aleatorio.randint(1, 28)).isoformat(),
+                'issuer_document': cnpj,
+                'issuer_name': 'EMITENTE BENCHMARK LTDA',
+                'ioe_rpt_name': f'CLIENTE {numero_nota}',
+                'ioe_rpt_mds_line_1': f'RUA {aleatorio.randint(1, 999)}',
+                'ioe_rpt_mds_number': str(aleatorio.randint(1, 9999)),
+                'ioe_rpt_mds_neighborhood': 'CENTRO',
+            }
+            fixture['eventos'].append({
+                'id': len(fixture['eventos']) + 1,
+                'occurrence_at': f"{data_servico.isoformat()}T08:00:00.000Z",
+                'occurrence': {'code': 0},
+                'invoice': {'key': chave, 'number': str(numero_nota)},
+                'manifest': {'id': manifesto['id'], 'sequence_code': sequence_code},
+            })
+        fixture['manifestos'].append(manifesto)
+    return fixture
+
+
+# =====================================================
+# SERVIDOR
+# =====================================================
+
+def _janela(valor):
+    """'AAAA-MM-DD - AAAA-MM-DD' -> (inicio, fim) ou None."""
+    try:
+        inicio, fim = (datetime.strptime(p.strip(), '%Y-%m-%d').date() for p in str(valor).split(' - '))
+        return inicio, fim
+    except ValueError:
+        return None
+
+
+def _na_janela(valor_data, janela):
+    if not janela:
+        return True
+    dia = datetime.strptime(valor_data[:10], '%Y-%m-%d').date()
+    return janela[0] <= dia <= janela[1]
+
+
+def _paginar(registros, page, per):
+    inicio = (max(int(page), 1) - 1) * int(per)
+    return registros[inicio:inicio + int(per)]
+
+
+class ServidorESLFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, fixture, latencia=0.0, variacao=0.0, taxa_erro=0.0,
+                 limite_por_segundo=None, rajada=None, semente=None):
+        super().__init__(endereco, _Handler)
+        self.fixture = fixture
+        self.latencia = latencia
+        self.variacao = variacao
+        self.taxa_erro = taxa_erro
+        self.limite_por_segundo = limite_por_segundo
+        self.rajada = rajada or (limite_por_segundo or 1)
+        self.aleatorio = random.Random(semente)
+        self.contadores = Counter()
+        self.baixas_recebidas = []
+        self._buckets = {}
+        self._trava = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def zerar_contadores(self):
+        with self._trava:
+            self.contadores.clear()
+            self.baixas_recebidas.clear()
+
+    def total_chamadas(self):
+        return sum(v for k, v in self.contadores.items() if not k.startswith('status:'))
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+    # --- limites ---
+
+    def consumir_ficha(self, token):
+        """Token bucket por Authorization. Retorna 0 se passou ou os segundos até a próxima ficha."""
+        if not self.limite_por_segundo:
+            return 0
+        agora = time.monotonic()
+        with self._trava:
+            fichas, ultimo = self._buckets.get(token, (self.rajada, agora))
+            fichas = min(self.rajada, fichas + (agora - ultimo) * self.limite_por_segundo)
+            if fichas >= 1:
+                self._buckets[token] = (fichas - 1, agora)
+                return 0
+            self._buckets[token] = (fichas, agora)
+            return (1 - fichas) / self.limite_por_segundo
+
+    def sortear_erro(self):
+        with self._trava:
+            return self.taxa_erro and self.aleatorio.random() < self.taxa_erro
+
+    def contar(self, nome):
+        with self._trava:
+            self.contadores[nome] += 1
+
+    # --- rotas ---
+
+    def relatorio(self, relatorio_id, corpo):
+        search = corpo.get('search') or {}
+        page, per = corpo.get('page', 1), corpo.get('per', 100)
+
+        if relatorio_id == '2972':
+            filtro = search.get('manifests') or {}
+            janela = _janela(filtro.get('service_date'))
+            registros = [
+                {k: v for k, v in m.items() if k != 'chaves'}
+                for m in self.fixture['manifestos']
+                if (not filtro.get('sequence_code') or str(m['sequence_code']) == str(filtro['sequence_code']))
+                and _na_janela(m['service_date'], janela)
+            ]
+            return 200, _paginar(registros, page, per)
+
+        if relatorio_id == '9873':
+            filtro = search.get('invoices') or {}
+            janela = _janela(filtro.get('issue_date'))
+            numero = filtro.get('number')
+            emitente = filtro.get('issuer_document')
+            registros = [
+                nf for nf in self.fixture['notas'].values()
+                if (numero is None or str(int(nf['number'])) == str(numero)) and _na_janela(nf['issue_date'], janela)
+                and (emitente is None or nf['issuer_document'] == emitente)
+            ]
+            return 200, _paginar(registros, page, per)
+
+        return 404, {'error': 'report not found'}
+
+    def listar_ocorrencias(self, params):
+        per = int(params.get('per', 100))
+        manifest_id = params.get('manifest_id')
+        if manifest_id:
+            # Paginação do manifesto: `start` é a posição, `next_id` a próxima
+            eventos = [e for e in self.fixture['eventos'] if str(e['manifest']['id']) == str(manifest_id)]
+            inicio = int(params.get('start') or 0)
+            pagina = eventos[inicio:inicio + per]
+            proximo = inicio + per if inicio + per < len(eventos) else None
+        else:
+            # Feed: tudo depois de `after_id`
+            after_id = int(params.get('after_id') or 0)
+            restantes = [e for e in self.fixture['eventos'] if e['id'] > after_id]
+            pagina = restantes[:per]
+            proximo = pagina[-1]['id'] if len(restantes) > per else None
+        return 200, {'data': pagina, 'paging': {'next_id': proximo}}
+
+    def registrar_baixa(self, corpo):
+        with self._trava:
+            self.baixas_recebidas.append(corpo)
+            return 201, {'id': len(self.baixas_recebidas)}
+
+    def graphql(self, corpo):
+        query = corpo.get('query') or ''
+        aliases = re.findall(r'(\w+)\s*:\s*manifestStartTransport', query)
+        resultado = {'success': True, 'errors': []}
+        if aliases:
+            return 200, {'data': {alias: resultado for alias in aliases}}
+        if 'manifestStartTransport' in query:
+            return 200, {'data': {'manifestStartTransport': resultado}}
+        return 400, {'errors': [{'message': 'Unsupported operation'}]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ESLFalso/1.0"
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, status, corpo, headers=None):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+        self.server.contar(f"status:{status}")
+
+    def _corpo(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        if not tamanho:
+            return {}
+        try:
+            return json.loads(self.rfile.read(tamanho) or b'{}')
+        except ValueError:
+            return {}
+
+    def _atender(self, metodo):
+        servidor = self.server
+        url = urlparse(self.path)
+        corpo = self._corpo()
+
+        if url.path == '/__estatisticas':
+            return self._responder(200, dict(servidor.contadores))
+
+        espera = servidor.consumir_ficha(self.headers.get('Authorization', ''))
+        if espera:
+            return self._responder(429, {'error': 'Too Many Requests'}, {'Retry-After': str(math.ceil(espera))})
+
+        if servidor.latencia or servidor.variacao:
+            time.sleep(servidor.latencia + servidor.aleatorio.uniform(0, servidor.variacao))
+
+        relatorio = re.fullmatch(r'/api/analytics/reports/(\d+)/data', url.path)
+        if relatorio:
+            servidor.contar(f"relatorio:{relatorio.group(1)}")
+        elif url.path == '/api/invoice_occurrences':
+            servidor.contar(f"ocorrencias:{metodo}")
+        elif url.path == '/graphql':
+            servidor.contar('graphql')
+        else:
+            return self._responder(404, {'error': 'not found'})
+
+        if servidor.sortear_erro():
+            return self._responder(503, {'error': 'Service Unavailable (simulado)'})
+
+        if relatorio:
+            status, resposta = servidor.relatorio(relatorio.group(1), corpo)
+        elif url.path == '/api/invoice_occurrences' and metodo == 'GET':
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            status, resposta = servidor.listar_ocorrencias(params)
+        elif url.path == '/api/invoice_occurrences':
+            status, resposta = servidor.registrar_baixa(corpo)
+        else:
+            status, resposta = servidor.graphql(corpo)
+        self._responder(status, resposta)
+
+    def do_GET(self):
+        self._atender('GET')
+
+    def do_POST(self):
+        self._atender('POST')
+
+
+def iniciar(fixture, host='127.0.0.1', porta=0, **opcoes):
+    """Sobe o servidor numa thread daemon (porta 0 = livre qualquer) e o devolve já atendendo."""
+    servidor = ServidorESLFalso((host, porta), fixture, **opcoes)
+    servidor._thread = threading.Thread(target=servidor.serve_forever, name='esl-falso', daemon=True)
+    servidor._thread.start()
+    return servidor
@@ -0,0 +1,65 @@
+# core/imagens.py
+"""
+Normalização das fotos de comprovante antes de publicar.
+
+A foto do celular chega com vários MB, girada pela tag EXIF e com metadados (GPS, aparelho).
+Aqui ela é desvirada, perde os metadados, é limitada a COMPROVANTE_LADO_MAXIMO px no maior lado
+e recomprimida em COMPROVANTE_FORMATO (JPEG/WEBP); junto sai uma miniatura para as telas e e-mails.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+EXTENSOES = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+class ImagemInvalida(Exception):
+    """O arquivo não é uma imagem que o Pillow consiga abrir."""
+
+
+def _abrir(origem, lado):
+    try:
+        # Arquivo aberto é lido aos poucos pelo decodificador, sem carregar o original inteiro
+        imagem = Image.open(origem if hasattr(origem, 'read') else BytesIO(origem))
+        # JPEG: decodifica já reduzido (escala do DCT), bem mais rápido que abrir 12 MP e reduzir depois
+        imagem.draft('RGB', (lado, lado))
+        imagem.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise ImagemInvalida(str(e))
+    return imagem
+
+
+def _preparar(imagem, lado):
+    # Aplica a rotação do EXIF nos pixels (a tag some junto com os demais metadados)
+    imagem = ImageOps.exif_transpose(imagem)
+    if imagem.mode != 'RGB':
+        imagem = imagem.convert('RGB')
+    # thumbnail só reduz, mantendo a proporção
+    imagem.thumbnail((lado, lado), Image.LANCZOS)
+    return imagem
+
+
+def _codificar(imagem, formato, qualidade):
+    saida = BytesIO()
+    # Sem exif/icc_profile no save: nenhum metadado vai para o arquivo final
+    if formato == 'WEBP':
+        imagem.save(saida, 'WEBP', quality=qualidade, method=4)
+    else:
+        imagem.save(saida, 'JPEG', quality=qualidade, optimize=True, progressive=True)
+    return saida.getvalue()
+
+
+def normalizar_comprovante(origem):
+    """
+    Foto original (bytes ou arquivo aberto em modo binário) -> (foto normalizada, miniatura, extensão).
+    Levanta ImagemInvalida se o arquivo não for uma imagem.
+    """
+    formato = settings.COMPROVANTE_FORMATO
+    imagem = _preparar(_abrir(origem, settings.COMPROVANTE_LADO_MAXIMO), settings.COMPROVANTE_LADO_MAXIMO)
+    foto = _codificar(imagem, formato, settings.COMPROVANTE_QUALIDADE)
+
+    miniatura = imagem.copy()
+    miniatura.thumbnail((settings.COMPROVANTE_MINIATURA_LADO,) * 2, Image.LANCZOS)
+    miniatura = _codificar(miniatura, formato, settings.COMPROVANTE_MINIATURA_QUALIDADE)
+    return foto, miniatura, EXTENSOES[formato]
@@ -0,0 +1,13 @@
+# core/redis_cliente.py
+import redis
+from django.conf import settings
+
+_cliente = None
+
+
+def get_redis():
+    """Cliente Redis do processo. O pool do redis-py já se recria sozinho após fork."""
+    global _cliente
+    if _cliente is None:
+        _cliente = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=5, socket_connect_timeout=5)
+    return _cliente
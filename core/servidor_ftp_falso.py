@@ -0,0 +1,190 @@
+# core/servidor_ftp_falso.py
+"""
+Servidor FTP mínimo para testar o upload dos comprovantes sem o FTP de produção.
+
+Atende o que o ftplib usa no upload: USER/PASS, CWD/PWD, TYPE, PASV, STOR, NOOP e QUIT.
+Os arquivos ficam em memória (`.arquivos`). Dá para simular o custo do login (`latencia_login`),
+o servidor derrubando sessões paradas (`ocioso_max`) e STOR falhando (`taxa_erro`).
+
+Uso: `iniciar(diretorios={'public_html/uploads'})` sobe o servidor numa thread e devolve
+o objeto com `.porta`, `.contadores`, `.arquivos` e `.parar()`.
+Só biblioteca padrão: roda em qualquer máquina de desenvolvimento.
+"""
+import random
+import socket
+import socketserver
+import threading
+import time
+from collections import Counter
+
+
+class ServidorFTPFalso(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, endereco, usuario='teste', senha='teste', diretorios=None,
+                 latencia_login=0.0, ocioso_max=None, taxa_erro=0.0, semente=None):
+        super().__init__(endereco, _Handler)
+        self.usuario = usuario
+        self.senha = senha
+        # Pastas aceitas no CWD (None = qualquer uma)
+        self.diretorios = set(diretorios) if diretorios is not None else None
+        self.latencia_login = latencia_login
+        self.ocioso_max = ocioso_max
+        self.taxa_erro = taxa_erro
+        self.aleatorio = random.Random(semente)
+        self.contadores = Counter()
+        self.arquivos = {}
+        self._trava = threading.Lock()
+        self._thread = None
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def porta(self):
+        return self.server_address[1]
+
+    def contar(self, nome):
+        with self._trava:
+            self.contadores[nome] += 1
+
+    def sortear_erro(self):
+        with self._trava:
+            return self.taxa_erro and self.aleatorio.random() < self.taxa_erro
+
+    def guardar(self, caminho, dados):
+        with self._trava:
+            self.arquivos[caminho] = dados
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # Respostas curtas de controle: sem Nagle, senão cada comando paga o ACK atrasado (~40 ms)
+    disable_nagle_algorithm = True
+
+    def _responder(self, linha):
+        self.wfile.write(f"{linha}\r\n".encode())
+
+    def setup(self):
+        super().setup()
+        if self.server.ocioso_max:
+            # Como os servidores reais: sessão parada além do limite é derrubada
+            self.request.settimeout(self.server.ocioso_max)
+        self.usuario = None
+        self.logado = False
+        self.diretorio = '/'
+        self.passivo = None
+
+    def handle(self):
+        servidor = self.server
+        servidor.contar('conexoes')
+        self._responder("220 FTP falso pronto")
+        while True:
+            try:
+                linha = self.rfile.readline()
+            except (socket.timeout, OSError):
+                servidor.contar('derrubadas_por_ociosidade')
+                return
+            if not linha:
+                return
+            comando, _, argumento = linha.decode(errors='replace').strip().partition(' ')
+            comando = comando.upper()
+            metodo = getattr(self, f"cmd_{comando}", None)
+            if metodo is None:
+                self._responder(f"502 Comando {comando} não implementado")
+            elif comando not in ('USER', 'PASS', 'QUIT', 'NOOP') and not self.logado:
+                self._responder("530 Faça login primeiro")
+            elif metodo(argumento) is False:
+                return
+
+    def finish(self):
+        if self.passivo:
+            self.passivo.close()
+        super().finish()
+
+    # --- comandos ---
+
+    def cmd_USER(self, argumento):
+        self.usuario = argumento
+        self._responder("331 Informe a senha")
+
+    def cmd_PASS(self, argumento):
+        servidor = self.server
+        if servidor.latencia_login:
+            time.sleep(servidor.latencia_login)
+        if self.usuario == servidor.usuario and argumento == servidor.senha:
+            self.logado = True
+            servidor.contar('logins')
+            self._responder("230 Login efetuado")
+        else:
+            servidor.contar('logins_recusados')
+            self._responder("530 Usuário ou senha inválidos")
+
+    def cmd_CWD(self, argumento):
+        servidor = self.server
+        if servidor.diretorios is not None and argumento.strip('/') not in servidor.diretorios:
+            self._responder(f"550 {argumento}: pasta não existe")
+            return
+        self.diretorio = '/' + argumento.strip('/')
+        self._responder("250 Pasta alterada")
+
+    def cmd_PWD(self, argumento):
+        self._responder(f'257 "{self.diretorio}"')
+
+    def cmd_TYPE(self, argumento):
+        self._responder(f"200 Tipo {argumento}")
+
+    def cmd_NOOP(self, argumento):
+        self.server.contar('noop')
+        self._responder("200 OK")
+
+    def cmd_PASV(self, argumento):
+        if self.passivo:
+            self.passivo.close()
+        self.passivo = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.passivo.bind((self.server.host, 0))
+        self.passivo.listen(1)
+        host, porta = self.passivo.getsockname()
+        self._responder(f"227 Modo passivo ({host.replace('.', ',')},{porta >> 8},{porta & 0xFF})")
+
+    def cmd_STOR(self, argumento):
+        servidor = self.server
+        if not self.passivo:
+            self._responder("425 Use PASV antes")
+            return
+        self._responder("150 Enviando")
+        dados_conexao, _ = self.passivo.accept()
+        partes = []
+        with dados_conexao:
+            while True:
+                bloco = dados_conexao.recv(65536)
+                if not bloco:
+                    break
+                partes.append(bloco)
+        self.passivo.close()
+        self.passivo = None
+
+        if servidor.sortear_erro():
+            servidor.contar('stor_falhos')
+            self._responder("451 Falha local ao gravar (simulado)")
+            return
+        servidor.guardar(f"{self.diretorio.rstrip('/')}/{argumento}", b''.join(partes))
+        servidor.contar('stor')
+        self._responder("226 Arquivo recebido")
+
+    def cmd_QUIT(self, argumento):
+        self._responder("221 Até logo")
+        return False
+
+
+def iniciar(host='127.0.0.1', porta=0, **opcoes):
+    """Sobe o servidor numa thread daemon (porta 0 = livre qualquer) e o devolve já atendendo."""
+    servidor = ServidorFTPFalso((host, porta), **opcoes)
+    servidor._thread = threading.Thread(target=servidor.serve_forever, name='ftp-falso', daemon=True)
+    servidor._thread.start()
+    return servidor
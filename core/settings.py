@@ -107,6 +107,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+# HTTP + WebSocket (channels) servidos pelo daphne
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -138,22 +140,25 @@ DATABASES = {
     }
 }
 
-# O HOST geralmente é o próprio domínio ou o IP do servidor iSpot
-FTP_HOST = "st63136.ispot.cc"  
-
-# As credenciais que você forneceu
-FTP_USER = "st63136"
-FTP_PASS = "xh3!B8Wp"
-
-# A URL base onde as imagens ficarão visíveis na internet
-# Ajuste o caminho final conforme a pasta que você criar no FTP
-# settings.py
-FTP_HOST = "st63136.ispot.cc"
-FTP_USER = "st63136"
-FTP_PASS = "xh3!B8Wp"
-
+# Armazenamento dos comprovantes (FTP público; core/armazenamento.py)
+FTP_HOST = os.getenv('FTP_HOST', "st63136.ispot.cc")
+FTP_PORTA = int(os.getenv('FTP_PORTA', 21))
+FTP_USER = os.getenv('FTP_USER', "st63136")
+FTP_PASS = os.getenv('FTP_PASS', "xh3!B8Wp")
+# Pastas tentadas em ordem depois do login (alguns servidores já logam direto na public_html)
+FTP_DIRETORIOS = [d for d in os.getenv(
+    'FTP_DIRETORIOS',
+    'domains/st63136.ispot.cc/public_html/uploads/comprovantes-quickdelivery,'
+    'public_html/uploads/comprovantes-quickdelivery'
+).split(',') if d]
 # URL pública para o motorista visualizar no histórico depois
-FTP_BASE_URL = "https://st63136.ispot.cc/uploads/comprovantes-quickdelivery/"
+FTP_BASE_URL = os.getenv('FTP_BASE_URL', "https://st63136.ispot.cc/uploads/comprovantes-quickdelivery/")
+FTP_TIMEOUT = int(os.getenv('FTP_TIMEOUT', 30))
+# Sessões logadas por processo (= uploads simultâneos) e quanto esperar por uma livre (s)
+FTP_POOL_TAMANHO = int(os.getenv('FTP_POOL_TAMANHO', 4))
+FTP_POOL_ESPERA = int(os.getenv('FTP_POOL_ESPERA', 60))
+# Sessão parada há mais que isso leva um NOOP antes de ser usada (s)
+FTP_POOL_OCIOSO = int(os.getenv('FTP_POOL_OCIOSO', 30))
 
 
 # Password validation
@@ -199,6 +204,163 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
 
+
+# --- Integração ESL Cloud (TMS) ---
+ESL_BASE_URL = os.getenv('ESL_BASE_URL', 'https://quickdelivery.eslcloud.com.br')
+# Token dos relatórios analíticos (2972, 9873)
+ESL_TOKEN_RELATORIOS = os.getenv('ESL_TOKEN_RELATORIOS', 'zyUq31Mq6gMcYGzV4zL7HTsdnS7pULjaQoxGbkPZ1cLDoxT3d-Xukw')
+# Token da API REST (invoice_occurrences) e do GraphQL
+ESL_TOKEN_API = os.getenv('ESL_TOKEN_API', 'jziCXNF8xTasaEGJGxysrTFXtDRUmdobh9HCGHiwmEzaENWLiaddLA')
+
+# Timeouts (conexão, leitura) em segundos por endpoint
+ESL_TIMEOUTS = {
+    'relatorio': (5, 30),
+    'ocorrencias': (5, 30),
+    'graphql': (5, 30),
+}
+# Pool de conexões keep-alive mantido por processo (worker Celery / gunicorn)
+ESL_POOL_CONEXOES = int(os.getenv('ESL_POOL_CONEXOES', 10))
+# Retries de transporte (conexão recusada, 502/503/504). POST só repete falha de conexão.
+ESL_RETRIES = int(os.getenv('ESL_RETRIES', 3))
+
+# Redis compartilhado por todos os workers (limitador, cache, travas)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/1')
+
+# Token bucket global por endpoint + token: `taxa` requisições/segundo, `rajada` = capacidade
+ESL_LIMITES = {
+    'relatorio': {'taxa': 0.5, 'rajada': 2},
+    'ocorrencias': {'taxa': 0.5, 'rajada': 2},
+    'graphql': {'taxa': 1, 'rajada': 5},
+}
+# Esperas maiores que isso não seguram o worker: a task é reagendada (LimiteESLExcedido)
+ESL_LIMITE_ESPERA_MAXIMA = float(os.getenv('ESL_LIMITE_ESPERA_MAXIMA', 3))
+# 429 sem Retry-After: pausa de ESL_BACKOFF_BASE * 2^n segundos pelos 429 seguidos (teto ESL_BACKOFF_MAXIMO)
+ESL_BACKOFF_BASE = float(os.getenv('ESL_BACKOFF_BASE', 5))
+ESL_BACKOFF_MAXIMO = float(os.getenv('ESL_BACKOFF_MAXIMO', 300))
+# Quantas vezes uma task pode se adiar por limite/ESL fora do ar antes de desistir
+ESL_MAX_ADIAMENTOS = int(os.getenv('ESL_MAX_ADIAMENTOS', 50))
+
+# Disjuntor por endpoint (estado no Redis, compartilhado por todos os workers).
+# Abre quando, numa janela de `janela` s com ao menos `minimo_chamadas`, a fração de falhas
+# (erro de conexão, timeout, 5xx ou resposta mais lenta que `lentidao` s) passa de `taxa_falha`.
+# Fica aberto `tempo_aberto` s (dobrando a cada reabertura até `tempo_aberto_maximo`) e depois
+# libera uma única sonda, que tem `sonda_timeout` s para voltar.
+ESL_DISJUNTOR = {
+    'janela': int(os.getenv('ESL_DISJUNTOR_JANELA', 60)),
+    'minimo_chamadas': int(os.getenv('ESL_DISJUNTOR_MINIMO_CHAMADAS', 5)),
+    'taxa_falha': float(os.getenv('ESL_DISJUNTOR_TAXA_FALHA', 0.5)),
+    'lentidao': float(os.getenv('ESL_DISJUNTOR_LENTIDAO', 10)),
+    'tempo_aberto': int(os.getenv('ESL_DISJUNTOR_TEMPO_ABERTO', 30)),
+    'tempo_aberto_maximo': int(os.getenv('ESL_DISJUNTOR_TEMPO_ABERTO_MAXIMO', 600)),
+    'sonda_timeout': int(os.getenv('ESL_DISJUNTOR_SONDA_TIMEOUT', 40)),
+}
+
+# Cache das consultas aos relatórios analíticos (segundos) por id de relatório
+ESL_CACHE_TTL = {
+    2972: int(os.getenv('ESL_CACHE_TTL_2972', 300)),        # cabeçalho do manifesto
+    9873: int(os.getenv('ESL_CACHE_TTL_9873', 6 * 3600)),   # detalhes da NF-e
+}
+# Resultado vazio ("não encontrado") fica em cache por menos tempo
+ESL_CACHE_TTL_NEGATIVO = int(os.getenv('ESL_CACHE_TTL_NEGATIVO', 120))
+
+# Enriquecimento das notas no relatório 9873:
+# 'lote' agrupa as notas por mês de emissão e CNPJ do emitente (tirados da chave) e pagina o
+# relatório daquele emitente com per=100 (no máximo uma página para cada duas notas do grupo);
+# 'individual' faz uma consulta por nota (comportamento antigo)
+ESL_ENRIQUECIMENTO_MODO = os.getenv('ESL_ENRIQUECIMENTO_MODO', 'lote')
+ESL_ENRIQUECIMENTO_LOTE_POR_PAGINA = 100
+# Teto de páginas por emitente/mês; o que não for achado cai na consulta individual
+ESL_ENRIQUECIMENTO_LOTE_MAX_PAGINAS = int(os.getenv('ESL_ENRIQUECIMENTO_LOTE_MAX_PAGINAS', 10))
+# Grupos (emitente/mês) com menos notas que isso são consultados nota a nota (sai mais barato)
+ESL_ENRIQUECIMENTO_LOTE_MINIMO = int(os.getenv('ESL_ENRIQUECIMENTO_LOTE_MINIMO', 3))
+# Cadastro de NF-e (manifesto.NFe): registro atualizado há mais que isso volta à ESL (dias; 0 = não expira).
+# Registros com os textos padrão ("dados não repassados") sempre voltam.
+ESL_NFE_CADASTRO_VALIDADE = int(os.getenv('ESL_NFE_CADASTRO_VALIDADE', 30))
+
+# Pipeline da sincronização: as notas são divididas em blocos enriquecidos em paralelo (group/chord).
+# O paralelismo acompanha a rajada do bucket dos relatórios para não brigar pelo mesmo orçamento.
+ESL_SYNC_TAMANHO_BLOCO = int(os.getenv('ESL_SYNC_TAMANHO_BLOCO', 25))
+ESL_SYNC_MAX_PARALELO = int(os.getenv('ESL_SYNC_MAX_PARALELO', ESL_LIMITES['relatorio']['rajada']))
+# Quantas vezes um bloco pode se reagendar por falta de orçamento antes de desistir
+ESL_SYNC_MAX_REAGENDAMENTOS = int(os.getenv('ESL_SYNC_MAX_REAGENDAMENTOS', ESL_MAX_ADIAMENTOS))
+# Single-flight: uma sincronização por número de manifesto. A trava expira sozinha
+# depois disso se o worker morrer no meio (segundos)
+ESL_SYNC_TRAVA_TTL = int(os.getenv('ESL_SYNC_TRAVA_TTL', 15 * 60))
+# Manifesto sincronizado há menos que isso é servido com os dados locais (minutos; 0 desliga)
+ESL_SYNC_JANELA_FRESCOR = int(os.getenv('ESL_SYNC_JANELA_FRESCOR', 5))
+
+# Fila de saída das baixas (IntegracaoBaixaESL), drenada pelo beat em lotes
+ESL_OUTBOX_LOTE = int(os.getenv('ESL_OUTBOX_LOTE', 50))
+# Envios simultâneos por lote (mesma sessão/pool HTTP); acompanha a rajada do bucket de ocorrências
+ESL_OUTBOX_CONCORRENCIA = int(os.getenv('ESL_OUTBOX_CONCORRENCIA', ESL_LIMITES['ocorrencias']['rajada']))
+# Falhas 5xx/conexão reagendam em ESL_OUTBOX_BACKOFF * 2^(tentativa-1) s até o máximo de tentativas
+ESL_OUTBOX_MAX_TENTATIVAS = int(os.getenv('ESL_OUTBOX_MAX_TENTATIVAS', 6))
+ESL_OUTBOX_BACKOFF = int(os.getenv('ESL_OUTBOX_BACKOFF', 60))
+# Item reservado há mais que isso (drenador morreu no meio) volta para a fila
+ESL_OUTBOX_RESERVA_EXPIRA = int(os.getenv('ESL_OUTBOX_RESERVA_EXPIRA', 10 * 60))
+
+# Fotos recebidas em streaming (core/uploads.py): acima disso o upload é interrompido (bytes)
+COMPROVANTE_TAMANHO_MAXIMO = int(os.getenv('COMPROVANTE_TAMANHO_MAXIMO', 15 * 1024 * 1024))
+
+# Normalização da foto do comprovante antes do upload (core/imagens.py)
+COMPROVANTE_FORMATO = os.getenv('COMPROVANTE_FORMATO', 'JPEG').upper()  # JPEG ou WEBP
+COMPROVANTE_LADO_MAXIMO = int(os.getenv('COMPROVANTE_LADO_MAXIMO', 1600))
+COMPROVANTE_QUALIDADE = int(os.getenv('COMPROVANTE_QUALIDADE', 72))
+COMPROVANTE_MINIATURA_LADO = int(os.getenv('COMPROVANTE_MINIATURA_LADO', 320))
+COMPROVANTE_MINIATURA_QUALIDADE = int(os.getenv('COMPROVANTE_MINIATURA_QUALIDADE', 60))
+
+# Upload da foto do comprovante (enviar_comprovante_task): tentativas com backoff de BACKOFF * 2^n s
+COMPROVANTE_UPLOAD_MAX_TENTATIVAS = int(os.getenv('COMPROVANTE_UPLOAD_MAX_TENTATIVAS', 5))
+COMPROVANTE_UPLOAD_BACKOFF = int(os.getenv('COMPROVANTE_UPLOAD_BACKOFF', 30))
+# Baixa esperando a foto há mais que isso tem o upload redisparado pelo drenador da fila (segundos)
+COMPROVANTE_UPLOAD_EXPIRA = int(os.getenv('COMPROVANTE_UPLOAD_EXPIRA', 15 * 60))
+
+# Feed de ocorrências (invoice_occurrences via after_id) -> HistoricoOcorrencia
+ESL_FEED_POR_PAGINA = int(os.getenv('ESL_FEED_POR_PAGINA', 100))
+# Páginas lidas por execução do beat (o resto fica para a próxima, o cursor guarda a posição)
+ESL_FEED_MAX_PAGINAS = int(os.getenv('ESL_FEED_MAX_PAGINAS', 20))
+# Eventos de chaves ainda sem nota local ficam guardados até a nota chegar (dias)
+ESL_FEED_PENDENTES_DIAS = int(os.getenv('ESL_FEED_PENDENTES_DIAS', 30))
+
+# Tarefas recorrentes. O DatabaseScheduler (django_celery_beat) copia estas entradas para o banco
+# ao subir o beat; intervalos podem ser ajustados depois pelo admin.
+CELERY_BEAT_SCHEDULE = {
+    # Janela de coleta da fila de baixas: o que chegar nesse intervalo sai no mesmo lote
+    'drenar-integracoes-esl': {
+        'task': 'manifesto.tasks.drenar_integracoes_esl_task',
+        'schedule': float(os.getenv('ESL_OUTBOX_INTERVALO', 15)),
+    },
+    'ingerir-ocorrencias-esl': {
+        'task': 'manifesto.tasks.ingerir_ocorrencias_esl_task',
+        'schedule': float(os.getenv('ESL_FEED_INTERVALO', 60)),
+    },
+    'preaquecer-manifestos': {
+        'task': 'manifesto.tasks.preaquecer_manifestos_task',
+        'schedule': float(os.getenv('ESL_PREAQUECIMENTO_INTERVALO', 900)),
+    },
+}
+
+# Início de transporte (manifestStartTransport) em lote: pedidos da mesma janela (s) saem num
+# único documento GraphQL com até ESL_INICIO_TRANSPORTE_LOTE aliases; só as falhas são repetidas.
+ESL_INICIO_TRANSPORTE_JANELA = float(os.getenv('ESL_INICIO_TRANSPORTE_JANELA', 5))
+ESL_INICIO_TRANSPORTE_LOTE = int(os.getenv('ESL_INICIO_TRANSPORTE_LOTE', 25))
+ESL_INICIO_TRANSPORTE_MAX_TENTATIVAS = int(os.getenv('ESL_INICIO_TRANSPORTE_MAX_TENTATIVAS', 4))
+ESL_INICIO_TRANSPORTE_BACKOFF = int(os.getenv('ESL_INICIO_TRANSPORTE_BACKOFF', 10))
+
+# Pré-aquecimento dos manifestos do dia (minutos). Manifesto PREPARADO sincronizado dentro
+# da janela é servido direto do banco na busca do app; o beat renova a partir da metade dela.
+ESL_PREAQUECIMENTO_FRESCOR = int(os.getenv('ESL_PREAQUECIMENTO_FRESCOR', 120))
+# Páginas de 100 registros do 2972 lidas por execução
+ESL_PREAQUECIMENTO_MAX_PAGINAS = int(os.getenv('ESL_PREAQUECIMENTO_MAX_PAGINAS', 10))
+
+# Pipeline assíncrono (asyncio + httpx): várias sincronizações num único event loop.
+# Conexões do pool compartilhado e quantos manifestos rodam ao mesmo tempo no loop.
+ESL_ASYNC_MAX_CONEXOES = int(os.getenv('ESL_ASYNC_MAX_CONEXOES', 10))
+ESL_ASYNC_MAX_MANIFESTOS = int(os.getenv('ESL_ASYNC_MAX_MANIFESTOS', 5))
+# No loop a espera pelo orçamento é uma corrotina dormindo, não um worker parado: o teto pode ser maior
+ESL_ASYNC_ESPERA_MAXIMA = float(os.getenv('ESL_ASYNC_ESPERA_MAXIMA', 120))
+
+
 # --- Configurações Django REST Framework ---
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
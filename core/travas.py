@@ -0,0 +1,44 @@
+# core/travas.py
+"""
+Travas simples no Redis (SET NX + TTL) para garantir uma única execução por chave
+entre todos os workers/processos web. O valor guardado identifica o dono da trava,
+então só quem adquiriu consegue liberar.
+"""
+import logging
+
+import redis
+
+from core.redis_cliente import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Apaga só se o valor ainda for o do dono (a trava pode ter expirado e sido pega por outro)
+_SCRIPT_LIBERAR = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def adquirir(chave, dono, ttl):
+    """
+    Tenta pegar a trava por `ttl` segundos. Retorna (adquiriu, dono_atual).
+    Sem Redis, libera a execução (melhor duplicar que travar o app).
+    """
+    try:
+        cliente = get_redis()
+        if cliente.set(chave, str(dono), nx=True, ex=ttl):
+            return True, str(dono)
+        atual = cliente.get(chave)
+        return False, atual.decode() if atual else None
+    except redis.RedisError as e:
+        logger.warning(f"⚠️ Trava '{chave}' indisponível ({e}). Seguindo sem trava.")
+        return True, str(dono)
+
+
+def liberar(chave, dono):
+    try:
+        get_redis().eval(_SCRIPT_LIBERAR, 1, chave, str(dono))
+    except redis.RedisError:
+        pass
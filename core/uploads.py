@@ -0,0 +1,127 @@
+# core/uploads.py
+"""
+Recebimento de fotos em streaming, sem segurar o arquivo inteiro na memória.
+
+O `ImagemUploadHandler` fica na frente do TemporaryFileUploadHandler do Django: cada pedaço
+que chega é contado e repassado direto para o arquivo temporário em disco. Os primeiros bytes
+são conferidos contra as assinaturas de JPEG/PNG/WEBP, então um PDF ou vídeo é recusado no
+primeiro pedaço, e passar de COMPROVANTE_TAMANHO_MAXIMO interrompe o upload na hora.
+O mesmo `VerificadorImagem` valida o download das mídias do WhatsApp.
+"""
+import hashlib
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+# Bytes necessários para reconhecer a assinatura (RIFF....WEBP é a mais longa)
+TAMANHO_ASSINATURA = 12
+TAMANHO_PEDACO = 64 * 1024
+
+
+class UploadRejeitado(Exception):
+    """Arquivo recusado durante o recebimento. `status` é o HTTP sugerido (413 ou 415)."""
+
+    def __init__(self, mensagem, status):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def detectar_tipo_imagem(cabecalho):
+    """'jpeg', 'png', 'webp' ou None pelos primeiros bytes do arquivo."""
+    if cabecalho[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if cabecalho[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if cabecalho[:4] == b'RIFF' and cabecalho[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class VerificadorImagem:
+    """Confere tamanho e assinatura de um arquivo pedaço a pedaço. Levanta UploadRejeitado."""
+
+    def __init__(self, tamanho_maximo=None):
+        self.tamanho_maximo = tamanho_maximo or settings.COMPROVANTE_TAMANHO_MAXIMO
+        self.recebidos = 0
+        self.tipo = None
+        self._cabecalho = b''
+        # Hash calculado de graça enquanto o arquivo passa (armazenamento endereçado pelo conteúdo)
+        self.sha256 = hashlib.sha256()
+
+    def alimentar(self, pedaco):
+        self.recebidos += len(pedaco)
+        self.sha256.update(pedaco)
+        if self.recebidos > self.tamanho_maximo:
+            raise UploadRejeitado(
+                f"Foto maior que o limite de {self.tamanho_maximo // (1024 * 1024)} MB.", status=413
+            )
+        if self.tipo is None and len(self._cabecalho) < TAMANHO_ASSINATURA:
+            self._cabecalho += pedaco[:TAMANHO_ASSINATURA - len(self._cabecalho)]
+            if len(self._cabecalho) >= TAMANHO_ASSINATURA:
+                self._conferir_assinatura()
+
+    def finalizar(self):
+        if self.tipo is None:
+            self._conferir_assinatura()
+
+    def _conferir_assinatura(self):
+        self.tipo = detectar_tipo_imagem(self._cabecalho)
+        if self.tipo is None:
+            raise UploadRejeitado("O arquivo enviado não é uma foto (JPEG, PNG ou WEBP).", status=415)
+
+
+class ImagemUploadHandler(FileUploadHandler):
+    """
+    Handler de passagem: valida cada pedaço e o repassa ao próximo handler (o de arquivo temporário).
+    Na recusa, guarda o motivo em `request.upload_rejeitado` e para o upload; o resto do corpo
+    é descartado sem ser gravado. O sha256 de cada arquivo aceito fica em `request.sha256_upload[campo]`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.verificador = VerificadorImagem()
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            self.verificador.alimentar(raw_data)
+        except UploadRejeitado as e:
+            self._rejeitar(e)
+        return raw_data
+
+    def file_complete(self, file_size):
+        try:
+            self.verificador.finalizar()
+        except UploadRejeitado as e:
+            self._rejeitar(e)
+        hashes = getattr(self.request, 'sha256_upload', {})
+        hashes[self.field_name] = self.verificador.sha256.hexdigest()
+        self.request.sha256_upload = hashes
+        # O arquivo de verdade quem monta é o próximo handler
+        return None
+
+    def _rejeitar(self, erro):
+        self.request.upload_rejeitado = erro
+        raise StopUpload(connection_reset=False)
+
+
+def baixar_imagem(response, nome):
+    """
+    Grava o corpo de um `requests` aberto com stream=True num arquivo temporário, validando
+    enquanto baixa. Retorna um django File pronto para `FieldFile.save`. Levanta UploadRejeitado.
+    """
+    verificador = VerificadorImagem()
+    destino = tempfile.TemporaryFile()
+    try:
+        for pedaco in response.iter_content(chunk_size=TAMANHO_PEDACO):
+            verificador.alimentar(pedaco)
+            destino.write(pedaco)
+        verificador.finalizar()
+    except BaseException:
+        destino.close()
+        raise
+    finally:
+        response.close()
+    destino.seek(0)
+    return File(destino, name=nome)
@@ -3,14 +3,15 @@ from django.utils.html import format_html
 from unfold.admin import ModelAdmin
 from .models import (
     Manifesto, NotaFiscal, Ocorrencia, BaixaNF, 
-    HistoricoOcorrencia, ManifestoBuscaLog
+    HistoricoOcorrencia, ManifestoBuscaLog, IntegracaoBaixaESL, CursorESL, OcorrenciaPendenteESL, NFe,
+    ComprovanteArquivo,
 )
-from manifesto.tasks import enviar_baixa_esl_task
+from manifesto.integracao_esl import enfileirar_baixas
 
 @admin.register(Manifesto)
 class ManifestoAdmin(ModelAdmin):
     # 'veiculo' foi removido pois não existe no seu model Manifesto
-    list_display = ("numero_manifesto", "motorista", "status", "data_criacao")
+    list_display = ("numero_manifesto", "motorista", "status", "data_criacao", "sincronizado_em")
     list_filter = ("status", "finalizado")
     search_fields = ("numero_manifesto", "motorista__nome_completo")
 
@@ -20,6 +21,17 @@ class NotaFiscalAdmin(ModelAdmin):
     search_fields = ("numero_nota", "chave_acesso", "destinatario")
     list_filter = ("status",)
 
+@admin.register(NFe)
+class NFeAdmin(ModelAdmin):
+    list_display = ("numero_nota", "chave_acesso", "emitente_documento", "destinatario", "atualizado_em")
+    search_fields = ("numero_nota", "chave_acesso", "destinatario", "emitente_documento")
+
+@admin.register(ComprovanteArquivo)
+class ComprovanteArquivoAdmin(ModelAdmin):
+    list_display = ("sha256", "tamanho", "url", "criado_em")
+    search_fields = ("sha256", "url")
+    readonly_fields = ("sha256", "caminho", "tamanho", "url", "miniatura_url", "criado_em")
+
 @admin.register(Ocorrencia)
 class OcorrenciaAdmin(ModelAdmin):
     # Alterado de 'codigo' para 'codigo_tms' conforme seu model
@@ -36,10 +48,16 @@ class HistoricoOcorrenciaAdmin(ModelAdmin):
 @admin.register(ManifestoBuscaLog)
 class ManifestoBuscaLogAdmin(ModelAdmin):
     # Ajustado para os campos reais: 'criado_em' e 'status'
-    list_display = ("numero_manifesto", "motorista", "status", "criado_em")
-    list_filter = ("status", "criado_em")
+    list_display = ("numero_manifesto", "motorista", "status", "origem", "progresso", "criado_em")
+    list_filter = ("status", "origem", "criado_em")
     search_fields = ("numero_manifesto", "motorista__nome_completo")
 
+    def progresso(self, obj):
+        if not obj.notas_total:
+            return "-"
+        return f"{obj.notas_processadas}/{obj.notas_total}"
+    progresso.short_description = "Notas"
+
 @admin.register(BaixaNF)
 class BaixaNFAdmin(ModelAdmin):
     list_display = ("get_nf", "tipo", "status_integracao", "data_baixa", "ver_mapa")
@@ -68,7 +86,25 @@ class BaixaNFAdmin(ModelAdmin):
     ver_mapa.short_description = "Mapa"
 
     def forcar_reintegracao(self, request, queryset):
-        for baixa in queryset:
-            enviar_baixa_esl_task.delay(baixa.id)
-        self.message_user(request, "Integração disparada para os itens selecionados.")
+        # Vai para a fila de saída: o drenador envia em lotes, sem uma task por baixa
+        total = enfileirar_baixas(queryset.values_list('id', flat=True))
+        self.message_user(request, f"{total} baixa(s) na fila de integração com a ESL.")
     forcar_reintegracao.short_description = "Re-enviar para TMS ESL"
+
+
+@admin.register(IntegracaoBaixaESL)
+class IntegracaoBaixaESLAdmin(ModelAdmin):
+    list_display = ("baixa", "status", "tentativas", "proxima_tentativa", "enviado_em")
+    list_filter = ("status",)
+    readonly_fields = ("criado_em", "enviado_em", "reservado_em", "ultimo_erro")
+
+
+@admin.register(CursorESL)
+class CursorESLAdmin(ModelAdmin):
+    list_display = ("nome", "valor", "atualizado_em")
+
+
+@admin.register(OcorrenciaPendenteESL)
+class OcorrenciaPendenteESLAdmin(ModelAdmin):
+    list_display = ("chave_acesso", "codigo_tms", "data_ocorrencia", "manifesto_evento", "recebido_em")
+    search_fields = ("chave_acesso",)
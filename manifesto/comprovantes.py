@@ -0,0 +1,222 @@
+# manifesto/comprovantes.py
+# Publicação da foto do comprovante: o app grava a foto no disco e o worker a sobe para o FTP depois.
+# As fotos são endereçadas pelo sha256 do original: a mesma foto é normalizada e enviada uma vez só.
+import hashlib
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+
+from core.armazenamento import ErroArmazenamento, get_pool
+from core.imagens import ImagemInvalida, normalizar_comprovante
+
+logger = logging.getLogger(__name__)
+
+PASTA_LOCAL = 'comprovantes'
+
+
+def calcular_sha256(campo):
+    """sha256 do arquivo local, lido em blocos."""
+    sha = hashlib.sha256()
+    with campo.open('rb') as arquivo:
+        for pedaco in arquivo.chunks():
+            sha.update(pedaco)
+    return sha.hexdigest()
+
+
+def preparar_arquivos(baixa, sha256):
+    """
+    Normaliza a foto local (EXIF, metadados, resolução, qualidade) lendo direto do disco.
+    Retorna {'foto': (dados, nome), 'miniatura': (dados, nome) ou None}, nomes `{sha256}.ext`.
+    Foto que o Pillow não abre sobe como veio, sem miniatura: aí `dados` é o próprio arquivo
+    aberto (enviado em blocos) e quem chamou fecha com `fechar_arquivos`.
+    Levanta OSError se o arquivo sumiu.
+    """
+    extensao_original = baixa.comprovante_foto.name.rsplit('.', 1)[-1].lower()
+    arquivo = baixa.comprovante_foto.open('rb')
+    try:
+        foto, miniatura, extensao = normalizar_comprovante(arquivo)
+    except ImagemInvalida as e:
+        logger.warning(f"⚠️ Foto da baixa {baixa.id} não pôde ser normalizada ({e}); enviando original")
+        return {'foto': (arquivo, f"{sha256}.{extensao_original}"), 'miniatura': None}
+    except BaseException:
+        arquivo.close()
+        raise
+    arquivo.close()
+
+    return {
+        'foto': (foto, f"{sha256}.{extensao}"),
+        'miniatura': (miniatura, f"{sha256}_mini.{extensao}"),
+    }
+
+
+def fechar_arquivos(arquivos):
+    for arquivo in arquivos.values():
+        if arquivo and hasattr(arquivo[0], 'close'):
+            arquivo[0].close()
+
+
+def registrar_arquivo(baixa, sha256, arquivos, url_foto, url_miniatura):
+    """
+    Grava o ComprovanteArquivo da foto recém-publicada, com a versão normalizada no disco
+    em `comprovantes/{sha256}.ext`. Se outro worker registrou o mesmo hash antes, usa o dele.
+    """
+    from manifesto.models import ComprovanteArquivo
+
+    if arquivos['miniatura']:
+        dados, nome = arquivos['foto']
+        caminho = default_storage.save(f"{PASTA_LOCAL}/{nome}", ContentFile(dados))
+        tamanho = len(dados)
+    else:
+        # Original que o Pillow não abriu: o próprio arquivo local vira o conteúdo
+        caminho = baixa.comprovante_foto.name
+        tamanho = baixa.comprovante_foto.size
+
+    try:
+        return ComprovanteArquivo.objects.create(
+            sha256=sha256, caminho=caminho, tamanho=tamanho, url=url_foto, miniatura_url=url_miniatura,
+        )
+    except IntegrityError:
+        if caminho != baixa.comprovante_foto.name:
+            default_storage.delete(caminho)
+        return ComprovanteArquivo.objects.get(sha256=sha256)
+
+
+def vincular_arquivo(baixa, arquivo):
+    """
+    Aponta a baixa para o ComprovanteArquivo (referência, URLs e arquivo local) e libera o envio
+    para a ESL. O original local, se não for o conteúdo de um ComprovanteArquivo, é apagado.
+    """
+    from manifesto.models import BaixaNF, ComprovanteArquivo, ReferenciaComprovante
+    from manifesto.integracao_esl import liberar_apos_upload
+
+    ReferenciaComprovante.objects.update_or_create(baixa=baixa, defaults={'arquivo': arquivo})
+
+    original = baixa.comprovante_foto.name if baixa.comprovante_foto else None
+    baixa.comprovante_foto = arquivo.caminho
+    baixa.comprovante_foto_url = arquivo.url
+    baixa.comprovante_miniatura_url = arquivo.miniatura_url
+    BaixaNF.objects.filter(id=baixa.id).update(
+        comprovante_foto=arquivo.caminho,
+        comprovante_foto_url=arquivo.url,
+        comprovante_miniatura_url=arquivo.miniatura_url,
+    )
+
+    if original and original != arquivo.caminho and not ComprovanteArquivo.objects.filter(caminho=original).exists():
+        default_storage.delete(original)
+    liberar_apos_upload(baixa.id)
+
+
+def arquivo_por_hash(sha256):
+    from manifesto.models import ComprovanteArquivo
+    return ComprovanteArquivo.objects.filter(sha256=sha256).first() if sha256 else None
+
+
+def publicar_comprovante(baixa_id):
+    """
+    Publica a foto local da baixa e libera a baixa na fila da ESL. Foto já conhecida (mesmo
+    sha256) só ganha a referência; foto nova é normalizada e sobe com a miniatura.
+    Retorna a URL da foto (None se a baixa não tem foto).
+    Levanta BaixaNF.DoesNotExist e ErroArmazenamento.
+    """
+    from manifesto.models import BaixaNF
+    from manifesto.integracao_esl import liberar_apos_upload
+
+    baixa = BaixaNF.objects.get(id=baixa_id)
+    if baixa.comprovante_foto_url or not baixa.comprovante_foto:
+        # Já publicada (task repetida) ou sem foto: só destrava o envio
+        liberar_apos_upload(baixa_id)
+        return baixa.comprovante_foto_url
+
+    try:
+        sha256 = calcular_sha256(baixa.comprovante_foto)
+    except OSError as e:
+        raise ErroArmazenamento(f"Foto local {baixa.comprovante_foto.name} ilegível: {e}")
+
+    arquivo = arquivo_por_hash(sha256)
+    if arquivo:
+        logger.info(f"♻️ Comprovante da baixa {baixa_id} já publicado ({sha256[:12]}): sem novo upload")
+    else:
+        try:
+            arquivos = preparar_arquivos(baixa, sha256)
+        except OSError as e:
+            raise ErroArmazenamento(f"Foto local {baixa.comprovante_foto.name} ilegível: {e}")
+
+        pool = get_pool()
+        try:
+            url_miniatura = pool.enviar(*arquivos['miniatura']) if arquivos['miniatura'] else None
+            url_foto = pool.enviar(*arquivos['foto'])
+        finally:
+            fechar_arquivos(arquivos)
+        arquivo = registrar_arquivo(baixa, sha256, arquivos, url_foto, url_miniatura)
+        logger.info(f"📸 Comprovante da baixa {baixa_id} publicado: {url_foto}")
+
+    vincular_arquivo(baixa, arquivo)
+    return arquivo.url
+
+
+def publicar_comprovantes(baixa_ids):
+    """
+    Versão em lote (drenador): fotos já conhecidas só ganham a referência; as novas são
+    normalizadas uma vez por hash e sobem em paralelo pelo pool do processo.
+    Quem falhar continua esperando com o erro registrado na fila.
+    Retorna {'publicados': n, 'reaproveitados': n, 'falhas': n}.
+    """
+    from manifesto.models import BaixaNF
+    from manifesto.integracao_esl import liberar_apos_upload
+
+    resumo = {'publicados': 0, 'reaproveitados': 0, 'falhas': 0}
+    baixas_por_hash = {}
+    for baixa in BaixaNF.objects.filter(id__in=baixa_ids):
+        if baixa.comprovante_foto_url or not baixa.comprovante_foto:
+            liberar_apos_upload(baixa.id)
+            continue
+        try:
+            baixas_por_hash.setdefault(calcular_sha256(baixa.comprovante_foto), []).append(baixa)
+        except OSError as e:
+            resumo['falhas'] += 1
+            liberar_apos_upload(baixa.id, erro=f"Foto local ilegível: {e}")
+
+    # Uma preparação e um upload por hash, mesmo que várias baixas do lote usem a mesma foto
+    preparadas = {}
+    for sha256, baixas in baixas_por_hash.items():
+        if arquivo_por_hash(sha256):
+            continue
+        try:
+            preparadas[sha256] = preparar_arquivos(baixas[0], sha256)
+        except OSError as e:
+            resumo['falhas'] += len(baixas)
+            for baixa in baixas:
+                liberar_apos_upload(baixa.id, erro=f"Foto local ilegível: {e}")
+
+    envios = [arquivo for arquivos in preparadas.values() for arquivo in arquivos.values() if arquivo]
+    try:
+        resultados = get_pool().enviar_varios(envios)
+    finally:
+        for arquivos in preparadas.values():
+            fechar_arquivos(arquivos)
+
+    for sha256, baixas in baixas_por_hash.items():
+        arquivo = arquivo_por_hash(sha256)
+        if arquivo is None and sha256 not in preparadas:
+            continue
+        if arquivo is None:
+            arquivos = preparadas[sha256]
+            urls = {tipo: resultados[item[1]] if item else None for tipo, item in arquivos.items()}
+            erro = next((url for url in urls.values() if isinstance(url, ErroArmazenamento)), None)
+            if erro:
+                resumo['falhas'] += len(baixas)
+                logger.error(f"🔴 Upload do comprovante {sha256[:12]} falhou: {erro}")
+                for baixa in baixas:
+                    liberar_apos_upload(baixa.id, erro=str(erro))
+                continue
+            arquivo = registrar_arquivo(baixas[0], sha256, arquivos, urls['foto'], urls['miniatura'])
+            resumo['publicados'] += 1
+            resumo['reaproveitados'] += len(baixas) - 1
+        else:
+            resumo['reaproveitados'] += len(baixas)
+
+        for baixa in baixas:
+            vincular_arquivo(baixa, arquivo)
+    return resumo
@@ -1,4 +1,21 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+@database_sync_to_async
+def motorista_do_token(token):
+    """Id do Motorista dono do access token (JWT do app), ou None se inválido."""
+    from usuarios.models import Motorista
+    try:
+        user_id = AccessToken(token)['user_id']
+    except (TokenError, KeyError):
+        return None
+    return Motorista.objects.filter(user_id=user_id).values_list('id', flat=True).first()
+
 
 class ManifestoConsumer(AsyncJsonWebsocketConsumer):
 
@@ -6,6 +23,13 @@ class ManifestoConsumer(AsyncJsonWebsocketConsumer):
         self.motorista_id = self.scope['url_route']['kwargs']['motorista_id']
         self.group_name = f"manifesto_{self.motorista_id}"
 
+        # O app não usa sessão: o access token vem na query string (?token=...)
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('token', [None])[0]
+        motorista_id = await motorista_do_token(token) if token else None
+        if str(motorista_id) != str(self.motorista_id):
+            await self.close()
+            return
+
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
@@ -0,0 +1,207 @@
+# manifesto/historico_esl.py
+# Ingestão do feed /api/invoice_occurrences da ESL para o HistoricoOcorrencia
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.esl import cliente as esl
+
+logger = logging.getLogger(__name__)
+
+CURSOR_FEED = 'ocorrencias'
+CURSOR_BACKFILL = 'ocorrencias_backfill'
+# Uma leitura por vez do cursor principal (beat ou backfill com --feed-principal)
+TRAVA_FEED = "esl:feed:ocorrencias"
+
+
+def ler_cursor(nome):
+    from manifesto.models import CursorESL
+    return CursorESL.objects.filter(nome=nome).values_list('valor', flat=True).first()
+
+
+def salvar_cursor_feed(nome, valor):
+    from manifesto.models import CursorESL
+    CursorESL.objects.update_or_create(nome=nome, defaults={'valor': str(valor) if valor is not None else None})
+
+
+def _data_ocorrencia(valor):
+    data = parse_datetime(valor) if valor else None
+    if data and timezone.is_naive(data):
+        data = timezone.make_aware(data)
+    return data
+
+
+def extrair_eventos(registros):
+    """Registros do feed -> [{chave, codigo, data, comentarios, manifesto}] (ignora os sem chave/código)."""
+    eventos = []
+    for item in registros:
+        chave = (item.get('invoice') or {}).get('key')
+        codigo = (item.get('occurrence') or {}).get('code')
+        if not chave or codigo is None:
+            continue
+        manifesto = item.get('manifest') or {}
+        eventos.append({
+            'chave': chave,
+            'codigo': str(codigo),
+            'data': _data_ocorrencia(item.get('occurrence_at')),
+            'comentarios': item.get('comments'),
+            'manifesto': str(manifesto.get('sequence_code') or manifesto.get('id') or ''),
+        })
+    return eventos
+
+
+def _historicos(eventos, notas_por_chave):
+    from manifesto.models import HistoricoOcorrencia
+    return [
+        HistoricoOcorrencia(
+            nota_fiscal_id=nota_id,
+            codigo_tms=evento['codigo'],
+            data_ocorrencia=evento['data'],
+            comentarios=evento['comentarios'],
+            manifesto_evento=evento['manifesto'],
+        )
+        for evento in eventos
+        for nota_id in notas_por_chave.get(evento['chave'], [])
+    ]
+
+
+def _notas_por_chave(chaves):
+    from manifesto.models import NotaFiscal
+
+    notas_por_chave = defaultdict(list)
+    for nota_id, chave in NotaFiscal.objects.filter(chave_acesso__in=set(chaves)).values_list('id', 'chave_acesso'):
+        notas_por_chave[chave].append(nota_id)
+    return notas_por_chave
+
+
+def gravar_eventos(registros):
+    """
+    Grava os eventos de uma página do feed (ou da paginação de um manifesto) em lote.
+    Cada evento vai para todas as notas locais com a mesma chave; eventos repetidos caem na
+    unique (nota, código, data) e são ignorados. Eventos de chaves sem nota local ficam em
+    OcorrenciaPendenteESL até a nota chegar. Retorna quantos históricos foram enviados ao banco.
+    """
+    from manifesto.models import HistoricoOcorrencia, OcorrenciaPendenteESL
+
+    eventos = extrair_eventos(registros)
+    if not eventos:
+        return 0
+
+    notas_por_chave = _notas_por_chave(e['chave'] for e in eventos)
+    objetos = _historicos(eventos, notas_por_chave)
+    HistoricoOcorrencia.objects.bulk_create(objetos, batch_size=500, ignore_conflicts=True)
+
+    OcorrenciaPendenteESL.objects.bulk_create(
+        [
+            OcorrenciaPendenteESL(
+                chave_acesso=evento['chave'],
+                codigo_tms=evento['codigo'],
+                data_ocorrencia=evento['data'],
+                comentarios=evento['comentarios'],
+                manifesto_evento=evento['manifesto'],
+            )
+            for evento in eventos
+            if evento['chave'] not in notas_por_chave
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    return len(objetos)
+
+
+def aplicar_pendentes(chaves):
+    """
+    Notas recém-criadas: os eventos guardados das suas chaves viram HistoricoOcorrencia
+    e saem de OcorrenciaPendenteESL. Retorna quantos históricos foram enviados ao banco.
+    """
+    from manifesto.models import HistoricoOcorrencia, OcorrenciaPendenteESL
+
+    pendentes = OcorrenciaPendenteESL.objects.filter(chave_acesso__in=list(chaves))
+    eventos = [
+        {
+            'chave': p.chave_acesso,
+            'codigo': p.codigo_tms,
+            'data': p.data_ocorrencia,
+            'comentarios': p.comentarios,
+            'manifesto': p.manifesto_evento,
+        }
+        for p in pendentes
+    ]
+    if not eventos:
+        return 0
+
+    notas_por_chave = _notas_por_chave(e['chave'] for e in eventos)
+    objetos = _historicos(eventos, notas_por_chave)
+    HistoricoOcorrencia.objects.bulk_create(objetos, batch_size=500, ignore_conflicts=True)
+    OcorrenciaPendenteESL.objects.filter(chave_acesso__in=list(notas_por_chave)).delete()
+    return len(objetos)
+
+
+def descartar_pendentes_antigos():
+    """Apaga os eventos guardados há mais de ESL_FEED_PENDENTES_DIAS (nota que nunca chegou)."""
+    from manifesto.models import OcorrenciaPendenteESL
+
+    limite = timezone.now() - timedelta(days=settings.ESL_FEED_PENDENTES_DIAS)
+    apagados, _ = OcorrenciaPendenteESL.objects.filter(recebido_em__lt=limite).delete()
+    return apagados
+
+
+def semear_cursor_feed(registros):
+    """
+    Feed principal ainda sem cursor: começa do maior id visto na paginação de um manifesto
+    (perto do fim do feed), em vez de ler o feed desde o início. O histórico anterior é
+    carregado só pelo comando backfill_ocorrencias_esl.
+    """
+    from manifesto.models import CursorESL
+
+    maior = max((int(r['id']) for r in registros if r.get('id') is not None), default=None)
+    if maior is not None and not CursorESL.objects.filter(nome=CURSOR_FEED).exists():
+        CursorESL.objects.get_or_create(nome=CURSOR_FEED, defaults={'valor': str(maior)})
+
+
+def ingerir_feed(nome_cursor=CURSOR_FEED, max_paginas=None, ate_id=None, inicio=None, desde_o_inicio=False):
+    """
+    Lê o feed a partir do `after_id` salvo em `nome_cursor`, gravando e avançando o
+    cursor a cada página (interrompido, retoma da última página gravada).
+    Para no fim do feed, em `max_paginas` ou quando passar de `ate_id`.
+    Sem cursor salvo nem `inicio`, só lê com `desde_o_inicio` (backfill): ler o feed desde o começo
+    gastaria o orçamento de ocorrências da sincronização. O beat espera `semear_cursor_feed`.
+    Retorna {'paginas', 'eventos', 'cursor'}.
+    """
+    cursor = ler_cursor(nome_cursor) or inicio
+    resumo = {'paginas': 0, 'eventos': 0, 'cursor': cursor}
+    if cursor is None and not desde_o_inicio:
+        return resumo
+
+    while max_paginas is None or resumo['paginas'] < max_paginas:
+        params = {"per": settings.ESL_FEED_POR_PAGINA}
+        if cursor:
+            params["after_id"] = cursor
+
+        response = esl.listar_ocorrencias(params)
+        response.raise_for_status()
+        data = response.json()
+
+        registros = data.get('data', [])
+        resumo['eventos'] += gravar_eventos(registros)
+        resumo['paginas'] += 1
+
+        proximo = (data.get('paging') or {}).get('next_id')
+        fim = proximo is None
+        if fim:
+            # Última página: guarda o maior id lido para a próxima execução seguir dali
+            proximo = max((r.get('id') for r in registros if r.get('id') is not None), default=None)
+
+        if proximo is not None and str(proximo) != str(cursor):
+            cursor = proximo
+            salvar_cursor_feed(nome_cursor, cursor)
+            resumo['cursor'] = cursor
+
+        if fim or not registros or (ate_id is not None and int(cursor) >= int(ate_id)):
+            break
+
+    return resumo
@@ -0,0 +1,249 @@
+# manifesto/inicio_transporte.py
+# manifestStartTransport em lote: pedidos juntados numa janela curta e enviados num documento GraphQL com aliases
+import json
+import logging
+import time
+
+import redis
+import requests
+from django.conf import settings
+
+from core import travas
+from core.esl import cliente as esl
+from core.redis_cliente import get_redis
+
+logger = logging.getLogger(__name__)
+
+# {numero_manifesto: {"km": ..., "tentativas": n}} e quando cada um pode sair (score = epoch)
+CHAVE_FILA = "esl:inicio_transporte:fila"
+CHAVE_AGENDA = "esl:inicio_transporte:agenda"
+# Existe enquanto há um envio agendado: segura os pedidos da mesma janela num único disparo
+CHAVE_ENVIO_AGENDADO = "esl:inicio_transporte:agendado"
+TRAVA_ENVIO = "esl:inicio_transporte:envio"
+
+
+class InicioTransporteInvalido(Exception):
+    """O manifesto não pode ser iniciado (sem motorista, sem KM de referência)."""
+
+
+# =====================================================
+# ENFILEIRAMENTO
+# =====================================================
+
+def km_inicial_do_manifesto(manifesto):
+    """KM final do último manifesto FINALIZADO do motorista."""
+    from manifesto.models import Manifesto
+
+    if not manifesto.motorista:
+        raise InicioTransporteInvalido("Manifesto sem motorista vinculado")
+
+    ultimo_manifesto = (
+        Manifesto.objects
+        .filter(
+            motorista=manifesto.motorista,
+            status="FINALIZADO",
+            km_final__isnull=False
+        )
+        .order_by("-data_finalizacao")
+        .first()
+    )
+    if not ultimo_manifesto:
+        raise InicioTransporteInvalido("Motorista não possui manifesto finalizado anterior")
+    return ultimo_manifesto.km_final
+
+
+def enfileirar_inicio_transporte(numero_manifesto):
+    """
+    Valida o manifesto, calcula o KM inicial e coloca o pedido na fila do Redis.
+    Retorna o KM inicial. Levanta InicioTransporteInvalido / Manifesto.DoesNotExist.
+    """
+    from manifesto.models import Manifesto
+
+    manifesto = Manifesto.objects.select_related("motorista").get(numero_manifesto=numero_manifesto)
+    km_inicial = km_inicial_do_manifesto(manifesto)
+
+    cliente = get_redis()
+    pipe = cliente.pipeline()
+    pipe.hset(CHAVE_FILA, numero_manifesto, json.dumps({"km": float(km_inicial), "tentativas": 0}))
+    # NX: pedido repetido não perde o lugar na fila
+    pipe.zadd(CHAVE_AGENDA, {numero_manifesto: time.time()}, nx=True)
+    pipe.execute()
+    return km_inicial
+
+
+def agendar_envio(countdown=None):
+    """Dispara `enviar_inicios_transporte_task` no fim da janela, se ainda não houver um agendado."""
+    from manifesto.tasks import enviar_inicios_transporte_task
+
+    janela = settings.ESL_INICIO_TRANSPORTE_JANELA if countdown is None else countdown
+    if get_redis().set(CHAVE_ENVIO_AGENDADO, 1, nx=True, ex=max(int(janela) + 30, 1)):
+        enviar_inicios_transporte_task.apply_async(countdown=janela)
+
+
+# =====================================================
+# DOCUMENTO GRAPHQL COM ALIASES
+# =====================================================
+
+def montar_documento(pedidos):
+    """
+    pedidos: [(numero_manifesto, km)] -> (query, variables, {alias: numero_manifesto}).
+    Cada manifesto vira um alias `mN: manifestStartTransport(...)` com variáveis próprias.
+    """
+    declaracoes, campos, variables, aliases = [], [], {}, {}
+    for i, (numero, km) in enumerate(pedidos):
+        alias = f"m{i}"
+        declaracoes.append(f"$id{i}: ID!, $params{i}: ManifestStartTransportInput!")
+        campos.append(f"{alias}: manifestStartTransport(id: $id{i}, params: $params{i}) {{ success errors }}")
+        variables[f"id{i}"] = numero
+        variables[f"params{i}"] = {"km": float(km)}
+        aliases[alias] = numero
+
+    query = "mutation (" + ", ".join(declaracoes) + ") {\n  " + "\n  ".join(campos) + "\n}"
+    return query, variables, aliases
+
+
+def ler_resultados(corpo, aliases):
+    """
+    Resposta GraphQL -> {numero_manifesto: None (sucesso) ou mensagem de erro}.
+    Erros com `path` caem só no alias apontado; erro sem path (documento inteiro) vale para todos.
+    """
+    dados = corpo.get("data") or {}
+    erros_por_alias, erro_geral = {}, None
+    for erro in corpo.get("errors") or []:
+        caminho = erro.get("path") or []
+        if caminho and caminho[0] in aliases:
+            erros_por_alias[caminho[0]] = erro.get("message")
+        else:
+            erro_geral = erro.get("message") or str(erro)
+
+    resultados = {}
+    for alias, numero in aliases.items():
+        resultado = dados.get(alias)
+        if resultado and resultado.get("success"):
+            resultados[numero] = None
+        elif resultado:
+            resultados[numero] = str(resultado.get("errors") or "success=false")
+        else:
+            resultados[numero] = erros_por_alias.get(alias) or erro_geral or "Sem resposta para o manifesto"
+    return resultados
+
+
+# =====================================================
+# ENVIO DO LOTE
+# =====================================================
+
+def _reservar_pedidos(cliente, limite):
+    numeros = [n.decode() for n in cliente.zrangebyscore(CHAVE_AGENDA, '-inf', time.time(), start=0, num=limite)]
+    if not numeros:
+        return {}
+    brutos = cliente.hmget(CHAVE_FILA, numeros)
+    return {numero: json.loads(bruto) for numero, bruto in zip(numeros, brutos) if bruto}
+
+
+def _concluir(cliente, numeros):
+    if numeros:
+        pipe = cliente.pipeline()
+        pipe.hdel(CHAVE_FILA, *numeros)
+        pipe.zrem(CHAVE_AGENDA, *numeros)
+        pipe.execute()
+
+
+def _reagendar(cliente, pedidos, erros):
+    """Só as falhas voltam para a fila, com backoff; quem estourou as tentativas sai com log de erro."""
+    desistidos, pipe = [], cliente.pipeline()
+    for numero, erro in erros.items():
+        pedido = pedidos[numero]
+        pedido["tentativas"] += 1
+        if pedido["tentativas"] >= settings.ESL_INICIO_TRANSPORTE_MAX_TENTATIVAS:
+            desistidos.append(numero)
+            logger.error(f"🔴 Início de transporte do manifesto {numero} desistiu após {pedido['tentativas']} tentativas: {erro}")
+            continue
+        espera = settings.ESL_INICIO_TRANSPORTE_BACKOFF * 2 ** (pedido["tentativas"] - 1)
+        pipe.hset(CHAVE_FILA, numero, json.dumps(pedido))
+        pipe.zadd(CHAVE_AGENDA, {numero: time.time() + espera})
+    pipe.execute()
+    _concluir(cliente, desistidos)
+
+
+def atualizar_manifestos_iniciados(pedidos, numeros):
+    """Registra o KM inicial e o status EM_TRANSPORTE dos manifestos aceitos pela ESL."""
+    from manifesto.models import Manifesto
+
+    for numero in numeros:
+        try:
+            Manifesto.objects.filter(numero_manifesto=numero).update(
+                km_inicial=pedidos[numero]["km"], status="EM_TRANSPORTE"
+            )
+        except Exception as e:
+            # Ex.: motorista já tem outro manifesto em transporte; a ESL já foi avisada
+            logger.error(f"🔴 Manifesto {numero} iniciado na ESL mas não atualizado localmente: {e}")
+
+
+def enviar_lote():
+    """
+    Envia os pedidos vencidos da fila (até ESL_INICIO_TRANSPORTE_LOTE) num único POST /graphql.
+    Retorna {'enviados': n, 'falhas': n, 'restantes': n}.
+    Levanta LimiteESLExcedido (nada sai da fila) para quem chamou reagendar.
+    """
+    cliente = get_redis()
+    pedidos = _reservar_pedidos(cliente, settings.ESL_INICIO_TRANSPORTE_LOTE)
+    if not pedidos:
+        return {'enviados': 0, 'falhas': 0, 'restantes': cliente.zcard(CHAVE_AGENDA)}
+
+    query, variables, aliases = montar_documento([(n, p["km"]) for n, p in pedidos.items()])
+    try:
+        response = esl.graphql(query, variables)
+        response.raise_for_status()
+        resultados = ler_resultados(response.json(), aliases)
+    except (requests.exceptions.HTTPError, requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout, ValueError) as e:
+        # Falha do lote inteiro: todos voltam para a fila
+        resultados = {numero: str(e) for numero in pedidos}
+
+    iniciados = [numero for numero, erro in resultados.items() if erro is None]
+    erros = {numero: erro for numero, erro in resultados.items() if erro is not None}
+
+    atualizar_manifestos_iniciados(pedidos, iniciados)
+    _concluir(cliente, iniciados)
+    _reagendar(cliente, pedidos, erros)
+
+    logger.info(f"🚚 Início de transporte em lote: {len(iniciados)}/{len(pedidos)} aceitos em 1 chamada")
+    return {'enviados': len(iniciados), 'falhas': len(erros), 'restantes': cliente.zcard(CHAVE_AGENDA)}
+
+
+def proximo_envio():
+    """Segundos até o próximo pedido da fila ficar vencido (0 se já há vencidos), ou None se vazia."""
+    primeiro = get_redis().zrange(CHAVE_AGENDA, 0, 0, withscores=True)
+    if not primeiro:
+        return None
+    return max(primeiro[0][1] - time.time(), 0)
+
+
+def drenar_inicios(dono):
+    """Envia lotes enquanto houver pedidos vencidos. Uma drenagem por vez (trava no Redis)."""
+    adquiriu, _ = travas.adquirir(TRAVA_ENVIO, dono, 5 * 60)
+    if not adquiriu:
+        return None
+
+    resumo = {'enviados': 0, 'falhas': 0, 'lotes': 0}
+    try:
+        while True:
+            parcial = enviar_lote()
+            if not parcial['enviados'] and not parcial['falhas']:
+                break
+            resumo['lotes'] += 1
+            resumo['enviados'] += parcial['enviados']
+            resumo['falhas'] += parcial['falhas']
+            espera = proximo_envio()
+            if espera is None or espera > 0:
+                break
+    finally:
+        travas.liberar(TRAVA_ENVIO, dono)
+    return resumo
+
+
+def liberar_agendamento():
+    try:
+        get_redis().delete(CHAVE_ENVIO_AGENDADO)
+    except redis.RedisError:
+        pass
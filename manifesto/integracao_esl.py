@@ -0,0 +1,404 @@
+# manifesto/integracao_esl.py
+# Envio das baixas (BaixaNF) para a ESL pela fila de saída (IntegracaoBaixaESL)
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, timezone as dt_timezone
+
+import requests
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.esl import cliente as esl
+from core.esl.limitador import LimiteESLExcedido
+
+logger = logging.getLogger(__name__)
+
+
+# =====================================================
+# PAYLOAD E ENVIO
+# =====================================================
+
+def montar_payload_baixa(baixa):
+    """Corpo do POST /api/invoice_occurrences para a baixa (com nota, ocorrência e motorista carregados)."""
+    nf = baixa.nota_fiscal
+    motorista = nf.manifesto.motorista.nome_completo
+    url_foto = baixa.comprovante_foto_url or ""
+    codigo_ocorrencia = int(baixa.ocorrencia.codigo_tms) if baixa.ocorrencia else 1
+
+    # Data exatamente como registrada (UTC)
+    data_utc = baixa.data_baixa.astimezone(dt_timezone.utc)
+    data_ocorrencia_str = data_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+    # Lógica de envio de foto
+    if codigo_ocorrencia in [1, 2]:
+        invoice_data = {
+            "key": nf.chave_acesso,
+            "delivery_receipt_url": url_foto
+        }
+        freight_data = {}
+    else:
+        invoice_data = {
+            "key": nf.chave_acesso,
+            "delivery_receipt_url": ""
+        }
+        freight_data = {
+            "delivery_receipt_url": url_foto
+        } if url_foto else {}
+
+    payload = {
+        "invoice_occurrence": {
+            "receiver": baixa.recebedor or "Nao identificado",
+            "document_number": baixa.documento_recebedor or "",
+            "comments": f"Baixa via App - Motorista: {motorista}. Obs: {baixa.observacao or ''}",
+            "occurrence_at": data_ocorrencia_str,
+            "occurrence": {
+                "code": codigo_ocorrencia
+            },
+            "invoice": invoice_data,
+            "manifest": {
+                "id": nf.manifesto.numero_manifesto
+            }
+        }
+    }
+
+    if freight_data:
+        payload["invoice_occurrence"]["freight"] = freight_data
+    return payload
+
+
+def carregar_baixa(baixa_id):
+    from manifesto.models import BaixaNF
+    return BaixaNF.objects.select_related(
+        'nota_fiscal',
+        'ocorrencia',
+        'nota_fiscal__manifesto__motorista'
+    ).get(id=baixa_id)
+
+
+def enviar_baixa(baixa):
+    """Posta a ocorrência na ESL e marca a baixa como integrada. Levanta os erros do cliente/HTTP."""
+    response = esl.enviar_ocorrencia(montar_payload_baixa(baixa))
+    response.raise_for_status()
+
+    # ✅ SUCESSO
+    baixa.processado_tms = True
+    baixa.integrado_tms = True
+    baixa.data_integracao = timezone.now()
+    baixa.log_erro_tms = "Sucesso: Integrado com ESL"
+    baixa.save()
+
+
+def registrar_falha_baixa(baixa, mensagem):
+    baixa.log_erro_tms = mensagem[:500]
+    baixa.integrado_tms = False
+    baixa.save()
+
+
+# =====================================================
+# FILA DE SAÍDA (OUTBOX)
+# =====================================================
+
+def aguarda_upload(baixa):
+    """A foto já está no disco local mas ainda não tem URL pública para mandar à ESL."""
+    return bool(baixa.comprovante_foto) and not baixa.comprovante_foto_url
+
+
+def enfileirar_baixa(baixa):
+    """
+    Coloca (ou recoloca) a baixa na fila de envio. Chamar dentro da mesma transação
+    que gravou a BaixaNF: nada é publicado no broker, o drenador pega a linha depois do commit.
+    Com foto ainda não publicada, o item fica em AGUARDANDO_UPLOAD e o upload é disparado
+    depois do commit; o `enviar_comprovante_task` libera o envio quando a URL existir.
+    """
+    from manifesto.models import IntegracaoBaixaESL
+
+    esperar_foto = aguarda_upload(baixa)
+    agora = timezone.now()
+    IntegracaoBaixaESL.objects.update_or_create(
+        baixa=baixa,
+        defaults={
+            'status': 'AGUARDANDO_UPLOAD' if esperar_foto else 'PENDENTE',
+            'tentativas': 0,
+            # Em AGUARDANDO_UPLOAD, é quando o drenador redispara um upload que se perdeu
+            'proxima_tentativa': agora + timedelta(seconds=settings.COMPROVANTE_UPLOAD_EXPIRA) if esperar_foto else agora,
+            'reservado_em': None,
+            'ultimo_erro': None,
+        }
+    )
+
+    if esperar_foto:
+        from manifesto.tasks import enviar_comprovante_task
+
+        baixa_id = baixa.id
+        transaction.on_commit(lambda: enviar_comprovante_task.delay(baixa_id))
+
+
+def liberar_apos_upload(baixa_id, erro=None):
+    """
+    Sem `erro`: a foto foi publicada, o item vai para PENDENTE e sai no próximo lote.
+    Com `erro`: o item continua esperando e o drenador redispara o upload depois de COMPROVANTE_UPLOAD_EXPIRA.
+    """
+    from manifesto.models import IntegracaoBaixaESL
+
+    fila = IntegracaoBaixaESL.objects.filter(baixa_id=baixa_id, status='AGUARDANDO_UPLOAD')
+    if erro:
+        fila.update(
+            proxima_tentativa=timezone.now() + timedelta(seconds=settings.COMPROVANTE_UPLOAD_EXPIRA),
+            ultimo_erro=f"Upload da foto: {erro}"[:1000],
+        )
+    else:
+        fila.update(status='PENDENTE', proxima_tentativa=timezone.now(), ultimo_erro=None)
+
+
+def reservar_uploads_parados(limite=100):
+    """
+    Baixas em AGUARDANDO_UPLOAD há mais de COMPROVANTE_UPLOAD_EXPIRA (task perdida ou esgotada).
+    Empurra a próxima verificação de cada uma e retorna os ids das baixas para redisparar o upload.
+    """
+    from manifesto.models import IntegracaoBaixaESL
+
+    agora = timezone.now()
+    with transaction.atomic():
+        itens = list(
+            IntegracaoBaixaESL.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='AGUARDANDO_UPLOAD', proxima_tentativa__lte=agora)
+            .values_list('id', 'baixa_id')[:limite]
+        )
+        if itens:
+            IntegracaoBaixaESL.objects.filter(id__in=[i for i, _ in itens]).update(
+                proxima_tentativa=agora + timedelta(seconds=settings.COMPROVANTE_UPLOAD_EXPIRA)
+            )
+    return [baixa_id for _, baixa_id in itens]
+
+
+def enfileirar_baixas(baixa_ids):
+    """
+    Versão em massa de `enfileirar_baixa` (reintegração pelo admin): um UPDATE para as que
+    já têm item na fila e um bulk_create para as demais, sem uma task por baixa no broker.
+    Baixas com foto ainda sem URL entram em AGUARDANDO_UPLOAD e têm o upload disparado.
+    Retorna quantas baixas entraram na fila.
+    """
+    from manifesto.models import BaixaNF, IntegracaoBaixaESL
+    from manifesto.tasks import enviar_comprovante_task
+
+    baixa_ids = set(baixa_ids)
+    agora = timezone.now()
+    existentes = set(
+        IntegracaoBaixaESL.objects.filter(baixa_id__in=baixa_ids).values_list('baixa_id', flat=True)
+    )
+    sem_url = set(
+        BaixaNF.objects.filter(id__in=baixa_ids)
+        .exclude(Q(comprovante_foto='') | Q(comprovante_foto__isnull=True))
+        .filter(Q(comprovante_foto_url='') | Q(comprovante_foto_url__isnull=True))
+        .values_list('id', flat=True)
+    )
+    with transaction.atomic():
+        IntegracaoBaixaESL.objects.filter(baixa_id__in=existentes).update(
+            status='PENDENTE', tentativas=0, proxima_tentativa=agora, reservado_em=None, ultimo_erro=None
+        )
+        IntegracaoBaixaESL.objects.bulk_create(
+            [IntegracaoBaixaESL(baixa_id=baixa_id, proxima_tentativa=agora) for baixa_id in baixa_ids - existentes],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        if sem_url:
+            IntegracaoBaixaESL.objects.filter(baixa_id__in=sem_url).update(
+                status='AGUARDANDO_UPLOAD',
+                proxima_tentativa=agora + timedelta(seconds=settings.COMPROVANTE_UPLOAD_EXPIRA),
+            )
+            transaction.on_commit(lambda: [enviar_comprovante_task.delay(baixa_id) for baixa_id in sem_url])
+    return len(baixa_ids)
+
+
+def reservar_lote(tamanho):
+    """
+    Reserva até `tamanho` itens prontos para envio (SELECT ... FOR UPDATE SKIP LOCKED):
+    dois drenadores em paralelo nunca pegam a mesma linha.
+    Itens PROCESSANDO há mais de ESL_OUTBOX_RESERVA_EXPIRA s (worker morreu) voltam para a fila,
+    ou viram ERRO (com o e-mail) se já gastaram ESL_OUTBOX_MAX_TENTATIVAS.
+    """
+    from manifesto.models import IntegracaoBaixaESL
+
+    agora = timezone.now()
+    expirada = agora - timedelta(seconds=settings.ESL_OUTBOX_RESERVA_EXPIRA)
+
+    with transaction.atomic():
+        esgotados = list(
+            IntegracaoBaixaESL.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                status='PROCESSANDO', reservado_em__lt=expirada,
+                tentativas__gte=settings.ESL_OUTBOX_MAX_TENTATIVAS,
+            )
+        )
+        for item in esgotados:
+            _falhar(item, item.ultimo_erro or "Envio interrompido sem desfecho em todas as tentativas.")
+
+        ids = list(
+            IntegracaoBaixaESL.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status='PENDENTE', proxima_tentativa__lte=agora) |
+                Q(status='PROCESSANDO', reservado_em__lt=expirada)
+            )
+            .order_by('proxima_tentativa')
+            .values_list('id', flat=True)[:tamanho]
+        )
+        if ids:
+            IntegracaoBaixaESL.objects.filter(id__in=ids).update(
+                status='PROCESSANDO', reservado_em=agora, tentativas=F('tentativas') + 1
+            )
+    return ids
+
+
+def _reagendar(item, segundos, erro=None, contar_tentativa=True):
+    item.status = 'PENDENTE'
+    item.reservado_em = None
+    item.proxima_tentativa = timezone.now() + timedelta(seconds=segundos)
+    if not contar_tentativa:
+        item.tentativas = max(item.tentativas - 1, 0)
+    if erro:
+        item.ultimo_erro = erro[:1000]
+    item.save(update_fields=['status', 'reservado_em', 'proxima_tentativa', 'tentativas', 'ultimo_erro'])
+
+
+def _falhar(item, erro):
+    from operacional.tasks import enviar_email_erro_tms_task
+
+    item.status = 'ERRO'
+    item.reservado_em = None
+    item.ultimo_erro = erro[:1000]
+    item.save(update_fields=['status', 'reservado_em', 'ultimo_erro'])
+    # Dentro de `reservar_lote` o ERRO só vale depois do commit
+    transaction.on_commit(lambda: enviar_email_erro_tms_task.delay(item.baixa_id, erro))
+
+
+def _reagendar_ou_falhar(item, erro):
+    """Falha transitória: volta com backoff exponencial; esgotadas as tentativas, vira ERRO."""
+    if item.tentativas >= settings.ESL_OUTBOX_MAX_TENTATIVAS:
+        _falhar(item, erro)
+    else:
+        _reagendar(item, settings.ESL_OUTBOX_BACKOFF * (2 ** (item.tentativas - 1)), erro)
+
+
+def processar_item(item):
+    """
+    Envia um item reservado e grava o desfecho nele.
+    Retorna a espera (s) pedida pela ESL quando o limite/disjuntor barrou o envio, senão None.
+    """
+    from manifesto.models import BaixaNF
+
+    try:
+        baixa = carregar_baixa(item.baixa_id)
+    except BaixaNF.DoesNotExist:
+        item.delete()
+        return None
+
+    try:
+        enviar_baixa(baixa)
+
+    except LimiteESLExcedido as e:
+        # Não é falha da baixa: volta para a fila quando a ESL liberar
+        _reagendar(item, e.espera, str(e), contar_tentativa=False)
+        return e.espera
+
+    except requests.exceptions.HTTPError as exc:
+        status = exc.response.status_code if exc.response is not None else None
+        msg_erro = f"Erro {status}: {exc.response.text if exc.response is not None else str(exc)}"
+        registrar_falha_baixa(baixa, msg_erro)
+
+        # ❌ NÃO RETRYA erro de validação (4xx)
+        if status and 400 <= status < 500:
+            _falhar(item, msg_erro)
+        else:
+            _reagendar_ou_falhar(item, msg_erro)
+        return None
+
+    except requests.exceptions.RequestException as exc:
+        msg_erro = f"ESL indisponível: {exc}"
+        registrar_falha_baixa(baixa, msg_erro)
+        _reagendar_ou_falhar(item, msg_erro)
+        return None
+
+    except Exception as exc:
+        # Payload inválido (ex.: int() de um campo), erro de banco etc.: conta como tentativa
+        # em vez de derrubar a thread do drenador e deixar o item preso em PROCESSANDO
+        msg_erro = f"Erro interno no envio: {exc}"
+        logger.exception(f"🔴 Baixa {item.baixa_id}: {msg_erro}")
+        registrar_falha_baixa(baixa, msg_erro)
+        _reagendar_ou_falhar(item, msg_erro)
+        return None
+
+    item.status = 'ENVIADO'
+    item.reservado_em = None
+    item.ultimo_erro = None
+    item.enviado_em = timezone.now()
+    item.save(update_fields=['status', 'reservado_em', 'ultimo_erro', 'enviado_em'])
+    return None
+
+
+def drenar_fila(tamanho_lote=None, concorrencia=None):
+    """
+    Reserva um lote e envia com até `concorrencia` envios simultâneos, todos pela mesma
+    sessão HTTP do processo (pool keep-alive). Cada baixa recebe o seu próprio desfecho.
+    Se a ESL pedir para esperar (limite/429/disjuntor), o que ainda não saiu volta para a fila.
+    Retorna {'enviados', 'reagendados', 'erros'}.
+    """
+    from manifesto.models import IntegracaoBaixaESL
+
+    ids = reservar_lote(tamanho_lote or settings.ESL_OUTBOX_LOTE)
+    resumo = {'enviados': 0, 'reagendados': 0, 'erros': 0}
+    if not ids:
+        return resumo
+
+    itens = list(IntegracaoBaixaESL.objects.filter(id__in=ids).order_by('proxima_tentativa'))
+    parar = threading.Event()
+    espera_pedida = []
+
+    def _enviar(item):
+        if parar.is_set():
+            _reagendar(item, max(espera_pedida or [0]), contar_tentativa=False)
+            return 'reagendados'
+        espera = processar_item(item)
+        if espera is not None:
+            espera_pedida.append(espera)
+            parar.set()
+        return {'ENVIADO': 'enviados', 'ERRO': 'erros'}.get(item.status, 'reagendados')
+
+    fila = queue.SimpleQueue()
+    for item in itens:
+        fila.put(item)
+    trava_resumo = threading.Lock()
+
+    def _trabalhador():
+        # Cada thread abre a sua conexão com o banco uma vez, usa em todos os itens que
+        # pegar da fila e fecha ao terminar
+        try:
+            while True:
+                try:
+                    item = fila.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    desfecho = _enviar(item)
+                except Exception as e:
+                    # Falhou até gravar o desfecho (banco fora?): a reserva expira e
+                    # `reservar_lote` decide entre tentar de novo e marcar ERRO
+                    logger.exception(f"🔴 Item {item.id} da fila da ESL sem desfecho: {e}")
+                    desfecho = 'erros'
+                with trava_resumo:
+                    resumo[desfecho] += 1
+        finally:
+            connections.close_all()
+
+    trabalhadores = min(concorrencia or settings.ESL_OUTBOX_CONCORRENCIA, len(itens))
+    with ThreadPoolExecutor(max_workers=trabalhadores) as pool:
+        for futuro in [pool.submit(_trabalhador) for _ in range(trabalhadores)]:
+            futuro.result()
+
+    return resumo
@@ -0,0 +1,79 @@
+# manifesto/management/commands/backfill_ocorrencias_esl.py
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import travas
+from core.esl.limitador import LimiteESLExcedido
+from manifesto.historico_esl import (
+    CURSOR_BACKFILL, CURSOR_FEED, TRAVA_FEED, ingerir_feed, ler_cursor, salvar_cursor_feed,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Carrega ocorrências antigas da ESL (invoice_occurrences) no HistoricoOcorrencia. "
+        "Retomável: o cursor é salvo a cada página; rodar de novo continua de onde parou."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde-id', help="after_id inicial (só vale na primeira execução ou com --reiniciar).")
+        parser.add_argument('--ate-id', type=int, help="Para ao passar deste id.")
+        parser.add_argument('--paginas', type=int, help="Máximo de páginas nesta execução.")
+        parser.add_argument('--reiniciar', action='store_true', help="Descarta o cursor salvo do backfill.")
+        parser.add_argument(
+            '--feed-principal', action='store_true',
+            help="Avança o cursor do feed do beat em vez do cursor próprio do backfill.",
+        )
+
+    def handle(self, *args, **opcoes):
+        if not opcoes['feed_principal']:
+            return self._backfill(CURSOR_BACKFILL, opcoes)
+
+        # O beat lê o mesmo cursor: segura a trava enquanto o comando roda
+        dono = f"backfill-{os.getpid()}"
+        adquiriu, _ = travas.adquirir(TRAVA_FEED, dono, 24 * 3600)
+        if not adquiriu:
+            raise CommandError("A ingestão do feed principal já está rodando (beat). Tente de novo em instantes.")
+        try:
+            self._backfill(CURSOR_FEED, opcoes)
+        finally:
+            travas.liberar(TRAVA_FEED, dono)
+
+    def _backfill(self, nome_cursor, opcoes):
+        if opcoes['reiniciar']:
+            salvar_cursor_feed(nome_cursor, opcoes['desde_id'])
+        elif opcoes['desde_id'] and ler_cursor(nome_cursor):
+            raise CommandError(
+                f"O cursor '{nome_cursor}' já existe ({ler_cursor(nome_cursor)}). Use --reiniciar para sobrescrever."
+            )
+
+        restantes = opcoes['paginas']
+        total_paginas = total_eventos = 0
+
+        while restantes is None or restantes > 0:
+            try:
+                resumo = ingerir_feed(
+                    nome_cursor,
+                    max_paginas=min(restantes, 50) if restantes is not None else 50,
+                    ate_id=opcoes['ate_id'],
+                    inicio=opcoes['desde_id'],
+                    desde_o_inicio=True,
+                )
+            except LimiteESLExcedido as e:
+                self.stdout.write(f"⏳ {e}")
+                time.sleep(e.espera)
+                continue
+
+            total_paginas += resumo['paginas']
+            total_eventos += resumo['eventos']
+            if restantes is not None:
+                restantes -= resumo['paginas']
+            self.stdout.write(f"📄 {total_paginas} página(s), {total_eventos} evento(s). Cursor: {resumo['cursor']}")
+
+            # Lote menor que o pedido = chegou ao fim do feed ou ao --ate-id
+            if resumo['paginas'] < 50 or (opcoes['ate_id'] and resumo['cursor'] and int(resumo['cursor']) >= opcoes['ate_id']):
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Backfill concluído: {total_eventos} evento(s) em {total_paginas} página(s)."))
@@ -0,0 +1,158 @@
+# manifesto/management/commands/benchmark_sincronizacao.py
+import time
+
+from celery import current_app
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from core.esl.servidor_falso import gerar_fixture, iniciar
+from manifesto.models import BaixaNF, ManifestoBuscaLog, NotaFiscal
+from manifesto.tasks import buscar_manifesto_completo_task, enviar_baixa_esl_task
+from usuarios.models import Motorista
+
+CPF_BENCHMARK = '00000000191'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a sincronização (buscar_manifesto_completo_task) e o envio de baixas (enviar_baixa_esl_task) "
+        "de ponta a ponta contra a ESL falsa: tempo, chamadas à ESL e queries por nota. "
+        "As tasks rodam no próprio processo e tudo que gravam no banco é desfeito no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notas', default='10,50,200', help="Tamanhos de manifesto, separados por vírgula.")
+        parser.add_argument('--baixas', type=int, default=10, help="Baixas enviadas por manifesto (0 pula a etapa).")
+        parser.add_argument('--latencia', type=float, default=0.02, help="Latência fixa da ESL falsa (s).")
+        parser.add_argument('--variacao', type=float, default=0.0, help="Latência aleatória somada (s).")
+        parser.add_argument('--taxa-erro', type=float, default=0.0, help="Fração de respostas 503.")
+        parser.add_argument('--limite', type=float, help="Req/s por token na ESL falsa (acima disso, 429).")
+        parser.add_argument('--rajada', type=int, help="Bucket do limite da ESL falsa.")
+        parser.add_argument(
+            '--sem-limitador', action='store_true',
+            help="Desliga o orçamento global (ESL_LIMITES) para medir só o custo do código.",
+        )
+        parser.add_argument('--com-cache', action='store_true', help="Mantém o cache dos relatórios ligado.")
+
+    def handle(self, *args, **opcoes):
+        try:
+            tamanhos = [int(n) for n in opcoes['notas'].split(',') if n.strip()]
+        except ValueError:
+            raise CommandError("--notas deve ser uma lista de inteiros, ex.: 10,50,200")
+
+        conf = current_app.conf
+        eager_antes = (conf.task_always_eager, conf.task_eager_propagates)
+        conf.task_always_eager, conf.task_eager_propagates = True, True
+
+        linhas = []
+        try:
+            for semente, notas in enumerate(tamanhos):
+                fixture = gerar_fixture(notas_por_manifesto=notas, cpf=CPF_BENCHMARK, semente=int(time.time()) + semente)
+                servidor = iniciar(
+                    fixture,
+                    latencia=opcoes['latencia'],
+                    variacao=opcoes['variacao'],
+                    taxa_erro=opcoes['taxa_erro'],
+                    limite_por_segundo=opcoes['limite'],
+                    rajada=opcoes['rajada'],
+                )
+                try:
+                    with override_settings(**self._ajustes(servidor.url, opcoes)):
+                        linhas.extend(self._medir(servidor, fixture, opcoes['baixas']))
+                finally:
+                    servidor.parar()
+        finally:
+            conf.task_always_eager, conf.task_eager_propagates = eager_antes
+
+        self._imprimir(linhas)
+
+    def _ajustes(self, url, opcoes):
+        ajustes = {
+            'ESL_BASE_URL': url,
+            # Tokens e URL próprios: o benchmark não gasta o orçamento (buckets) da produção
+            # nem abre o disjuntor dela com os erros simulados (as chaves levam token e URL)
+            'ESL_TOKEN_RELATORIOS': 'benchmark-relatorios',
+            'ESL_TOKEN_API': 'benchmark-api',
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+        }
+        if not opcoes['com_cache']:
+            ajustes['ESL_CACHE_TTL'] = {}
+            ajustes['ESL_CACHE_TTL_NEGATIVO'] = 0
+        if opcoes['sem_limitador']:
+            ajustes['ESL_LIMITES'] = {
+                endpoint: {'taxa': 10000, 'rajada': 10000} for endpoint in ('relatorio', 'ocorrencias', 'graphql')
+            }
+        return ajustes
+
+    def _medir(self, servidor, fixture, quantidade_baixas):
+        manifesto_esl = fixture['manifestos'][0]
+        total_notas = len(manifesto_esl['chaves'])
+        linhas = []
+
+        with transaction.atomic():
+            motorista, _ = Motorista.objects.get_or_create(
+                cpf=CPF_BENCHMARK, defaults={'nome_completo': 'MOTORISTA BENCHMARK'}
+            )
+            log = ManifestoBuscaLog.objects.create(
+                numero_manifesto=str(manifesto_esl['sequence_code']), motorista=motorista
+            )
+
+            # --- Sincronização ---
+            servidor.zerar_contadores()
+            with CaptureQueriesContext(connection) as queries:
+                inicio = time.perf_counter()
+                buscar_manifesto_completo_task.apply(args=(log.id,))
+                duracao = time.perf_counter() - inicio
+
+            log.refresh_from_db()
+            gravadas = NotaFiscal.objects.filter(manifesto__numero_manifesto=log.numero_manifesto).count()
+            linhas.append(self._linha(
+                f"sync ({log.status})", total_notas, gravadas, duracao, servidor, len(queries)
+            ))
+
+            # --- Baixas ---
+            notas = list(NotaFiscal.objects.filter(manifesto__numero_manifesto=log.numero_manifesto)[:quantidade_baixas])
+            if notas:
+                baixas = [
+                    BaixaNF.objects.create(nota_fiscal=nf, tipo='ENTREGA', recebedor='BENCHMARK')
+                    for nf in notas
+                ]
+                servidor.zerar_contadores()
+                with CaptureQueriesContext(connection) as queries:
+                    inicio = time.perf_counter()
+                    for baixa in baixas:
+                        enviar_baixa_esl_task.apply(args=(baixa.id,))
+                    duracao = time.perf_counter() - inicio
+
+                linhas.append(self._linha(
+                    "baixas", len(baixas), len(servidor.baixas_recebidas), duracao, servidor, len(queries)
+                ))
+
+            transaction.set_rollback(True)
+        return linhas
+
+    def _linha(self, etapa, notas, concluidas, duracao, servidor, queries):
+        chamadas = servidor.total_chamadas()
+        return {
+            'etapa': etapa,
+            'notas': notas,
+            'concluidas': concluidas,
+            'tempo': duracao,
+            'chamadas': chamadas,
+            'queries': queries,
+            'detalhe': ', '.join(f"{k}={v}" for k, v in sorted(servidor.contadores.items())),
+        }
+
+    def _imprimir(self, linhas):
+        cabecalho = f"{'etapa':<22}{'notas':>7}{'ok':>7}{'tempo(s)':>10}{'ms/nota':>10}{'ESL':>7}{'ESL/nota':>10}{'queries':>9}{'q/nota':>8}"
+        self.stdout.write(cabecalho)
+        self.stdout.write('-' * len(cabecalho))
+        for linha in linhas:
+            n = max(linha['notas'], 1)
+            self.stdout.write(
+                f"{linha['etapa']:<22}{linha['notas']:>7}{linha['concluidas']:>7}{linha['tempo']:>10.2f}"
+                f"{linha['tempo'] * 1000 / n:>10.1f}{linha['chamadas']:>7}{linha['chamadas'] / n:>10.2f}"
+                f"{linha['queries']:>9}{linha['queries'] / n:>8.2f}"
+            )
+            self.stdout.write(f"    {linha['detalhe']}")
@@ -0,0 +1,52 @@
+# manifesto/management/commands/servidor_esl_falso.py
+from django.core.management.base import BaseCommand
+
+from core.esl.servidor_falso import gerar_fixture, iniciar
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe um servidor local que imita a ESL (relatórios 2972/9873, invoice_occurrences, graphql). "
+        "Aponte ESL_BASE_URL para a URL exibida para testar o sistema sem a ESL de produção."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--porta', type=int, default=8099)
+        parser.add_argument('--manifestos', type=int, default=3)
+        parser.add_argument('--notas', type=int, default=50, help="Notas por manifesto.")
+        parser.add_argument('--cpf', default='00000000191', help="CPF do motorista dono dos manifestos.")
+        parser.add_argument('--latencia', type=float, default=0.0, help="Segundos fixos por requisição.")
+        parser.add_argument('--variacao', type=float, default=0.0, help="Segundos aleatórios somados à latência.")
+        parser.add_argument('--taxa-erro', type=float, default=0.0, help="Fração de respostas 503 (0 a 1).")
+        parser.add_argument('--limite', type=float, help="Requisições por segundo por token (acima disso, 429).")
+        parser.add_argument('--rajada', type=int, help="Tamanho do bucket do limite.")
+        parser.add_argument('--semente', type=int, default=0)
+
+    def handle(self, *args, **opcoes):
+        fixture = gerar_fixture(
+            manifestos=opcoes['manifestos'],
+            notas_por_manifesto=opcoes['notas'],
+            cpf=opcoes['cpf'],
+            semente=opcoes['semente'],
+        )
+        servidor = iniciar(
+            fixture,
+            host=opcoes['host'],
+            porta=opcoes['porta'],
+            latencia=opcoes['latencia'],
+            variacao=opcoes['variacao'],
+            taxa_erro=opcoes['taxa_erro'],
+            limite_por_segundo=opcoes['limite'],
+            rajada=opcoes['rajada'],
+            semente=opcoes['semente'],
+        )
+
+        numeros = ', '.join(str(m['sequence_code']) for m in fixture['manifestos'])
+        self.stdout.write(self.style.SUCCESS(f"🧪 ESL falsa em {servidor.url}"))
+        self.stdout.write(f"   Manifestos ({opcoes['notas']} notas cada, CPF {opcoes['cpf']}): {numeros}")
+        self.stdout.write(f"   Contadores: {servidor.url}/__estatisticas  (Ctrl+C para sair)")
+        try:
+            servidor._thread.join()
+        except KeyboardInterrupt:
+            servidor.parar()
@@ -0,0 +1,39 @@
+# manifesto/management/commands/servidor_ftp_falso.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.servidor_ftp_falso import iniciar
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe um servidor FTP local que aceita os uploads dos comprovantes. "
+        "Aponte FTP_HOST/FTP_PORTA para ele para testar o upload sem o FTP de produção."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--porta', type=int, default=2121)
+        parser.add_argument('--latencia-login', type=float, default=0.0, help="Segundos gastos em cada login.")
+        parser.add_argument('--ocioso', type=float, help="Derruba sessões paradas há mais que isso (s).")
+        parser.add_argument('--taxa-erro', type=float, default=0.0, help="Fração de STOR respondidos com 451 (0 a 1).")
+
+    def handle(self, *args, **opcoes):
+        servidor = iniciar(
+            host=opcoes['host'],
+            porta=opcoes['porta'],
+            usuario=settings.FTP_USER,
+            senha=settings.FTP_PASS,
+            diretorios=settings.FTP_DIRETORIOS,
+            latencia_login=opcoes['latencia_login'],
+            ocioso_max=opcoes['ocioso'],
+            taxa_erro=opcoes['taxa_erro'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"🧪 FTP falso em {servidor.host}:{servidor.porta}"))
+        self.stdout.write(f"   Usuário/senha e pastas vêm de FTP_USER/FTP_PASS/FTP_DIRETORIOS  (Ctrl+C para sair)")
+        try:
+            servidor._thread.join()
+        except KeyboardInterrupt:
+            self.stdout.write(f"   Contadores: {dict(servidor.contadores)}")
+            servidor.parar()
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0015_manifesto_filial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manifestobuscalog',
+            name='notas_processadas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='manifestobuscalog',
+            name='notas_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='manifestobuscalog',
+            name='status',
+            field=models.CharField(choices=[('AGUARDANDO', 'Aguardando'), ('PRONTO_PREVIEW', 'Pronto para Preview'), ('ENRIQUECENDO', 'Enriquecendo'), ('PROCESSADO', 'Processado'), ('ERRO', 'Erro')], default='AGUARDANDO', max_length=20),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:12
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mesclar_notas_duplicadas(apps, schema_editor):
+    """
+    Sincronizações concorrentes podem ter gravado a mesma chave duas vezes no manifesto.
+    Mantém a nota de menor id, move baixas/histórico das cópias para ela e apaga as cópias.
+    """
+    NotaFiscal = apps.get_model('manifesto', 'NotaFiscal')
+    BaixaNF = apps.get_model('manifesto', 'BaixaNF')
+    HistoricoOcorrencia = apps.get_model('manifesto', 'HistoricoOcorrencia')
+
+    duplicadas = (
+        NotaFiscal.objects
+        .exclude(chave_acesso__isnull=True)
+        .values('manifesto_id', 'chave_acesso')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+    )
+
+    for grupo in duplicadas:
+        notas = list(
+            NotaFiscal.objects
+            .filter(manifesto_id=grupo['manifesto_id'], chave_acesso=grupo['chave_acesso'])
+            .order_by('id')
+        )
+        mantida, copias = notas[0], notas[1:]
+
+        for copia in copias:
+            # Status de baixa vale mais que PENDENTE
+            if mantida.status == 'PENDENTE' and copia.status != 'PENDENTE':
+                mantida.status = copia.status
+
+            BaixaNF.objects.filter(nota_fiscal=copia).update(nota_fiscal=mantida)
+
+            for evento in HistoricoOcorrencia.objects.filter(nota_fiscal=copia):
+                ja_existe = HistoricoOcorrencia.objects.filter(
+                    nota_fiscal=mantida,
+                    codigo_tms=evento.codigo_tms,
+                    data_ocorrencia=evento.data_ocorrencia,
+                ).exists()
+                if ja_existe:
+                    evento.delete()
+                else:
+                    evento.nota_fiscal = mantida
+                    evento.save(update_fields=['nota_fiscal'])
+
+            copia.delete()
+
+        mantida.save(update_fields=['status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0016_manifestobuscalog_progresso'),
+    ]
+
+    operations = [
+        migrations.RunPython(mesclar_notas_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notafiscal',
+            constraint=models.UniqueConstraint(fields=('manifesto', 'chave_acesso'), name='nota_unica_por_manifesto'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0017_notafiscal_nota_unica_por_manifesto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manifesto',
+            name='esl_cursor',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='Cursor de paginação ESL'),
+        ),
+        migrations.AddField(
+            model_name='manifesto',
+            name='esl_id',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='ID interno ESL'),
+        ),
+        migrations.AddField(
+            model_name='manifesto',
+            name='sincronizado_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Última sincronização'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0018_manifesto_estado_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntegracaoBaixaESL',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('ENVIADO', 'Enviado'), ('ERRO', 'Erro definitivo')], default='PENDENTE', max_length=20)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reservado_em', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_erro', models.TextField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('enviado_em', models.DateTimeField(blank=True, null=True)),
+                ('baixa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='integracao_esl', to='manifesto.baixanf')),
+            ],
+            options={
+                'verbose_name': 'Integração de Baixa (ESL)',
+                'verbose_name_plural': 'Integrações de Baixas (ESL)',
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='manifesto_i_status_63a37a_idx')],
+            },
+        ),
+    ]
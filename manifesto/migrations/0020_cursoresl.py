@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0019_integracaobaixaesl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CursorESL',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=50, unique=True)),
+                ('valor', models.CharField(blank=True, max_length=50, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Cursor de Feed ESL',
+                'verbose_name_plural': 'Cursores de Feeds ESL',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0020_cursoresl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manifestobuscalog',
+            name='origem',
+            field=models.CharField(choices=[('APP', 'App do motorista'), ('PREAQUECIMENTO', 'Pré-aquecimento')], default='APP', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='manifesto',
+            name='status',
+            field=models.CharField(choices=[('PREPARADO', 'Preparado'), ('EM_TRANSPORTE', 'Em Transporte'), ('FINALIZADO', 'Finalizado'), ('CANCELADO', 'Cancelado')], default='EM_TRANSPORTE', max_length=20),
+        ),
+    ]
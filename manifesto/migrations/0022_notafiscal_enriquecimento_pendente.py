@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0021_manifestobuscalog_origem_preparado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notafiscal',
+            name='enriquecimento_pendente',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def popular_cadastro(apps, schema_editor):
+    """
+    Leva para o cadastro as notas que já foram enriquecidas (uma por chave, a mais recente)
+    e vincula todas as notas com a mesma chave.
+    """
+    NFe = apps.get_model('manifesto', 'NFe')
+    NotaFiscal = apps.get_model('manifesto', 'NotaFiscal')
+
+    enriquecidas = (
+        NotaFiscal.objects
+        .exclude(chave_acesso__isnull=True)
+        .exclude(destinatario='DADOS NÃO REPASSADOS PELA ESL')
+        .exclude(enriquecimento_pendente=True)
+        .order_by('chave_acesso', '-id')
+        .values('chave_acesso', 'numero_nota', 'destinatario', 'endereco_entrega')
+    )
+
+    vistas = set()
+    novas = []
+    for nota in enriquecidas.iterator():
+        chave = nota['chave_acesso']
+        if chave in vistas:
+            continue
+        vistas.add(chave)
+        novas.append(NFe(
+            chave_acesso=chave,
+            numero_nota=nota['numero_nota'],
+            # CNPJ do emitente vem na própria chave (posições 7 a 20)
+            emitente_documento=chave[6:20] if len(chave) == 44 and chave.isdigit() else None,
+            destinatario=nota['destinatario'],
+            endereco_entrega=nota['endereco_entrega'],
+        ))
+    NFe.objects.bulk_create(novas, batch_size=500, ignore_conflicts=True)
+
+    for nfe in NFe.objects.only('id', 'chave_acesso').iterator():
+        NotaFiscal.objects.filter(chave_acesso=nfe.chave_acesso, nfe__isnull=True).update(nfe=nfe)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0022_notafiscal_enriquecimento_pendente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NFe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave_acesso', models.CharField(max_length=44, unique=True, verbose_name='Chave de Acesso')),
+                ('numero_nota', models.CharField(max_length=20, verbose_name='Número NF')),
+                ('emitente_documento', models.CharField(blank=True, max_length=20, null=True, verbose_name='CNPJ Emitente')),
+                ('emitente_nome', models.CharField(blank=True, max_length=255, null=True, verbose_name='Emitente')),
+                ('destinatario', models.CharField(max_length=255, verbose_name='Destinatário')),
+                ('endereco_entrega', models.CharField(max_length=255, verbose_name='Endereço de Entrega')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Cadastro de NF-e',
+                'verbose_name_plural': 'Cadastro de NF-es',
+                'indexes': [models.Index(fields=['numero_nota', 'emitente_documento'], name='manifesto_n_numero__b3928e_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='notafiscal',
+            name='nfe',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notas_fiscais', to='manifesto.nfe'),
+        ),
+        migrations.RunPython(popular_cadastro, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0023_nfe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='integracaobaixaesl',
+            name='status',
+            field=models.CharField(choices=[('AGUARDANDO_UPLOAD', 'Aguardando upload da foto'), ('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('ENVIADO', 'Enviado'), ('ERRO', 'Erro definitivo')], default='PENDENTE', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0024_integracaobaixaesl_aguardando_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baixanf',
+            name='comprovante_miniatura_url',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+    ]
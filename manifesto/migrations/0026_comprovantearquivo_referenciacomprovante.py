@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0025_baixanf_comprovante_miniatura_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComprovanteArquivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('caminho', models.CharField(max_length=255)),
+                ('tamanho', models.PositiveIntegerField(default=0, verbose_name='Tamanho (bytes)')),
+                ('url', models.CharField(max_length=500)),
+                ('miniatura_url', models.CharField(blank=True, max_length=500, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Arquivo de Comprovante',
+                'verbose_name_plural': 'Arquivos de Comprovantes',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReferenciaComprovante',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('arquivo', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='referencias', to='manifesto.comprovantearquivo')),
+                ('baixa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='referencia_comprovante', to='manifesto.baixanf')),
+            ],
+            options={
+                'verbose_name': 'Referência de Comprovante',
+                'verbose_name_plural': 'Referências de Comprovantes',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manifesto', '0026_comprovantearquivo_referenciacomprovante'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcorrenciaPendenteESL',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave_acesso', models.CharField(db_index=True, max_length=44)),
+                ('codigo_tms', models.CharField(max_length=10)),
+                ('data_ocorrencia', models.DateTimeField(blank=True, null=True)),
+                ('comentarios', models.TextField(blank=True, null=True)),
+                ('manifesto_evento', models.CharField(max_length=50)),
+                ('recebido_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Ocorrência Pendente (ESL)',
+                'verbose_name_plural': 'Ocorrências Pendentes (ESL)',
+                'unique_together': {('chave_acesso', 'codigo_tms', 'data_ocorrencia')},
+            },
+        ),
+    ]
@@ -11,13 +11,22 @@ class ManifestoBuscaLog(models.Model):
     STATUS_CHOICES = (
         ('AGUARDANDO', 'Aguardando'),
         ('PRONTO_PREVIEW', 'Pronto para Preview'),
+        ('ENRIQUECENDO', 'Enriquecendo'),
         ('PROCESSADO', 'Processado'),
         ('ERRO', 'Erro'),
     )
 
+    ORIGEM_CHOICES = (
+        ('APP', 'App do motorista'),
+        ('PREAQUECIMENTO', 'Pré-aquecimento'),
+    )
+
     numero_manifesto = models.CharField(max_length=50)
     motorista = models.ForeignKey(Motorista, on_delete=models.CASCADE)
 
+    # Quem disparou a sincronização. Vira APP quando o motorista busca um manifesto pré-aquecido.
+    origem = models.CharField(max_length=20, choices=ORIGEM_CHOICES, default='APP')
+
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -26,6 +35,10 @@ class ManifestoBuscaLog(models.Model):
 
     mensagem_erro = models.TextField(blank=True, null=True)
 
+    # Progresso do enriquecimento (atualizado pelos blocos da sincronização)
+    notas_total = models.PositiveIntegerField(default=0)
+    notas_processadas = models.PositiveIntegerField(default=0)
+
     # ✅ AGORA CORRETO
     payload = models.JSONField(blank=True, null=True)
 
@@ -64,6 +77,7 @@ class Ocorrencia(models.Model):
 # 2. Manifesto de Carga
 class Manifesto(models.Model):
     STATUS_CHOICES = [
+        ('PREPARADO', 'Preparado'),  # pré-aquecido pelo beat, motorista ainda não buscou
         ('EM_TRANSPORTE', 'Em Transporte'),
         ('FINALIZADO', 'Finalizado'),
         ('CANCELADO', 'Cancelado'),
@@ -107,6 +121,11 @@ class Manifesto(models.Model):
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_finalizacao = models.DateTimeField(null=True, blank=True)
 
+    # Estado da sincronização com a ESL (re-sync incremental)
+    esl_id = models.CharField(max_length=50, null=True, blank=True, verbose_name="ID interno ESL")
+    esl_cursor = models.CharField(max_length=50, null=True, blank=True, verbose_name="Cursor de paginação ESL")
+    sincronizado_em = models.DateTimeField(null=True, blank=True, verbose_name="Última sincronização")
+
     def __str__(self):
         return f"Manifesto {self.numero_manifesto}"
 
@@ -121,6 +140,34 @@ class Manifesto(models.Model):
             )
         ]
 
+# Cadastro único da NF-e (dados que não mudam entre manifestos)
+class NFe(models.Model):
+    """
+    Dados da NF-e vindos do relatório 9873, uma linha por chave de acesso.
+    A sincronização consulta aqui antes da ESL: a mesma nota em outro manifesto
+    (reentrega, transferência) não gera nova chamada.
+    """
+    chave_acesso = models.CharField(max_length=44, unique=True, verbose_name="Chave de Acesso")
+    numero_nota = models.CharField(max_length=20, verbose_name="Número NF")
+
+    emitente_documento = models.CharField(max_length=20, null=True, blank=True, verbose_name="CNPJ Emitente")
+    emitente_nome = models.CharField(max_length=255, null=True, blank=True, verbose_name="Emitente")
+
+    destinatario = models.CharField(max_length=255, verbose_name="Destinatário")
+    endereco_entrega = models.CharField(max_length=255, verbose_name="Endereço de Entrega")
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"NF-e {self.numero_nota} ({self.chave_acesso})"
+
+    class Meta:
+        verbose_name = "Cadastro de NF-e"
+        verbose_name_plural = "Cadastro de NF-es"
+        indexes = [models.Index(fields=['numero_nota', 'emitente_documento'])]
+
+
 # 3. Notas Fiscais (Itens do Manifesto)
 class NotaFiscal(models.Model):
     """
@@ -134,6 +181,9 @@ class NotaFiscal(models.Model):
     
     destinatario = models.CharField(max_length=255, verbose_name="Destinatário")
     endereco_entrega = models.CharField(max_length=255, verbose_name="Endereço de Entrega")
+
+    # Cadastro de onde vieram destinatário/endereço (None enquanto a ESL não devolveu a nota)
+    nfe = models.ForeignKey(NFe, on_delete=models.SET_NULL, null=True, blank=True, related_name='notas_fiscais')
     
     STATUS_CHOICES = [
         ('PENDENTE', 'Pendente'),
@@ -142,6 +192,9 @@ class NotaFiscal(models.Model):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
 
+    # Esqueleto gravado no preview (chave + número); destinatário/endereço chegam no enriquecimento
+    enriquecimento_pendente = models.BooleanField(default=False)
+
     def __str__(self):
         return f"NF {self.numero_nota} ({self.manifesto.numero_manifesto})"
     
@@ -150,6 +203,12 @@ class NotaFiscal(models.Model):
         verbose_name_plural = "Notas Fiscais"
         # RESTRIÇÃO CHAVE: Garante que a NF-e não seja duplicada no mesmo manifesto
         indexes = [models.Index(fields=['chave_acesso'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['manifesto', 'chave_acesso'],
+                name='nota_unica_por_manifesto'
+            )
+        ]
 
 
 # 4. Histórico de Ocorrências (Rastreamento)
@@ -192,6 +251,8 @@ class BaixaNF(models.Model):
     
     comprovante_foto = models.ImageField(upload_to='comprovantes/', null=True, blank=True)
     comprovante_foto_url = models.CharField(max_length=500, null=True, blank=True)
+    # Versão reduzida da foto (histórico, telas do operacional e e-mails)
+    comprovante_miniatura_url = models.CharField(max_length=500, null=True, blank=True)
     
     # Vincula o código de ocorrência do TMS (o que o motorista escolheu no app)
     ocorrencia = models.ForeignKey(Ocorrencia, on_delete=models.SET_NULL, null=True, blank=True)
@@ -213,4 +274,113 @@ class BaixaNF(models.Model):
     
     class Meta:
         verbose_name = "Nota Fiscal Baixada"
-        verbose_name_plural = "Notas Fiscais Baixadas"
\ No newline at end of file
+        verbose_name_plural = "Notas Fiscais Baixadas"
+
+
+# 6. Fila de saída (outbox) da integração das baixas com a ESL
+class IntegracaoBaixaESL(models.Model):
+    """
+    Gravada na mesma transação da BaixaNF: se a baixa sofrer rollback, o envio some junto.
+    O `drenar_integracoes_esl_task` (beat) reserva lotes com SELECT ... FOR UPDATE SKIP LOCKED
+    e envia para a ESL, controlando tentativas e a próxima tentativa por linha.
+    Baixa com foto ainda não publicada fica em AGUARDANDO_UPLOAD até o `enviar_comprovante_task`
+    preencher a `comprovante_foto_url`.
+    """
+    STATUS_CHOICES = [
+        ('AGUARDANDO_UPLOAD', 'Aguardando upload da foto'),
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('ENVIADO', 'Enviado'),
+        ('ERRO', 'Erro definitivo'),
+    ]
+
+    baixa = models.OneToOneField(BaixaNF, on_delete=models.CASCADE, related_name='integracao_esl')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    reservado_em = models.DateTimeField(null=True, blank=True)
+    ultimo_erro = models.TextField(null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Integração da baixa {self.baixa_id} - {self.status}"
+
+    class Meta:
+        verbose_name = "Integração de Baixa (ESL)"
+        verbose_name_plural = "Integrações de Baixas (ESL)"
+        indexes = [models.Index(fields=['status', 'proxima_tentativa'])]
+
+
+# 7. Posição de leitura dos feeds paginados da ESL (after_id)
+class CursorESL(models.Model):
+    """Último id lido de um feed da ESL; permite retomar a ingestão de onde parou."""
+    nome = models.CharField(max_length=50, unique=True)
+    valor = models.CharField(max_length=50, null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nome}: {self.valor or '-'}"
+
+    class Meta:
+        verbose_name = "Cursor de Feed ESL"
+        verbose_name_plural = "Cursores de Feeds ESL"
+
+
+class OcorrenciaPendenteESL(models.Model):
+    """
+    Evento do feed cuja chave ainda não tem NotaFiscal local. Fica guardado aqui (o cursor já
+    passou dele) e vira HistoricoOcorrencia quando a nota chega numa sincronização.
+    Descartado depois de ESL_FEED_PENDENTES_DIAS.
+    """
+    chave_acesso = models.CharField(max_length=44, db_index=True)
+    codigo_tms = models.CharField(max_length=10)
+    data_ocorrencia = models.DateTimeField(null=True, blank=True)
+    comentarios = models.TextField(null=True, blank=True)
+    manifesto_evento = models.CharField(max_length=50)
+    recebido_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.chave_acesso}: Código {self.codigo_tms} em {self.data_ocorrencia}"
+
+    class Meta:
+        verbose_name = "Ocorrência Pendente (ESL)"
+        verbose_name_plural = "Ocorrências Pendentes (ESL)"
+        unique_together = ('chave_acesso', 'codigo_tms', 'data_ocorrencia')
+
+
+# 8. Fotos de comprovante endereçadas pelo conteúdo (sha256 do arquivo enviado pelo motorista)
+class ComprovanteArquivo(models.Model):
+    """
+    Uma linha por foto distinta. A mesma foto reenviada (nova tentativa, canhoto reaproveitado
+    em outra nota) acha a linha pelo hash e só ganha uma referência: nada é normalizado,
+    gravado ou enviado ao FTP de novo. No FTP e no disco o arquivo se chama `{sha256}.ext`.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    # Arquivo normalizado no storage local (MEDIA_ROOT)
+    caminho = models.CharField(max_length=255)
+    tamanho = models.PositiveIntegerField(default=0, verbose_name="Tamanho (bytes)")
+    url = models.CharField(max_length=500)
+    miniatura_url = models.CharField(max_length=500, null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]}… ({self.tamanho} bytes)"
+
+    class Meta:
+        verbose_name = "Arquivo de Comprovante"
+        verbose_name_plural = "Arquivos de Comprovantes"
+
+
+class ReferenciaComprovante(models.Model):
+    """Liga a baixa à foto (ComprovanteArquivo) que ela usa; várias baixas podem apontar para a mesma."""
+    baixa = models.OneToOneField(BaixaNF, on_delete=models.CASCADE, related_name='referencia_comprovante')
+    arquivo = models.ForeignKey(ComprovanteArquivo, on_delete=models.PROTECT, related_name='referencias')
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Baixa {self.baixa_id} -> {self.arquivo_id}"
+
+    class Meta:
+        verbose_name = "Referência de Comprovante"
+        verbose_name_plural = "Referências de Comprovantes"
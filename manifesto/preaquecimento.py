@@ -0,0 +1,130 @@
+# manifesto/preaquecimento.py
+# Pré-aquecimento: sincroniza pelo beat os manifestos do dia antes do motorista buscar no app
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core import travas
+from core.esl.cache import consultar_relatorio_cache
+from manifesto.services import chave_trava_sync
+
+
+def busca_manifestos_do_dia(data):
+    dia = data.strftime('%Y-%m-%d')
+    return {"manifests": {"service_date": f"{dia} - {dia}"}}
+
+
+def numero_do_registro(registro):
+    numero = registro.get('sequence_code') or registro.get('mft_sequence_code')
+    return str(numero).strip() if numero else None
+
+
+def cpf_do_registro(registro):
+    return ''.join(filter(str.isdigit, str(registro.get('mft_mdr_iil_document', ''))))
+
+
+def listar_manifestos_do_dia(data, max_paginas):
+    """
+    Relatório 2972 filtrado pela data de serviço.
+    Retorna {numero_manifesto: primeiro registro} (o relatório repete o manifesto por linha).
+    """
+    manifestos = {}
+    for pagina in range(1, max_paginas + 1):
+        registros = consultar_relatorio_cache(2972, busca_manifestos_do_dia(data), page=pagina, per=100)
+        for registro in registros:
+            numero = numero_do_registro(registro)
+            if numero:
+                manifestos.setdefault(numero, registro)
+        if len(registros) < 100:
+            break
+    return manifestos
+
+
+def motoristas_por_cpf(manifestos):
+    """{cpf: Motorista} dos CPFs presentes nos manifestos, numa consulta só."""
+    from usuarios.models import Motorista
+
+    cpfs = {cpf_do_registro(registro) for registro in manifestos.values()}
+    cpfs.discard('')
+    return {m.cpf: m for m in Motorista.objects.filter(cpf__in=cpfs)}
+
+
+def selecionar_para_preaquecer(manifestos, motoristas):
+    """
+    [(numero, motorista)] que valem uma sincronização agora. Fica de fora o manifesto sem motorista
+    cadastrado, o que o motorista já assumiu (status diferente de PREPARADO) e o pré-aquecido
+    há menos da metade de ESL_PREAQUECIMENTO_FRESCOR.
+    """
+    from manifesto.models import Manifesto
+
+    locais = {
+        m['numero_manifesto']: m
+        for m in Manifesto.objects.filter(numero_manifesto__in=list(manifestos))
+        .values('numero_manifesto', 'status', 'sincronizado_em')
+    }
+    renovar_antes = timezone.now() - timedelta(minutes=settings.ESL_PREAQUECIMENTO_FRESCOR / 2)
+
+    selecionados = []
+    for numero, registro in manifestos.items():
+        motorista = motoristas.get(cpf_do_registro(registro))
+        if motorista is None:
+            continue
+
+        local = locais.get(numero)
+        if local and local['status'] != 'PREPARADO':
+            continue
+        if local and local['sincronizado_em'] and local['sincronizado_em'] >= renovar_antes:
+            continue
+        selecionados.append((numero, motorista))
+    return selecionados
+
+
+def reservar_logs(selecionados):
+    """
+    Cria/reaproveita o ManifestoBuscaLog (origem PREAQUECIMENTO) de cada manifesto e pega a
+    trava single-flight em nome dele. Manifesto com sincronização já rodando fica para o próximo ciclo.
+    Retorna os ids dos logs reservados.
+    """
+    from manifesto.models import ManifestoBuscaLog
+
+    log_ids = []
+    for numero, motorista in selecionados:
+        log, criado = ManifestoBuscaLog.objects.get_or_create(
+            numero_manifesto=numero, motorista=motorista,
+            defaults={'origem': 'PREAQUECIMENTO'},
+        )
+        if not criado and log.origem != 'PREAQUECIMENTO':
+            # O motorista já buscou este número: a sincronização é dele
+            continue
+
+        adquiriu, _ = travas.adquirir(chave_trava_sync(numero), log.id, settings.ESL_SYNC_TRAVA_TTL)
+        if not adquiriu:
+            continue
+
+        log.status, log.mensagem_erro = 'AGUARDANDO', None
+        log.notas_total = log.notas_processadas = 0
+        log.save(update_fields=['status', 'mensagem_erro', 'notas_total', 'notas_processadas'])
+        log_ids.append(log.id)
+    return log_ids
+
+
+def preaquecer(data=None):
+    """
+    Lê os manifestos do dia no 2972, casa com os motoristas pelo CPF e reserva os logs.
+    Retorna (log_ids a sincronizar, resumo).
+    """
+    data = data or timezone.localdate()
+
+    manifestos = listar_manifestos_do_dia(data, settings.ESL_PREAQUECIMENTO_MAX_PAGINAS)
+    motoristas = motoristas_por_cpf(manifestos)
+    selecionados = selecionar_para_preaquecer(manifestos, motoristas)
+    log_ids = reservar_logs(selecionados)
+
+    resumo = {
+        'data': str(data),
+        'manifestos': len(manifestos),
+        'com_motorista': sum(1 for r in manifestos.values() if cpf_do_registro(r) in motoristas),
+        'disparados': len(log_ids),
+    }
+    return log_ids, resumo
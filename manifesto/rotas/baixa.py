@@ -3,48 +3,30 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
-from manifesto.models import NotaFiscal, BaixaNF, Ocorrencia
+from manifesto.models import NotaFiscal, BaixaNF, Ocorrencia, ReferenciaComprovante
 from django.db import transaction
-from manifesto.tasks import enviar_baixa_esl_task
-from ftplib import FTP
-from io import BytesIO
-from django.conf import settings # Importe para usar as chaves do settings
-
-def upload_via_ftp(imagem_bytes, nome_arquivo):
-    try:
-        from django.conf import settings
-        from ftplib import FTP
-        from io import BytesIO
-
-        ftp = FTP(settings.FTP_HOST)
-        ftp.login(user=settings.FTP_USER, passwd=settings.FTP_PASS)
-        
-        # CAMINHO AJUSTADO conforme seu print/link:
-        caminho_ftp = 'domains/st63136.ispot.cc/public_html/uploads/comprovantes-quickdelivery'
-        
-        try:
-            ftp.cwd(caminho_ftp)
-        except:
-            # Caso o caminho acima não funcione de primeira, tenta o caminho curto
-            # (Alguns servidores FTP já logam direto na public_html)
-            ftp.cwd('public_html/uploads/comprovantes-quickdelivery')
-
-        ftp.storbinary(f"STOR {nome_arquivo}", BytesIO(imagem_bytes))
-        ftp.quit()
-
-        return f"{settings.FTP_BASE_URL}{nome_arquivo}"
-    except Exception as e:
-        print(f"Erro no Upload FTP: {e}")
-        return None
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from manifesto.integracao_esl import enfileirar_baixa
+from manifesto.comprovantes import arquivo_por_hash, vincular_arquivo
+from core.uploads import ImagemUploadHandler
 
 class RegistrarBaixaView(APIView):
     permission_classes = [IsAuthenticated] 
     parser_classes = (MultiPartParser, FormParser)
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Foto direto para arquivo temporário em disco, validada (tipo e tamanho) enquanto chega
+        request.upload_handlers = [ImagemUploadHandler(request), TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
         chave_acesso = request.data.get('chave_acesso')
         codigo_tms = request.data.get('ocorrencia_codigo')
         foto_arquivo = request.FILES.get('foto')
+
+        rejeicao = getattr(request, 'upload_rejeitado', None)
+        if rejeicao:
+            return Response({'erro': str(rejeicao)}, status=rejeicao.status)
         
         # Este valor vindo do JS é o número visual (ex: 56892)
         numero_mft = request.data.get('manifesto_id') 
@@ -68,20 +50,15 @@ class RegistrarBaixaView(APIView):
 
                 ocorrencia = Ocorrencia.objects.get(codigo_tms=codigo_tms) 
 
-                # --- LÓGICA DE UPLOAD EXTERNO ---
-                url_final_foto = None
-                if foto_arquivo:
-                    # Usamos o ID da nota para garantir que a foto de hoje não apague a de ontem no FTP
-                    nome_arquivo = f"{nf.id}_{chave_acesso}.jpg"
-                    url_final_foto = upload_via_ftp(foto_arquivo.read(), nome_arquivo)
-
                 # --- REGISTRO DA BAIXA ---
                 baixa, created = BaixaNF.objects.update_or_create(
                     nota_fiscal=nf,
                     defaults={
                         'tipo': 'ENTREGA' if ocorrencia.tipo == 'ENTREGA' else 'OCORRENCIA',
                         'ocorrencia': ocorrencia,
-                        'comprovante_foto_url': url_final_foto, 
+                        'comprovante_foto': None,
+                        'comprovante_foto_url': None,
+                        'comprovante_miniatura_url': None,
                         'recebedor': request.data.get('recebedor'),
                         'latitude': request.data.get('latitude'),
                         'longitude': request.data.get('longitude'),
@@ -89,11 +66,23 @@ class RegistrarBaixaView(APIView):
                     }
                 )
 
+                # --- FOTO ---
+                # Mesma foto já publicada (reenvio, canhoto repetido): só aponta para ela, sem disco nem FTP
+                arquivo_conhecido = arquivo_por_hash((getattr(request, 'sha256_upload', None) or {}).get('foto')) if foto_arquivo else None
+                if arquivo_conhecido:
+                    vincular_arquivo(baixa, arquivo_conhecido)
+                else:
+                    ReferenciaComprovante.objects.filter(baixa=baixa).delete()
+                    if foto_arquivo:
+                        # Só grava no disco; o upload para o FTP roda no worker depois do commit
+                        baixa.comprovante_foto.save(f"{nf.id}_{chave_acesso}.jpg", foto_arquivo, save=True)
+
                 nf.status = 'BAIXADA' if baixa.tipo == 'ENTREGA' else 'OCORRENCIA'
                 nf.save()
                 
-                # Descomente para integrar com ESL
-                enviar_baixa_esl_task.delay(baixa.id)
+                # Integração com ESL: entra na fila de saída na mesma transação
+                # (com foto, espera o upload terminar antes de ir para a ESL)
+                enfileirar_baixa(baixa)
 
             return Response({'status': 'sucesso', 'mensagem': 'Baixa registrada com sucesso!'})
 
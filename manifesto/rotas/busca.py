@@ -3,11 +3,14 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from manifesto.models import Manifesto, ManifestoBuscaLog
-from manifesto.tasks import buscar_manifesto_completo_task
+from manifesto.models import Manifesto
+from manifesto.services import solicitar_sincronizacao, montar_status
+import logging
 import requests
 import json
 
+logger = logging.getLogger(__name__)
+
 # manifesto/rotas/busca.py
 
 class BuscarManifestoView(APIView):
@@ -20,16 +23,12 @@ class BuscarManifestoView(APIView):
         if not numero:
             return Response({'erro': 'Número do manifesto é obrigatório'}, status=400)
 
-        log, _ = ManifestoBuscaLog.objects.update_or_create(
-            numero_manifesto=numero,
-            motorista=motorista,
-            defaults={
-                'status': 'AGUARDANDO',
-                'mensagem_erro': None,
-                'payload': None
-            }
-        )
-        print( "Disparando task de busca de manifesto para preview..." )
-        buscar_manifesto_completo_task.delay(log.id)
+        # Toques repetidos entram na sincronização que já está rodando em vez de enfileirar outra
+        log, situacao = solicitar_sincronizacao(numero, motorista, limpar_payload=True)
+        if situacao == 'OCUPADO':
+            return Response({'erro': 'Manifesto em sincronização por outro motorista.'}, status=409)
+        if situacao == 'CONFLITO':
+            return Response({'erro': log.mensagem_erro}, status=409)
 
-        return Response({'status': 'AGUARDANDO'}, status=202)
\ No newline at end of file
+        logger.info(f"Busca do manifesto {numero} para preview: {situacao}")
+        return Response({**montar_status(log), 'sincronizacao': situacao}, status=202)
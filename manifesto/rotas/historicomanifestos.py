@@ -58,6 +58,7 @@ class HistoricoManifestosView(views.APIView):
                             else (ultima_ocorrencia.comentarios if ultima_ocorrencia else "Sem observações.")
                         ),
                         "foto_comprovante": baixa.comprovante_foto_url if baixa else None,
+                        "miniatura_comprovante": baixa.comprovante_miniatura_url if baixa else None,
                         "recebedor": baixa.recebedor if baixa and baixa.recebedor else "Não informado",
                         "data_baixa": (
                             baixa.data_baixa.strftime('%d/%m/%Y %H:%M') if baixa 
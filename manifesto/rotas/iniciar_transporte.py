@@ -4,7 +4,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
 from manifesto.models import Manifesto, ManifestoBuscaLog
-from manifesto.tasks import buscar_manifesto_completo_task
+from manifesto.services import solicitar_sincronizacao
 
 class IniciarTransporteView(APIView):
     def post(self, request):
@@ -25,11 +25,7 @@ class IniciarTransporteView(APIView):
                 status='EM_TRANSPORTE'
             )
             
-            # 3. Avisa o log que estamos processando
-            log.status = 'AGUARDANDO'
-            log.save()
-
-            # 4. Chama a Task unificada passando os dois IDs
-            buscar_manifesto_completo_task.delay(log.id, manifesto.id)
+            # 3. Chama a Task unificada passando os dois IDs (uma por manifesto: single-flight)
+            solicitar_sincronizacao(numero, motorista, manifesto_id=manifesto.id)
 
         return Response({'status': 'sucesso', 'manifesto_id': manifesto.id})
\ No newline at end of file
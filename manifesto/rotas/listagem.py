@@ -20,6 +20,8 @@ class ListarNotasManifestoView(APIView):
                 'destinatario': nf.destinatario,
                 'endereco_entrega': nf.endereco_entrega,
                 'status': nf.status,
+                # Nota do preview: destinatário/endereço ainda chegando da ESL
+                'enriquecimento_pendente': nf.enriquecimento_pendente,
                 'ja_baixada': baixa is not None, 
                 'dados_baixa': {
                     'tipo': baixa.tipo,
@@ -29,6 +31,7 @@ class ListarNotasManifestoView(APIView):
                     # Formatando a data com o fuso de Brasília que configuramos
                     'data': baixa.data_baixa.strftime('%d/%m/%Y %H:%M') if baixa.data_baixa else None,
                     'foto_url': baixa.comprovante_foto_url if baixa.comprovante_foto_url else None,
+                    'miniatura_url': baixa.comprovante_miniatura_url,
                     'lat': float(baixa.latitude) if baixa.latitude else None,
                     'lng': float(baixa.longitude) if baixa.longitude else None
                 } if baixa else None
@@ -2,8 +2,7 @@ from rest_framework import views, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from manifesto.models import ManifestoBuscaLog
-from manifesto.tasks import buscar_manifesto_completo_task
+from manifesto.services import solicitar_sincronizacao
 from usuarios.models import Motorista  # Importação necessária para a busca
 
 class SincronizarManifestoView(views.APIView):
@@ -23,20 +22,16 @@ class SincronizarManifestoView(views.APIView):
             except Motorista.DoesNotExist:
                 return Response({"erro": "Perfil de motorista não encontrado para este usuário."}, status=403)
 
-            # 2. Buscamos o Log existente ou criamos um novo
-            # O status 'AGUARDANDO' é o que sua Task espera para começar
-            log, created = ManifestoBuscaLog.objects.update_or_create(
-                numero_manifesto=numero_manifesto,
-                motorista=motorista,
-                defaults={'status': 'AGUARDANDO', 'mensagem_erro': None}
-            )
-
-            # 3. Disparamos a Task no Celery
-            buscar_manifesto_completo_task.delay(log.id)
+            # 2. Enfileira a Task no Celery (ou entra na sincronização que já está rodando).
+            # Atualização pedida pelo motorista: vai à ESL mesmo dentro da janela de frescor
+            log, situacao = solicitar_sincronizacao(numero_manifesto, motorista, forcar=True)
+            if situacao == 'OCUPADO':
+                return Response({"erro": "Manifesto em sincronização por outro motorista."}, status=status.HTTP_409_CONFLICT)
 
             return Response({
                 "mensagem": "Sincronização iniciada. Verifique as notas em alguns instantes.",
-                "status": log.status
+                "status": log.status,
+                "sincronizacao": situacao
             }, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
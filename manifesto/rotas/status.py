@@ -3,6 +3,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from manifesto.models import ManifestoBuscaLog
+from manifesto.services import montar_status
 
 class StatusBuscaManifestoView(APIView):
     permission_classes = [IsAuthenticated]
@@ -22,9 +23,5 @@ class StatusBuscaManifestoView(APIView):
         if not log:
             return Response({'status': 'AGUARDANDO'})
 
-        # O segredo está aqui: retornar exatamente o que o JS espera
-        return Response({
-            'status': log.status,
-            'payload': log.payload,
-            'mensagem_erro': log.mensagem_erro
-        })
\ No newline at end of file
+        # O segredo está aqui: retornar exatamente o que o JS espera (o WebSocket manda o mesmo formato)
+        return Response(montar_status(log))
@@ -0,0 +1,722 @@
+# manifesto/services.py
+# Funções de apoio da sincronização de manifestos com a ESL (sem estado de task)
+import calendar
+import logging
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+
+from core import travas
+from core.chave_nfe import decodificar, decodificar_lote, limpar
+from core.esl import cliente as esl
+from core.esl.cache import consultar_relatorio_cache
+from core.esl.limitador import LimiteESLExcedido
+
+logger = logging.getLogger(__name__)
+
+DESTINATARIO_PADRAO = "DADOS NÃO REPASSADOS PELA ESL"
+ENDERECO_PADRAO = "CONSULTE O DOCUMENTO FÍSICO"
+# Textos do esqueleto da nota enquanto o enriquecimento não chega
+DESTINATARIO_PENDENTE = "CARREGANDO DADOS DA ESL..."
+ENDERECO_PENDENTE = "CARREGANDO ENDEREÇO..."
+
+
+# =====================================================
+# PROGRESSO DA SINCRONIZAÇÃO (WebSocket do app)
+# =====================================================
+
+def montar_status(log):
+    """Mesmo formato devolvido por StatusBuscaManifestoView e enviado pelo WebSocket."""
+    return {
+        'numero_manifesto': log.numero_manifesto,
+        'status': log.status,
+        'payload': log.payload,
+        'mensagem_erro': log.mensagem_erro,
+        'progresso': {
+            'processadas': log.notas_processadas,
+            'total': log.notas_total,
+        }
+    }
+
+
+def publicar_progresso(log):
+    """
+    Envia o estado atual do log para o grupo do motorista (ManifestoConsumer).
+    Falha no channel layer não interrompe a sincronização: o app ainda consulta o status por HTTP.
+    """
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            f"manifesto_{log.motorista_id}",
+            {"type": "manifesto.update", "data": montar_status(log)},
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível publicar o progresso do manifesto {log.numero_manifesto}: {e}")
+
+
+# =====================================================
+# DISPARO DA SINCRONIZAÇÃO (single-flight por manifesto)
+# =====================================================
+
+def chave_trava_sync(numero_manifesto):
+    return f"manifesto:sync:{numero_manifesto}"
+
+
+def sincronizado_recentemente(numero_manifesto, motorista):
+    """
+    True se o manifesto do motorista foi sincronizado dentro de ESL_SYNC_JANELA_FRESCOR.
+    Manifesto pré-aquecido (PREPARADO) vale por ESL_PREAQUECIMENTO_FRESCOR: o beat o mantém em dia.
+    """
+    from manifesto.models import Manifesto
+
+    agora = timezone.now()
+    janela = Q(sincronizado_em__gte=agora - timedelta(minutes=settings.ESL_SYNC_JANELA_FRESCOR))
+    janela_preparado = Q(
+        status='PREPARADO',
+        sincronizado_em__gte=agora - timedelta(minutes=settings.ESL_PREAQUECIMENTO_FRESCOR),
+    )
+    if settings.ESL_SYNC_JANELA_FRESCOR <= 0:
+        janela = Q(pk__in=[])
+    if settings.ESL_PREAQUECIMENTO_FRESCOR <= 0:
+        janela_preparado = Q(pk__in=[])
+
+    return Manifesto.objects.filter(
+        janela | janela_preparado,
+        numero_manifesto=numero_manifesto,
+        motorista=motorista,
+    ).exists()
+
+
+def manifesto_em_transporte(motorista, exceto=None):
+    """Número do manifesto EM_TRANSPORTE do motorista (fora `exceto`), ou None."""
+    from manifesto.models import Manifesto
+
+    return (
+        Manifesto.objects
+        .filter(motorista=motorista, status='EM_TRANSPORTE')
+        .exclude(numero_manifesto=exceto)
+        .values_list('numero_manifesto', flat=True)
+        .first()
+    )
+
+
+def ativar_manifesto(numero_manifesto, motorista):
+    """
+    Manifesto pré-aquecido passa a EM_TRANSPORTE quando o motorista o busca no app.
+    Só um manifesto em transporte por motorista: se já houver outro, este continua PREPARADO
+    e o número do outro é devolvido. Retorna None quando não há conflito.
+    """
+    from manifesto.models import Manifesto
+
+    preparado = Manifesto.objects.filter(
+        numero_manifesto=numero_manifesto,
+        motorista=motorista,
+        status='PREPARADO',
+    )
+    if not preparado.exists():
+        return None
+    outro = manifesto_em_transporte(motorista, exceto=numero_manifesto)
+    if outro:
+        return outro
+    try:
+        with transaction.atomic():
+            preparado.update(status='EM_TRANSPORTE')
+    except IntegrityError:
+        # Outro manifesto entrou em transporte entre a consulta e o update
+        return manifesto_em_transporte(motorista, exceto=numero_manifesto) or '?'
+    return None
+
+
+def mensagem_conflito_transporte(numero_em_transporte):
+    return f"Você já tem o manifesto {numero_em_transporte} em transporte. Finalize-o antes de iniciar outro."
+
+
+def solicitar_sincronizacao(numero_manifesto, motorista, manifesto_id=None, completo=False, limpar_payload=False,
+                            forcar=False):
+    """
+    Ponto único para enfileirar `buscar_manifesto_completo_task`.
+    `forcar` (botão Sincronizar/Atualizar do app) ignora a janela de frescor, mas continua
+    incremental; `completo` também ignora e ainda refaz a paginação do início.
+    Retorna (log, situacao):
+      'DISPARADA'    -> nova sincronização enfileirada;
+      'EM_ANDAMENTO' -> já existe uma sincronização deste manifesto rodando (log é o dela);
+      'RECENTE'      -> sincronizado há pouco, servido com os dados locais (log já PROCESSADO);
+      'OCUPADO'      -> outro motorista está sincronizando este número agora;
+      'CONFLITO'     -> o motorista já tem outro manifesto em transporte (log em ERRO com o motivo).
+    """
+    from manifesto.models import ManifestoBuscaLog
+    from manifesto.tasks import buscar_manifesto_completo_task
+
+    log, _ = ManifestoBuscaLog.objects.get_or_create(numero_manifesto=numero_manifesto, motorista=motorista)
+
+    # Busca do motorista "assume" o log pré-aquecido: ao terminar, o manifesto é ativado
+    if log.origem != 'APP':
+        log.origem = 'APP'
+        log.save(update_fields=['origem'])
+
+    if not (completo or forcar) and sincronizado_recentemente(numero_manifesto, motorista):
+        em_transporte = ativar_manifesto(numero_manifesto, motorista)
+        if em_transporte:
+            log.status, log.mensagem_erro = 'ERRO', mensagem_conflito_transporte(em_transporte)
+            log.save(update_fields=['status', 'mensagem_erro'])
+            publicar_progresso(log)
+            return log, 'CONFLITO'
+        log.status, log.mensagem_erro = 'PROCESSADO', None
+        log.save(update_fields=['status', 'mensagem_erro'])
+        publicar_progresso(log)
+        return log, 'RECENTE'
+
+    adquiriu, dono = travas.adquirir(chave_trava_sync(numero_manifesto), log.id, settings.ESL_SYNC_TRAVA_TTL)
+    if not adquiriu:
+        em_andamento = ManifestoBuscaLog.objects.filter(id=dono).first()
+        if em_andamento is None or em_andamento.motorista_id == motorista.id:
+            return em_andamento or log, 'EM_ANDAMENTO'
+        return log, 'OCUPADO'
+
+    log.status, log.mensagem_erro = 'AGUARDANDO', None
+    log.notas_total = log.notas_processadas = 0
+    campos = ['status', 'mensagem_erro', 'notas_total', 'notas_processadas']
+    if limpar_payload:
+        log.payload = None
+        campos.append('payload')
+    log.save(update_fields=campos)
+
+    buscar_manifesto_completo_task.delay(log.id, manifesto_id, completo)
+    return log, 'DISPARADA'
+
+
+def liberar_sincronizacao(log):
+    travas.liberar(chave_trava_sync(log.numero_manifesto), log.id)
+
+
+# =====================================================
+# ETAPA 1: CABEÇALHO DO MANIFESTO (relatório 2972)
+# =====================================================
+
+def busca_cabecalho(numero_manifesto):
+    return {
+        "manifests": {
+            "sequence_code": int(numero_manifesto),
+            "service_date": "2024-01-01 - 2050-12-31"
+        }
+    }
+
+
+def validar_cabecalho(dados_mft, motorista):
+    """Retorna a mensagem de erro para o log, ou None se o manifesto é do motorista."""
+    if not dados_mft:
+        return "Manifesto não encontrado."
+
+    # Validação de CPF (primeiro registro retornado)
+    cpf_tms = str(dados_mft[0].get('mft_mdr_iil_document', '')).strip()
+    if cpf_tms != str(motorista.cpf).replace('.','').replace('-',''):
+        return "Manifesto não pertence ao seu CPF."
+    return None
+
+
+def registrar_manifesto_local(numero_manifesto, motorista, info_tms, preparar=False):
+    """
+    Cria/atualiza filial e manifesto local a partir do cabeçalho. Retorna (manifesto, nome_filial).
+    Com `preparar` (pré-aquecimento) o manifesto novo nasce PREPARADO e um já existente mantém o status.
+    """
+    from manifesto.models import Manifesto
+    from usuarios.models import Filial
+
+    nome_filial_tms = info_tms.get('mft_crn_psn_nickname', 'MATRIZ').strip().upper()
+    
+    # Busca a filial pelo nome, se não existir, cria
+    filial_obj, created = Filial.objects.get_or_create(
+        nome=nome_filial_tms
+    )
+    if created:
+        logger.info(f"🏢 Nova Filial cadastrada: {nome_filial_tms}")
+
+    if preparar:
+        manifesto_obj, _ = Manifesto.objects.get_or_create(
+            numero_manifesto=numero_manifesto,
+            defaults={'motorista': motorista, 'filial': filial_obj, 'status': 'PREPARADO'}
+        )
+        return manifesto_obj, nome_filial_tms
+
+    # Criar/Recuperar Manifesto Local (Incluindo a Filial)
+    manifesto_obj, _ = Manifesto.objects.update_or_create(
+        numero_manifesto=numero_manifesto,
+        defaults={
+            'motorista': motorista, 
+            'filial': filial_obj, # Vinculando a Filial aqui
+            'status': 'EM_TRANSPORTE'
+        }
+    )
+    return manifesto_obj, nome_filial_tms
+
+
+# =====================================================
+# ETAPA 2: CHAVES DAS NOTAS (invoice_occurrences)
+# =====================================================
+
+def params_paginacao(id_interno_esl, cursor):
+    params = {"manifest_id": id_interno_esl, "per": 20}
+    if cursor:
+        params["start"] = cursor
+    return params
+
+
+def extrair_notas_da_pagina(registros, destino):
+    for item in registros:
+        invoice = item.get("invoice")
+        if invoice and invoice.get("key"):
+            # Sem número no feed, ele sai da própria chave
+            numero = invoice.get("number")
+            if not numero:
+                dados_chave = decodificar(invoice["key"])
+                numero = dados_chave.numero if dados_chave else ''
+            destino[invoice["key"]] = numero
+
+
+def aproveitar_ocorrencias(registros):
+    """
+    As páginas do manifesto já são ocorrências: grava o histórico delas (as de notas que ainda
+    não existem ficam pendentes) e semeia o cursor do feed. Falha aqui não derruba a sincronização.
+    """
+    from manifesto.historico_esl import gravar_eventos, semear_cursor_feed
+
+    try:
+        gravar_eventos(registros)
+        semear_cursor_feed(registros)
+    except Exception as e:
+        logger.warning(f"⚠️ Ocorrências da paginação não gravadas: {e}")
+
+
+def paginar_notas_manifesto(id_interno_esl, start_cursor=None):
+    """
+    Percorre /api/invoice_occurrences do manifesto a partir de `start_cursor`.
+    Os eventos lidos vão para o histórico (`aproveitar_ocorrencias`).
+    Retorna ({chave: numero}, cursor da última página lida).
+    """
+    notas = {}
+    registros = []
+    ultimo_cursor = start_cursor
+
+    while True:
+        res_n = esl.listar_ocorrencias(params_paginacao(id_interno_esl, start_cursor))
+        if res_n.status_code != 200: break
+
+        data_n = res_n.json()
+        paging = data_n.get("paging", {})
+        ultimo_cursor = start_cursor
+        registros.extend(data_n.get("data", []))
+        extrair_notas_da_pagina(data_n.get("data", []), notas)
+
+        if paging.get("next_id") is None: break
+        start_cursor = paging["next_id"]
+
+    aproveitar_ocorrencias(registros)
+    return notas, ultimo_cursor
+
+
+def salvar_cursor(manifesto, id_interno_esl, ultimo_cursor):
+    manifesto.esl_id = id_interno_esl
+    manifesto.esl_cursor = str(ultimo_cursor) if ultimo_cursor else None
+    manifesto.save(update_fields=['esl_id', 'esl_cursor'])
+
+
+def filtrar_nao_enriquecidas(manifesto, notas):
+    """
+    Mantém só as notas novas ou que ficaram sem dados da ESL, e soma as notas do manifesto
+    ainda pendentes/com o texto padrão que estão em páginas antes do cursor (bloco que
+    desistiu, consulta que falhou): a paginação incremental não volta a lê-las.
+    """
+    from manifesto.models import NotaFiscal
+
+    ja_enriquecidas = set(
+        NotaFiscal.objects
+        .filter(manifesto=manifesto, chave_acesso__in=list(notas), enriquecimento_pendente=False)
+        .exclude(destinatario=DESTINATARIO_PADRAO)
+        .values_list('chave_acesso', flat=True)
+    )
+    selecionadas = {chave: numero for chave, numero in notas.items() if chave not in ja_enriquecidas}
+
+    sem_dados = (
+        NotaFiscal.objects
+        .filter(manifesto=manifesto)
+        .filter(Q(enriquecimento_pendente=True) | Q(destinatario=DESTINATARIO_PADRAO))
+        .exclude(chave_acesso__in=list(notas))
+        .values_list('chave_acesso', 'numero_nota')
+    )
+    for chave, numero in sem_dados:
+        selecionadas[chave] = numero
+    return selecionadas
+
+
+# =====================================================
+# PREVIEW: CABEÇALHO + ESQUELETO DAS NOTAS
+# =====================================================
+
+def registrar_esqueletos(manifesto, notas):
+    """
+    Grava as notas novas só com chave e número (enriquecimento_pendente=True), para o app
+    já listar o manifesto. Notas que já existem não são tocadas.
+    """
+    from manifesto.models import NotaFiscal
+
+    NotaFiscal.objects.bulk_create(
+        [
+            NotaFiscal(
+                manifesto=manifesto,
+                chave_acesso=chave,
+                numero_nota=str(numero),
+                destinatario=DESTINATARIO_PENDENTE,
+                endereco_entrega=ENDERECO_PENDENTE,
+                status='PENDENTE',
+                enriquecimento_pendente=True,
+            )
+            for chave, numero in notas.items()
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def montar_preview(manifesto, nome_filial, info_tms):
+    """Payload do preview: cabeçalho do 2972, filial e todas as chaves/números do manifesto."""
+    from manifesto.models import NotaFiscal
+
+    notas = list(
+        NotaFiscal.objects
+        .filter(manifesto=manifesto)
+        .order_by('id')
+        .values('chave_acesso', 'numero_nota')
+    )
+    return {
+        'manifesto': {
+            'numero_manifesto': manifesto.numero_manifesto,
+            'id_esl': info_tms.get('id'),
+            'filial': nome_filial,
+            'cabecalho': info_tms,
+        },
+        'notas': notas,
+        'total_notas': len(notas),
+    }
+
+
+def publicar_preview(log, manifesto, nome_filial, info_tms, notas):
+    """
+    Fase 1 da sincronização: esqueletos gravados e preview no log (PRONTO_PREVIEW).
+    `notas` são as que ainda vão ser enriquecidas; o progresso conta só elas.
+    """
+    from manifesto.historico_esl import aplicar_pendentes
+
+    registrar_esqueletos(manifesto, notas)
+    # Eventos que chegaram antes das notas (feed ou paginação) entram no histórico agora
+    aplicar_pendentes(notas)
+    log.payload = montar_preview(manifesto, nome_filial, info_tms)
+    log.status = 'PRONTO_PREVIEW'
+    log.notas_total, log.notas_processadas = len(notas), 0
+    log.save(update_fields=['payload', 'status', 'notas_total', 'notas_processadas'])
+    publicar_progresso(log)
+
+
+# =====================================================
+# ETAPA 3: ENRIQUECIMENTO (relatório 9873) E GRAVAÇÃO
+# =====================================================
+
+def busca_nota(numero, chave=None):
+    """Busca do 9873 por número; com a chave válida, restrita ao mês de emissão codificado nela."""
+    dados_chave = decodificar(chave) if chave else None
+    return {
+        "invoices": {
+            "issue_date": (
+                _janela_emissao(dados_chave.ano, dados_chave.mes) if dados_chave
+                else "2024-01-01 - 2050-12-31"
+            ),
+            "number": int(numero)
+        }
+    }
+
+
+def buscar_detalhes_esl_interno(chave, numero):
+    """Auxiliar para buscar endereço no Endpoint 3"""
+    try:
+        for nf in consultar_relatorio_cache(9873, busca_nota(numero, chave)):
+            if nf.get('key') == chave: return nf
+    except LimiteESLExcedido:
+        raise
+    except Exception:
+        pass
+    return None
+
+
+def _janela_emissao(ano, mes):
+    ultimo_dia = calendar.monthrange(ano, mes)[1]
+    return f"{ano:04d}-{mes:02d}-01 - {ano:04d}-{mes:02d}-{ultimo_dia:02d}"
+
+
+def busca_lote(ano, mes, cnpj_emitente):
+    """Busca do 9873 por mês de emissão e emitente (os dois saem da chave)."""
+    return {"invoices": {"issue_date": _janela_emissao(ano, mes), "issuer_document": cnpj_emitente}}
+
+
+def agrupar_por_emitente(notas):
+    """
+    {(ano, mes, cnpj): {chaves}} só com os grupos que compensam paginar (ESL_ENRIQUECIMENTO_LOTE_MINIMO).
+    O emitente restringe a consulta às notas dele no mês, e não ao mês inteiro do tenant.
+    """
+    grupos = defaultdict(set)
+    for chave, dados_chave in decodificar_lote(notas).items():
+        if dados_chave:
+            grupos[(dados_chave.ano, dados_chave.mes, dados_chave.cnpj)].add(chave)
+    return {grupo: chaves for grupo, chaves in grupos.items() if len(chaves) >= settings.ESL_ENRIQUECIMENTO_LOTE_MINIMO}
+
+
+def casar_pagina(registros, pendentes, encontrados):
+    """Move para `encontrados` as chaves pendentes que aparecem na página do 9873."""
+    for nf in registros:
+        chave = nf.get('key')
+        if chave in pendentes:
+            encontrados[chave] = nf
+            pendentes.discard(chave)
+
+
+def paginas_do_lote(chaves):
+    """
+    Teto de páginas para um grupo: no máximo metade das consultas individuais que ele substitui
+    (e ESL_ENRIQUECIMENTO_LOTE_MAX_PAGINAS). Mesmo que nenhuma página case, o grupo custa no
+    máximo 1,5x o modo nota a nota; as páginas ficam no cache e os outros blocos as reaproveitam.
+    """
+    return min(settings.ESL_ENRIQUECIMENTO_LOTE_MAX_PAGINAS, max(1, len(chaves) // 2))
+
+
+def enriquecer_notas_em_lote(notas):
+    """
+    Recebe {chave: numero} e devolve {chave: registro do relatório 9873}.
+
+    Em vez de uma consulta por nota, agrupa as chaves por mês de emissão e CNPJ do emitente
+    e pagina o relatório daquele emitente no mês (per=100), casando as chaves localmente.
+    Cada grupo lê no máximo `paginas_do_lote` páginas.
+    O que não aparecer nas páginas (ou grupos com poucas notas) vai pela consulta individual.
+    """
+    por_pagina = settings.ESL_ENRIQUECIMENTO_LOTE_POR_PAGINA
+
+    encontrados = {}
+    for (ano, mes, cnpj), chaves in agrupar_por_emitente(notas).items():
+        pendentes = set(chaves)
+        search = busca_lote(ano, mes, cnpj)
+        for pagina in range(1, paginas_do_lote(chaves) + 1):
+            registros = consultar_relatorio_cache(9873, search, page=pagina, per=por_pagina)
+            casar_pagina(registros, pendentes, encontrados)
+            if not pendentes or len(registros) < por_pagina:
+                break
+
+        logger.info(f"📦 Lote {mes:02d}/{ano} emitente {cnpj}: {len(chaves) - len(pendentes)}/{len(chaves)} notas casadas em {pagina} página(s)")
+
+    for chave, numero in notas.items():
+        if chave not in encontrados:
+            detalhes = buscar_detalhes_esl_interno(chave, numero)
+            if detalhes:
+                encontrados[chave] = detalhes
+
+    return encontrados
+
+
+def enriquecer_notas(notas):
+    """{chave: numero} -> {chave: detalhes}, no modo configurado em ESL_ENRIQUECIMENTO_MODO."""
+    if settings.ESL_ENRIQUECIMENTO_MODO == 'lote':
+        return enriquecer_notas_em_lote(notas)
+
+    encontrados = {}
+    for chave, numero in notas.items():
+        detalhes = buscar_detalhes_esl_interno(chave, numero)
+        if detalhes:
+            encontrados[chave] = detalhes
+    return encontrados
+
+
+def montar_dados_nota(detalhes):
+    """Extrai (destinatario, endereco) do registro do 9873, com os textos padrão quando faltar."""
+    destinatario = DESTINATARIO_PADRAO
+    endereco = ENDERECO_PADRAO
+
+    if detalhes:
+        nome_det = detalhes.get('ioe_rpt_name') or detalhes.get('receiver_name')
+        if nome_det: destinatario = str(nome_det).upper()
+
+        rua = detalhes.get('ioe_rpt_mds_line_1', '')
+        num = detalhes.get('ioe_rpt_mds_number', '')
+        if rua:
+            endereco = f"{rua} {num}".strip().upper()
+        elif detalhes.get('receiver_address'):
+            endereco = str(detalhes['receiver_address']).strip().upper()
+
+    return destinatario, endereco
+
+
+# =====================================================
+# CADASTRO DE NF-e (consultado antes da ESL)
+# =====================================================
+
+def _opcoes_upsert(*unique_fields):
+    # MySQL (ON DUPLICATE KEY UPDATE) não aceita informar o alvo do conflito; Postgres/SQLite exigem
+    if connection.features.supports_update_conflicts_with_target:
+        return {'unique_fields': list(unique_fields)}
+    return {}
+
+
+def carregar_cadastro(chaves):
+    """{chave: NFe} das chaves que já estão no cadastro."""
+    from manifesto.models import NFe
+    return {nfe.chave_acesso: nfe for nfe in NFe.objects.filter(chave_acesso__in=list(chaves))}
+
+
+def nfe_vigente(nfe, limite=None):
+    """
+    NF-e do cadastro que dispensa a ESL: com destinatário e endereço de verdade (não os textos
+    padrão de quando a ESL não repassou os dados) e atualizada depois de `limite`.
+    """
+    return (
+        nfe is not None
+        and nfe.destinatario != DESTINATARIO_PADRAO
+        and nfe.endereco_entrega != ENDERECO_PADRAO
+        and (limite is None or nfe.atualizado_em >= limite)
+    )
+
+
+def limite_validade_cadastro():
+    """Cadastro atualizado antes disso volta à ESL (ESL_NFE_CADASTRO_VALIDADE em dias; 0 = não expira)."""
+    if settings.ESL_NFE_CADASTRO_VALIDADE <= 0:
+        return None
+    return timezone.now() - timedelta(days=settings.ESL_NFE_CADASTRO_VALIDADE)
+
+
+def separar_faltantes(notas, cadastro):
+    """{chave: numero} das notas sem NF-e vigente no cadastro (as que vão à ESL)."""
+    limite = limite_validade_cadastro()
+    return {chave: numero for chave, numero in notas.items() if not nfe_vigente(cadastro.get(chave), limite)}
+
+
+def cadastrar_nfes(detalhes_por_chave, notas=None):
+    """
+    Grava no cadastro os registros do 9873 ({chave: registro}) num upsert só e devolve {chave: NFe}.
+    `notas` ({chave: numero}) completa o número quando o registro não trouxer.
+    """
+    from manifesto.models import NFe
+
+    objetos = []
+    for chave, dados_chave in decodificar_lote(detalhes_por_chave).items():
+        detalhes = detalhes_por_chave[chave]
+        destinatario, endereco = montar_dados_nota(detalhes)
+        # Número e CNPJ do emitente saem da chave; o registro da ESL só completa chave fora do padrão
+        numero = dados_chave.numero if dados_chave else detalhes.get('number') or (notas or {}).get(chave)
+        emitente = dados_chave.cnpj if dados_chave else limpar(detalhes.get('issuer_document'))
+        objetos.append(NFe(
+            chave_acesso=chave,
+            numero_nota=str(numero or ''),
+            emitente_documento=emitente or None,
+            emitente_nome=detalhes.get('issuer_name'),
+            destinatario=destinatario,
+            endereco_entrega=endereco,
+        ))
+    if not objetos:
+        return {}
+
+    NFe.objects.bulk_create(
+        objetos,
+        batch_size=500,
+        update_conflicts=True,
+        update_fields=[
+            'numero_nota', 'emitente_documento', 'emitente_nome', 'destinatario', 'endereco_entrega', 'atualizado_em',
+        ],
+        **_opcoes_upsert('chave_acesso'),
+    )
+    # MySQL não devolve os ids do upsert: relê para vincular as notas
+    return carregar_cadastro(detalhes_por_chave)
+
+
+def enriquecer_com_cadastro(notas):
+    """
+    {chave: numero} -> {chave: NFe}. Chaves com NF-e vigente no cadastro não vão à ESL;
+    as demais (novas, com os textos padrão ou vencidas) passam por `enriquecer_notas` e
+    entram/são atualizadas no cadastro. Se a ESL não devolver nada, fica o que já havia.
+    """
+    cadastro = carregar_cadastro(notas)
+    faltantes = separar_faltantes(notas, cadastro)
+    if faltantes:
+        cadastro.update(cadastrar_nfes(enriquecer_notas(faltantes), faltantes))
+    if cadastro:
+        logger.info(f"🗃️ {len(notas) - len(faltantes)}/{len(notas)} notas servidas pelo cadastro de NF-e")
+    return cadastro
+
+
+def salvar_notas(manifesto, notas, cadastro):
+    """
+    Grava/atualiza as notas do manifesto ({chave: numero}) a partir do cadastro ({chave: NFe})
+    num único upsert por lote (bulk_create com update_conflicts na restrição manifesto + chave_acesso).
+    `status` não entra nos campos atualizados, então a baixa já registrada é preservada.
+    """
+    from manifesto.models import NotaFiscal
+
+    objetos = []
+    for chave, numero in notas.items():
+        nfe = cadastro.get(chave)
+        objetos.append(NotaFiscal(
+            manifesto=manifesto,
+            chave_acesso=chave,
+            numero_nota=str(numero),
+            destinatario=nfe.destinatario if nfe else DESTINATARIO_PADRAO,
+            endereco_entrega=nfe.endereco_entrega if nfe else ENDERECO_PADRAO,
+            nfe=nfe,
+            status='PENDENTE',
+            enriquecimento_pendente=False,
+        ))
+
+    if not objetos:
+        return 0
+
+    NotaFiscal.objects.bulk_create(
+        objetos,
+        batch_size=500,
+        update_conflicts=True,
+        update_fields=['numero_nota', 'destinatario', 'endereco_entrega', 'nfe', 'enriquecimento_pendente'],
+        **_opcoes_upsert('manifesto', 'chave_acesso'),
+    )
+    return len(objetos)
+
+
+def dividir_em_blocos(notas, tamanho, max_blocos):
+    """Divide {chave: numero} em no máximo `max_blocos` dicts de ~`tamanho` notas."""
+    itens = list(notas.items())
+    if not itens:
+        return []
+    tamanho = max(tamanho, -(-len(itens) // max(max_blocos, 1)))
+    return [dict(itens[i:i + tamanho]) for i in range(0, len(itens), tamanho)]
+
+
+def finalizar_sincronizacao(log_id, manifesto_id, falhas=0):
+    """
+    Fecha o log como PROCESSADO. A marca d'água (`sincronizado_em`) só é registrada quando
+    todas as notas foram gravadas: com falhas, a janela de frescor não segura a próxima busca.
+    """
+    from manifesto.models import Manifesto, ManifestoBuscaLog
+
+    if manifesto_id and not falhas:
+        Manifesto.objects.filter(id=manifesto_id).update(sincronizado_em=timezone.now())
+
+    log = ManifestoBuscaLog.objects.get(id=log_id)
+    try:
+        log.mensagem_erro = f"{falhas} nota(s) não puderam ser gravadas." if falhas else None
+        if log.origem == 'APP':
+            # O motorista buscou durante o pré-aquecimento
+            em_transporte = ativar_manifesto(log.numero_manifesto, log.motorista_id)
+            if em_transporte:
+                log.mensagem_erro = mensagem_conflito_transporte(em_transporte)
+        log.status = 'PROCESSADO'
+        log.save(update_fields=['status', 'mensagem_erro'])
+    finally:
+        # Mesmo com erro aqui o manifesto não pode ficar travado até o TTL
+        liberar_sincronizacao(log)
+    publicar_progresso(log)
+    return log
@@ -0,0 +1,240 @@
+# manifesto/sincronizacao_async.py
+"""
+Variante assíncrona da sincronização de manifestos (asyncio + httpx).
+
+Faz o mesmo que `buscar_manifesto_completo_task` + blocos de enriquecimento, mas
+várias sincronizações dividem um único event loop e um único pool de conexões:
+enquanto uma corrotina espera a ESL (ou a sua vez no bucket global), as outras
+seguem. O banco continua síncrono, chamado via `banco` (sync_to_async que descarta
+conexões vencidas antes de usar; todas são fechadas no fim da execução).
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from core.esl.cache import consultar_relatorio_cache_async
+from core.esl.cliente_async import ClienteESLAsync
+from core.esl.limitador import LimiteESLExcedido
+from manifesto.services import (
+    busca_cabecalho, validar_cabecalho, registrar_manifesto_local, params_paginacao,
+    extrair_notas_da_pagina, salvar_cursor, filtrar_nao_enriquecidas, busca_nota,
+    agrupar_por_emitente, busca_lote, casar_pagina, paginas_do_lote, salvar_notas,
+    finalizar_sincronizacao, publicar_progresso, liberar_sincronizacao, publicar_preview,
+    carregar_cadastro, cadastrar_nfes, separar_faltantes, aproveitar_ocorrencias,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def banco(funcao):
+    """sync_to_async de uma função que usa o banco, descartando antes as conexões vencidas ou quebradas."""
+    def _executar(*args, **kwargs):
+        close_old_connections()
+        return funcao(*args, **kwargs)
+    return sync_to_async(_executar)
+
+
+async def executar_todas(corrotinas):
+    """
+    Como `asyncio.gather`, mas na primeira exceção as outras corrotinas são canceladas
+    (TaskGroup) em vez de seguirem gastando orçamento sem ninguém esperar por elas.
+    Relança a exceção original (não o ExceptionGroup).
+    """
+    try:
+        async with asyncio.TaskGroup() as grupo:
+            tarefas = [grupo.create_task(corrotina) for corrotina in corrotinas]
+    except BaseExceptionGroup as erros:
+        raise erros.exceptions[0]
+    return [tarefa.result() for tarefa in tarefas]
+
+
+def _carregar_log(log_id):
+    from manifesto.models import ManifestoBuscaLog
+    return ManifestoBuscaLog.objects.select_related('motorista').get(id=log_id)
+
+
+def _atualizar_log(log, **campos):
+    for campo, valor in campos.items():
+        setattr(log, campo, valor)
+    log.save(update_fields=list(campos))
+    publicar_progresso(log)
+
+
+# =====================================================
+# ETAPA 2: PAGINAÇÃO DAS CHAVES
+# =====================================================
+
+async def paginar_notas_manifesto_async(cliente, id_interno_esl, start_cursor=None):
+    """Igual a `services.paginar_notas_manifesto`. Retorna ({chave: numero}, último cursor)."""
+    notas = {}
+    registros = []
+    ultimo_cursor = start_cursor
+
+    while True:
+        res_n = await cliente.listar_ocorrencias(params_paginacao(id_interno_esl, start_cursor))
+        if res_n.status_code != 200: break
+
+        data_n = res_n.json()
+        paging = data_n.get("paging", {})
+        ultimo_cursor = start_cursor
+        registros.extend(data_n.get("data", []))
+        extrair_notas_da_pagina(data_n.get("data", []), notas)
+
+        if paging.get("next_id") is None: break
+        start_cursor = paging["next_id"]
+
+    await banco(aproveitar_ocorrencias)(registros)
+    return notas, ultimo_cursor
+
+
+# =====================================================
+# ETAPA 3: ENRIQUECIMENTO
+# =====================================================
+
+async def buscar_detalhes_async(cliente, chave, numero):
+    try:
+        for nf in await consultar_relatorio_cache_async(cliente, 9873, busca_nota(numero, chave)):
+            if nf.get('key') == chave: return nf
+    except LimiteESLExcedido:
+        raise
+    except Exception:
+        pass
+    return None
+
+
+async def _paginar_emitente(cliente, ano, mes, cnpj, chaves, encontrados):
+    por_pagina = settings.ESL_ENRIQUECIMENTO_LOTE_POR_PAGINA
+    pendentes = set(chaves)
+    search = busca_lote(ano, mes, cnpj)
+    for pagina in range(1, paginas_do_lote(chaves) + 1):
+        registros = await consultar_relatorio_cache_async(cliente, 9873, search, page=pagina, per=por_pagina)
+        casar_pagina(registros, pendentes, encontrados)
+        if not pendentes or len(registros) < por_pagina:
+            break
+
+
+async def enriquecer_notas_async(cliente, notas):
+    """
+    {chave: numero} -> {chave: detalhes}. Mesma estratégia de `services.enriquecer_notas`,
+    com os emitentes paginados em paralelo e as consultas individuais também em paralelo
+    (o cliente limita quantas ficam em voo por endpoint).
+    """
+    encontrados = {}
+    if settings.ESL_ENRIQUECIMENTO_MODO == 'lote':
+        await executar_todas(
+            _paginar_emitente(cliente, ano, mes, cnpj, chaves, encontrados)
+            for (ano, mes, cnpj), chaves in agrupar_por_emitente(notas).items()
+        )
+
+    faltantes = [(chave, numero) for chave, numero in notas.items() if chave not in encontrados]
+    resultados = await executar_todas(buscar_detalhes_async(cliente, c, n) for c, n in faltantes)
+    for (chave, _), detalhes in zip(faltantes, resultados):
+        if detalhes:
+            encontrados[chave] = detalhes
+    return encontrados
+
+
+async def enriquecer_com_cadastro_async(cliente, notas):
+    """Versão assíncrona de `services.enriquecer_com_cadastro`: {chave: numero} -> {chave: NFe}."""
+    cadastro = await banco(carregar_cadastro)(notas)
+    faltantes = separar_faltantes(notas, cadastro)
+    if faltantes:
+        detalhes_por_chave = await enriquecer_notas_async(cliente, faltantes)
+        cadastro.update(await banco(cadastrar_nfes)(detalhes_por_chave, faltantes))
+    return cadastro
+
+
+# =====================================================
+# PIPELINE COMPLETO DE UM MANIFESTO
+# =====================================================
+
+async def sincronizar_manifesto_async(cliente, log_id, completo=False):
+    """
+    Sincroniza o manifesto de um `ManifestoBuscaLog` do início ao fim.
+    Levanta LimiteESLExcedido se o orçamento global não couber em ESL_ASYNC_ESPERA_MAXIMA
+    (quem orquestra decide reagendar); outros erros marcam o log como ERRO.
+    """
+    log = await banco(_carregar_log)(log_id)
+    numero_visual = log.numero_manifesto
+
+    try:
+        # --- ETAPA 1: CABEÇALHO ---
+        dados_mft = await consultar_relatorio_cache_async(cliente, 2972, busca_cabecalho(numero_visual), per=10)
+
+        erro = validar_cabecalho(dados_mft, log.motorista)
+        if erro:
+            await banco(_atualizar_log)(log, status='ERRO', mensagem_erro=erro)
+            await banco(liberar_sincronizacao)(log)
+            return erro
+
+        info_tms = dados_mft[0]
+        manifesto_obj, nome_filial_tms = await banco(registrar_manifesto_local)(
+            numero_visual, log.motorista, info_tms, preparar=log.origem == 'PREAQUECIMENTO'
+        )
+        id_interno_esl = str(info_tms.get('id') or numero_visual)
+
+        # --- ETAPA 2: CHAVES ---
+        incremental = not completo and manifesto_obj.esl_id == id_interno_esl
+        start_cursor = manifesto_obj.esl_cursor if incremental else None
+
+        notas, ultimo_cursor = await paginar_notas_manifesto_async(cliente, id_interno_esl, start_cursor)
+        await banco(salvar_cursor)(manifesto_obj, id_interno_esl, ultimo_cursor)
+
+        if incremental:
+            notas = await banco(filtrar_nao_enriquecidas)(manifesto_obj, notas)
+
+        await banco(publicar_preview)(log, manifesto_obj, nome_filial_tms, info_tms, notas)
+        await banco(_atualizar_log)(log, status='ENRIQUECENDO')
+
+        # --- ETAPA 3: ENRIQUECIMENTO E GRAVAÇÃO ---
+        cadastro = await enriquecer_com_cadastro_async(cliente, notas)
+        processadas = await banco(salvar_notas)(manifesto_obj, notas, cadastro)
+        await banco(_atualizar_log)(log, notas_processadas=len(notas))
+
+        await banco(finalizar_sincronizacao)(log.id, manifesto_obj.id, len(notas) - processadas)
+        return f"Manifesto {numero_visual}: {processadas} notas na filial {nome_filial_tms}."
+
+    except LimiteESLExcedido:
+        raise
+    except Exception as e:
+        logger.error(f"🔴 Erro na sincronização assíncrona do manifesto {numero_visual}: {e}")
+        await banco(_atualizar_log)(log, status='ERRO', mensagem_erro=str(e))
+        await banco(liberar_sincronizacao)(log)
+        return str(e)
+
+
+async def sincronizar_manifestos_async(log_ids, completo=False):
+    """
+    Roda várias sincronizações no mesmo event loop, no máximo ESL_ASYNC_MAX_MANIFESTOS por vez.
+    O orçamento da ESL é global: quando um manifesto esbarra no limite, os que ainda não
+    terminaram são cancelados e voltam todos juntos.
+    Retorna (resultados por log_id, {log_id: espera} dos que esbarraram no limite da ESL).
+    """
+    vagas = asyncio.Semaphore(settings.ESL_ASYNC_MAX_MANIFESTOS)
+    resultados, adiados = {}, {}
+
+    async def _um(log_id):
+        async with vagas:
+            try:
+                resultados[log_id] = await sincronizar_manifesto_async(cliente, log_id, completo)
+            except LimiteESLExcedido:
+                raise
+            except Exception as e:
+                # Log inexistente etc.: não derruba as sincronizações dos outros manifestos
+                logger.error(f"🔴 Sincronização assíncrona do log {log_id} falhou: {e}")
+                resultados[log_id] = str(e)
+
+    try:
+        async with ClienteESLAsync() as cliente:
+            try:
+                await executar_todas(_um(log_id) for log_id in log_ids)
+            except LimiteESLExcedido as e:
+                adiados = {log_id: e.espera for log_id in log_ids if log_id not in resultados}
+    finally:
+        # Mesma thread de todas as chamadas `banco`: nenhuma conexão fica aberta entre execuções
+        await sync_to_async(connections.close_all)()
+
+    return resultados, adiados
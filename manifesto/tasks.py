@@ -1,15 +1,34 @@
-from celery import shared_task
+from celery import shared_task, chord
 import requests
 import json
 import logging
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from django.conf import settings
 from usuarios.models import Motorista
 from manifesto.models import Manifesto, NotaFiscal, ManifestoBuscaLog , BaixaNF
 from operacional.tasks import enviar_email_erro_tms_task
-
-import time # Necessário para respeitar os 2 segundos
+from core import travas
+from core.esl import cliente as esl
+from core.esl.limitador import LimiteESLExcedido
+from core.esl.cache import consultar_relatorio_cache
+from manifesto.historico_esl import ingerir_feed, descartar_pendentes_antigos, CURSOR_FEED, TRAVA_FEED
+from manifesto.preaquecimento import preaquecer
+from manifesto.inicio_transporte import (
+    enfileirar_inicio_transporte, agendar_envio, liberar_agendamento, drenar_inicios, proximo_envio,
+)
+from manifesto.integracao_esl import (
+    carregar_baixa, enviar_baixa, registrar_falha_baixa, drenar_fila, liberar_apos_upload, reservar_uploads_parados,
+)
+from manifesto.comprovantes import publicar_comprovante, publicar_comprovantes
+from core.armazenamento import ErroArmazenamento
+from manifesto.services import (
+    busca_cabecalho, validar_cabecalho, registrar_manifesto_local, paginar_notas_manifesto,
+    salvar_cursor, filtrar_nao_enriquecidas, enriquecer_com_cadastro,
+    salvar_notas, dividir_em_blocos, finalizar_sincronizacao, publicar_progresso,
+    liberar_sincronizacao, publicar_preview,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -21,20 +40,14 @@ MAPA_JSON = {
 
 def validar_motorista_request(numero_manifesto):
     """Retorna o CPF do motorista vinculado ao manifesto no Endpoint 1"""
-    TOKEN = "zyUq31Mq6gMcYGzV4zL7HTsdnS7pULjaQoxGbkPZ1cLDoxT3d-Xukw"
-    URL = f"https://quickdelivery.eslcloud.com.br/api/analytics/reports/2972/data"
-    payload = {
-        "search": {
-            "manifests": {
-                "sequence_code": int(numero_manifesto),
-                "service_date": "2024-01-01 - 2050-12-31"
-            }
-        },
-        "page": "1", "per": "50"
+    search = {
+        "manifests": {
+            "sequence_code": int(numero_manifesto),
+            "service_date": "2024-01-01 - 2050-12-31"
+        }
     }
-    response = requests.get(URL, headers={"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}, data=json.dumps(payload), timeout=20)
-    response.raise_for_status()
-    dados = response.json()
+    # Mesmo `per` da busca da task principal para reaproveitar a entrada do cache
+    dados = consultar_relatorio_cache(2972, search, per=10)
     if dados and len(dados) > 0:
         # Pega o documento do primeiro item da lista
         return str(dados[0].get('mft_mdr_iil_document', '')).strip()
@@ -42,10 +55,6 @@ def validar_motorista_request(numero_manifesto):
 
 def capturar_notas_unicas(manifesto_id):
     """Percorre a paginação da ESL e filtra as chaves únicas de NF-e"""
-    TOKEN = "jziCXNF8xTasaEGJGxysrTFXtDRUmdobh9HCGHiwmEzaENWLiaddLA"
-    url = f"https://quickdelivery.eslcloud.com.br/api/invoice_occurrences"
-    headers = {"Authorization": f"Bearer {TOKEN}"}
-    
     notas_unicas = {}
     next_id = None
 
@@ -55,7 +64,7 @@ def capturar_notas_unicas(manifesto_id):
             params["after_id"] = next_id
 
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            response = esl.listar_ocorrencias(params)
             response.raise_for_status()
             data_json = response.json()
             
@@ -80,9 +89,10 @@ def capturar_notas_unicas(manifesto_id):
             if not next_id or next_id >= paging.get('last_id', 0):
                 # Se não houver next_id ou se já chegamos no last_id, encerra o loop
                 break
-                
-            time.sleep(2) # Respeita o limite da API da transportadora
 
+        except LimiteESLExcedido:
+            # Quem chamou decide se reagenda; não devolvemos uma lista pela metade
+            raise
         except Exception as e:
             logger.error(f"Erro ao paginar notas: {e}")
             break
@@ -91,26 +101,20 @@ def capturar_notas_unicas(manifesto_id):
 
 def enriquecer_dados_api(chave_nfe, numero_nfe):
     """Busca detalhes (Nome, Endereço) de uma nota específica"""
-    TOKEN = "zyUq31Mq6gMcYGzV4zL7HTsdnS7pULjaQoxGbkPZ1cLDoxT3d-Xukw"
-    URL = f"https://quickdelivery.eslcloud.com.br/api/analytics/reports/9873/data"
-    
-    payload = {
-        "search": {
-            "invoices": {
-                "number": int(numero_nfe),
-                "issue_date": "2024-01-01 - 2050-12-31" 
-            }
-        },
-        "page": "1", "per": "100"
+    search = {
+        "invoices": {
+            "number": int(numero_nfe),
+            "issue_date": "2024-01-01 - 2050-12-31" 
+        }
     }
     
     try:
-        response = requests.get(URL, headers={"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}, data=json.dumps(payload), timeout=30)
-        if response.status_code == 200:
-            dados = response.json()
-            for nf in dados:
-                if nf.get('key') == chave_nfe:
-                    return nf
+        dados = consultar_relatorio_cache(9873, search, per=100)
+        for nf in dados:
+            if nf.get('key') == chave_nfe:
+                return nf
+    except LimiteESLExcedido:
+        raise
     except Exception as e:
         logger.error(f"Erro na API de enriquecimento para nota {numero_nfe}: {e}")
     return None
@@ -120,270 +124,253 @@ def enriquecer_dados_api(chave_nfe, numero_nfe):
 # =====================================================
 @shared_task(bind=True, max_retries=3, default_retry_delay=10)
 def iniciar_transporte_manifesto_tms_task(self, numero_manifesto):
-    TOKEN = "jziCXNF8xTasaEGJGxysrTFXtDRUmdobh9HCGHiwmEzaENWLiaddLA"
-    URL = "https://quickdelivery.eslcloud.com.br/graphql"
-
-    HEADERS = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {TOKEN}"
-    }
-
     """
     - Busca manifesto no banco local
     - Calcula km inicial pelo último manifesto finalizado
-    - Inicia transporte no TMS
-    - Atualiza manifesto local
+    - Coloca o início de transporte na fila do Redis
+    - `enviar_inicios_transporte_task` manda a fila para o TMS em lote e atualiza o manifesto local
     """
-
     try:
-        # -----------------------------------
-        # 1️⃣ Buscar manifesto local
-        # -----------------------------------
-        manifesto = Manifesto.objects.select_related("motorista").get(
-            numero_manifesto=numero_manifesto
-        )
-
-        if not manifesto.motorista:
-            raise Exception("Manifesto sem motorista vinculado")
-
-        # -----------------------------------
-        # 2️⃣ Buscar último manifesto FINALIZADO
-        # -----------------------------------
-        ultimo_manifesto = (
-            Manifesto.objects
-            .filter(
-                motorista=manifesto.motorista,
-                status="FINALIZADO",
-                km_final__isnull=False
-            )
-            .order_by("-data_finalizacao")
-            .first()
-        )
+        km_inicial = enfileirar_inicio_transporte(numero_manifesto)
+    except Exception as exc:
+        raise self.retry(exc=exc)
 
-        if not ultimo_manifesto:
-            raise Exception("Motorista não possui manifesto finalizado anterior")
-
-        km_inicial = ultimo_manifesto.km_final
-
-        # -----------------------------------
-        # 3️⃣ Chamar TMS
-        # -----------------------------------
-        payload = {
-            "query": """
-            mutation ($id: ID!, $params: ManifestStartTransportInput!) {
-              manifestStartTransport(id: $id, params: $params) {
-                success
-                errors
-              }
-            }
-            """,
-            "variables": {
-                "id": manifesto.numero_manifesto,  # ID do TMS
-                "params": {
-                    "km": float(km_inicial)
-                }
-            }
-        }
+    agendar_envio()
+    return {
+        "success": True,
+        "numero_manifesto": numero_manifesto,
+        "km_inicial": km_inicial,
+        "enfileirado": True,
+    }
 
-        response = requests.post(URL, headers=HEADERS, json=payload, timeout=30)
-        response.raise_for_status()
 
-        result = response.json()["data"]["manifestStartTransport"]
+@shared_task(bind=True)
+def enviar_inicios_transporte_task(self):
+    """
+    Fim da janela de coleta: envia os inícios de transporte pendentes em documentos GraphQL
+    com aliases (ESL_INICIO_TRANSPORTE_LOTE por chamada). Só as falhas voltam para a fila.
+    """
+    # Pedidos que chegarem a partir daqui abrem uma nova janela
+    liberar_agendamento()
 
-        if not result["success"]:
-            raise Exception(result["errors"])
+    try:
+        resumo = drenar_inicios(self.request.id)
+    except LimiteESLExcedido as e:
+        logger.info(f"⏳ Início de transporte em lote adiado: {e}")
+        enviar_inicios_transporte_task.apply_async(countdown=e.espera)
+        return str(e)
 
-        # -----------------------------------
-        # 4️⃣ Atualizar manifesto local
-        # -----------------------------------
-        with transaction.atomic():
-            manifesto.km_inicial = km_inicial
-            manifesto.status = "EM_TRANSPORTE"
-            manifesto.save(update_fields=["km_inicial", "status"])
+    if resumo is None:
+        # Outra drenagem está com a trava: ela mesma reagenda o que sobrar quando terminar
+        logger.info("⏳ Início de transporte em lote: outra drenagem em andamento")
+        return None
 
-        return {
-            "success": True,
-            "numero_manifesto": manifesto.numero_manifesto,
-            "km_inicial": km_inicial
-        }
+    # Falhas reagendadas: volta quando o próximo vencer
+    espera = proximo_envio()
+    if espera is not None:
+        enviar_inicios_transporte_task.apply_async(countdown=espera)
+    return resumo
 
-    except Exception as exc:
-        raise self.retry(exc=exc)
 
 # =====================================================
 # TASK PRINCIPAL DO CELERY
 # =====================================================
 
 @shared_task(bind=True, max_retries=3)
-def buscar_manifesto_completo_task(self, log_id):
-    from manifesto.models import Manifesto, NotaFiscal, ManifestoBuscaLog # Certifique-se de importar Filial
-    from usuarios.models import Filial
-    import requests
-    import json
-    import time
-
+def buscar_manifesto_completo_task(self, log_id, manifesto_id=None, completo=False, adiamentos=0):
+    """
+    Etapa 1 e 2 da sincronização: valida o cabeçalho (2972), cria o manifesto local e
+    pagina as chaves das notas. O enriquecimento vai para `enriquecer_bloco_notas_task`
+    (um group) e o `finalizar_busca_manifesto_task` fecha o log quando todos terminarem.
+
+    Re-sync é incremental: a paginação retoma do `esl_cursor` salvo no manifesto e só
+    notas ainda não enriquecidas são consultadas. `completo=True` refaz tudo do início.
+    `manifesto_id` é aceito por compatibilidade com quem já cria o manifesto antes.
+    `adiamentos` conta as voltas por limite da ESL, separado das tentativas por erro.
+    """
     try:
         log = ManifestoBuscaLog.objects.select_related('motorista').get(id=log_id)
         numero_visual = log.numero_manifesto
         motorista = log.motorista
-        token_geral = "zyUq31Mq6gMcYGzV4zL7HTsdnS7pULjaQoxGbkPZ1cLDoxT3d-Xukw"
-        headers_geral = {"Content-Type": "application/json", "Authorization": f"Bearer {token_geral}"}
 
         # --- ETAPA 1: VALIDAR MOTORISTA E PEGAR ID INTERNO ---
-        url_valida = "https://quickdelivery.eslcloud.com.br/api/analytics/reports/2972/data"
-        payload_busca = {
-            "search": {
-                "manifests": {
-                    "sequence_code": int(numero_visual),
-                    "service_date": "2024-01-01 - 2050-12-31"
-                }
-            },
-            "page": "1", "per": "10"
-        }
-        
-        res_valida = requests.get(url_valida, headers=headers_geral, data=json.dumps(payload_busca), timeout=30)
-        dados_mft = res_valida.json()
-        
-        if not dados_mft:
-            log.status, log.mensagem_erro = 'ERRO', "Manifesto não encontrado."
-            log.save(); return
-
-        # Dados do primeiro registro retornado
+        dados_mft = consultar_relatorio_cache(2972, busca_cabecalho(numero_visual), per=10)
+
+        erro = validar_cabecalho(dados_mft, motorista)
+        if erro:
+            log.status, log.mensagem_erro = 'ERRO', erro
+            log.save(); liberar_sincronizacao(log); publicar_progresso(log); return
+
         info_tms = dados_mft[0]
+        manifesto_obj, nome_filial_tms = registrar_manifesto_local(numero_visual, motorista, info_tms)
 
-        # Validação de CPF
-        cpf_tms = str(info_tms.get('mft_mdr_iil_document', '')).strip()
-        if cpf_tms != str(motorista.cpf).replace('.','').replace('-',''):
-            log.status, log.mensagem_erro = 'ERRO', "Manifesto não pertence ao seu CPF."
-            log.save(); return
-
-        # --- NOVO: LÓGICA DE FILIAL ---
-        nome_filial_tms = info_tms.get('mft_crn_psn_nickname', 'MATRIZ').strip().upper()
-        
-        # Busca a filial pelo nome, se não existir, cria
-        filial_obj, created = Filial.objects.get_or_create(
-            nome=nome_filial_tms
-        )
-        if created:
-            logger.info(f"🏢 Nova Filial cadastrada: {nome_filial_tms}")
-
-        # Criar/Recuperar Manifesto Local (Incluindo a Filial)
-        manifesto_obj, _ = Manifesto.objects.update_or_create(
-            numero_manifesto=numero_visual,
-            defaults={
-                'motorista': motorista, 
-                'filial': filial_obj, # Vinculando a Filial aqui
-                'status': 'EM_TRANSPORTE'
-            }
-        )
-        
-        id_interno_esl = info_tms.get('id') or numero_visual
-        log.status = 'ENRIQUECENDO'
-        log.save()
+        id_interno_esl = str(info_tms.get('id') or numero_visual)
 
         # --- ETAPA 2: CAPTURAR LISTA DE NOTAS ---
-        # (Mantém sua lógica de notas...)
-        token_notas = "jziCXNF8xTasaEGJGxysrTFXtDRUmdobh9HCGHiwmEzaENWLiaddLA"
-        url_notas = "https://quickdelivery.eslcloud.com.br/api/invoice_occurrences"
-        
-        params_notas = {"manifest_id": str(id_interno_esl), "per": 20}
-        start_cursor = None
-        notas_unicas_dict = {}
-
-        while True:
-            if start_cursor:
-                params_notas["start"] = start_cursor
-            else:
-                params_notas.pop("start", None)
-
-            res_n = requests.get(url_notas, headers={"Authorization": f"Bearer {token_notas}"}, params=params_notas, timeout=30)
-            if res_n.status_code != 200: break
-
-            data_n = res_n.json()
-            registros = data_n.get("data", [])
-            paging = data_n.get("paging", {})
-
-            for item in registros:
-                invoice = item.get("invoice")
-                if invoice and invoice.get("key"):
-                    notas_unicas_dict[invoice["key"]] = invoice["number"]
-
-            if paging.get("next_id") is None: break
-            start_cursor = paging["next_id"]
-            time.sleep(2.3)
-
-        # --- ETAPA 3: ENRIQUECIMENTO NOTA A NOTA ---
-        # (Mantém sua lógica de enriquecimento...)
-        total_processadas = 0
-        for chave, numero in notas_unicas_dict.items():
-            try:
-                time.sleep(2.1)
-                detalhes = buscar_detalhes_esl_interno(chave, numero, token_geral)
-                
-                destinatario = "DADOS NÃO REPASSADOS PELA ESL"
-                endereco = "CONSULTE O DOCUMENTO FÍSICO"
-                
-                if detalhes:
-                    nome_det = detalhes.get('ioe_rpt_name')
-                    if nome_det: destinatario = str(nome_det).upper()
-                    
-                    rua = detalhes.get('ioe_rpt_mds_line_1', '')
-                    num = detalhes.get('ioe_rpt_mds_number', '')
-                    if rua:
-                        endereco = f"{rua} {num}".strip().upper()
-
-                with transaction.atomic():
-                    nota_no_manifesto = NotaFiscal.objects.filter(
-                        manifesto=manifesto_obj, 
-                        chave_acesso=chave
-                    ).first()
-                    
-                    status_final = nota_no_manifesto.status if nota_no_manifesto else 'PENDENTE'
-
-                    NotaFiscal.objects.update_or_create(
-                        manifesto=manifesto_obj,
-                        chave_acesso=chave,
-                        defaults={
-                            'numero_nota': str(numero),
-                            'destinatario': destinatario,
-                            'endereco_entrega': endereco,
-                            'status': status_final
-                        }
-                    )
-                
-                total_processadas += 1
-            except Exception as e:
-                logger.warning(f"⚠️ Erro nota {numero}: {e}")
-                continue
-
-        log.status = 'PROCESSADO'
-        log.save()
-        return f"Manifesto {numero_visual} finalizado com {total_processadas} notas na filial {nome_filial_tms}."
+        # Retoma da última página lida na sincronização anterior (ela pode ter crescido)
+        incremental = not completo and manifesto_obj.esl_id == id_interno_esl
+        start_cursor = manifesto_obj.esl_cursor if incremental else None
+
+        notas_unicas_dict, ultimo_cursor = paginar_notas_manifesto(id_interno_esl, start_cursor)
+        salvar_cursor(manifesto_obj, id_interno_esl, ultimo_cursor)
+
+        if incremental:
+            notas_unicas_dict = filtrar_nao_enriquecidas(manifesto_obj, notas_unicas_dict)
+
+        # Preview: o app já lista as notas (chave + número) enquanto o enriquecimento roda
+        publicar_preview(log, manifesto_obj, nome_filial_tms, info_tms, notas_unicas_dict)
 
+        # --- ETAPA 3: ENRIQUECIMENTO EM BLOCOS PARALELOS (group + chord) ---
+        # Cada bloco se reagenda sozinho; uma falha não reinicia a sincronização inteira.
+        blocos = dividir_em_blocos(
+            notas_unicas_dict,
+            settings.ESL_SYNC_TAMANHO_BLOCO,
+            settings.ESL_SYNC_MAX_PARALELO,
+        )
+
+        log.status = 'ENRIQUECENDO'
+        log.save(update_fields=['status'])
+        publicar_progresso(log)
+
+        if not blocos:
+            return finalizar_busca_manifesto_task([], log.id, manifesto_obj.id)
+
+        chord(
+            enriquecer_bloco_notas_task.s(log.id, manifesto_obj.id, bloco) for bloco in blocos
+        )(finalizar_busca_manifesto_task.s(log.id, manifesto_obj.id))
+
+        return f"Manifesto {numero_visual}: {len(notas_unicas_dict)} notas em {len(blocos)} bloco(s) na filial {nome_filial_tms}."
+
+    except LimiteESLExcedido as e:
+        # Orçamento global esgotado, 429 ou disjuntor aberto: libera o worker e volta depois
+        if adiamentos >= settings.ESL_MAX_ADIAMENTOS:
+            _desistir_por_limite(log, adiamentos, e)
+            return str(e)
+        logger.info(f"⏳ {e}")
+        # Nova execução em vez de self.retry: adiamento não gasta as tentativas de erro
+        buscar_manifesto_completo_task.apply_async(
+            (log_id, manifesto_id, completo), {'adiamentos': adiamentos + 1}, countdown=e.espera,
+        )
+        return str(e)
     except Exception as e:
         logger.error(f"🔴 Erro crítico: {str(e)}")
         log.status, log.mensagem_erro = 'ERRO', str(e)
         log.save()
+        if self.request.retries >= self.max_retries:
+            # Última tentativa: libera o manifesto para uma nova sincronização
+            liberar_sincronizacao(log)
+        publicar_progresso(log)
         raise self.retry(exc=e, countdown=60)
-    
-def buscar_detalhes_esl_interno(chave, numero, token):
-    """Auxiliar para buscar endereço no Endpoint 3"""
-    url = "https://quickdelivery.eslcloud.com.br/api/analytics/reports/9873/data"
-    payload = {
-        "search": {
-            "invoices": {
-                "issue_date": "2024-01-01 - 2050-12-31",
-                "number": int(numero)
-            }
-        }
-    }
+
+
+def _desistir_por_limite(log, adiamentos, erro):
+    """Adiamentos esgotados: fecha o log em ERRO, solta a trava do manifesto e avisa o app."""
+    logger.error(f"🔴 Manifesto {log.numero_manifesto} desistiu após {adiamentos} adiamentos: {erro}")
+    log.status, log.mensagem_erro = 'ERRO', "ESL indisponível no momento. Tente sincronizar novamente mais tarde."
+    log.save(update_fields=['status', 'mensagem_erro'])
+    liberar_sincronizacao(log)
+    publicar_progresso(log)
+
+
+def _somar_processadas(log_id, quantidade):
+    ManifestoBuscaLog.objects.filter(id=log_id).update(
+        notas_processadas=F('notas_processadas') + quantidade
+    )
+    # As notas do bloco já estão no banco: avisa o app para recarregar a lista
+    publicar_progresso(ManifestoBuscaLog.objects.get(id=log_id))
+
+
+@shared_task(bind=True, max_retries=3)
+def enriquecer_bloco_notas_task(self, log_id, manifesto_id, notas, adiamentos=0):
+    """
+    Enriquece e grava um bloco {chave: numero} de notas; nunca derruba o chord.
+    `adiamentos` conta os retries por limite da ESL, separados dos retries por erro
+    (todos passam por self.retry para manter o id da task dentro do chord).
+    """
     try:
-        r = requests.get(url, headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"}, data=json.dumps(payload), timeout=30)
-        if r.status_code == 200:
-            for nf in r.json():
-                if nf.get('key') == chave: return nf
-    except: pass
-    return None
+        manifesto_obj = Manifesto.objects.get(id=manifesto_id)
+        cadastro = enriquecer_com_cadastro(notas)
+        processadas = salvar_notas(manifesto_obj, notas, cadastro)
+
+        _somar_processadas(log_id, len(notas))
+        return {'processadas': processadas, 'falhas': len(notas) - processadas}
+
+    except LimiteESLExcedido as e:
+        # Sem orçamento agora: volta quando houver (teto próprio, maior que o de erros)
+        if adiamentos < settings.ESL_SYNC_MAX_REAGENDAMENTOS:
+            raise self.retry(
+                exc=e, countdown=e.espera, kwargs={'adiamentos': adiamentos + 1},
+                max_retries=self.request.retries + 1,
+            )
+        erro = e
+    except Exception as e:
+        if self.request.retries - adiamentos < self.max_retries:
+            raise self.retry(exc=e, countdown=30, max_retries=adiamentos + self.max_retries)
+        erro = e
+
+    logger.error(f"🔴 Bloco de {len(notas)} notas do log {log_id} desistiu: {erro}")
+    try:
+        # Tira os esqueletos do "carregando": grava os textos padrão; a próxima sincronização,
+        # mesmo incremental, volta a enriquecê-las (`filtrar_nao_enriquecidas` pega as com texto padrão)
+        salvar_notas(Manifesto.objects.get(id=manifesto_id), notas, {})
+    except Exception as e:
+        logger.error(f"🔴 Não foi possível gravar o padrão do bloco do log {log_id}: {e}")
+    _somar_processadas(log_id, len(notas))
+    return {'processadas': 0, 'falhas': len(notas)}
+
+
+@shared_task
+def finalizar_busca_manifesto_task(resultados, log_id, manifesto_id=None):
+    """Callback do chord: consolida os blocos, marca o log como PROCESSADO e registra a marca d'água."""
+    processadas = sum(r.get('processadas', 0) for r in resultados or [])
+    falhas = sum(r.get('falhas', 0) for r in resultados or [])
+
+    log = finalizar_sincronizacao(log_id, manifesto_id, falhas)
+    return f"Manifesto {log.numero_manifesto} finalizado com {processadas} notas."
+
+
+@shared_task(bind=True, max_retries=None)
+def sincronizar_manifestos_async_task(self, log_ids, completo=False, adiamentos=0):
+    """
+    Sincroniza vários manifestos num único event loop (asyncio + httpx), dividindo
+    o mesmo pool de conexões e o mesmo orçamento global da ESL.
+    Os que esbarrarem no limite voltam numa nova execução, só com eles, até ESL_MAX_ADIAMENTOS vezes.
+    """
+    import asyncio
+    from manifesto.sincronizacao_async import sincronizar_manifestos_async
+
+    resultados, adiados = asyncio.run(sincronizar_manifestos_async(log_ids, completo))
+
+    if adiados and adiamentos >= settings.ESL_MAX_ADIAMENTOS:
+        for log in ManifestoBuscaLog.objects.filter(id__in=list(adiados)):
+            _desistir_por_limite(log, adiamentos, "limite da ESL")
+    elif adiados:
+        espera = max(adiados.values())
+        logger.info(f"⏳ {len(adiados)} manifesto(s) adiados por limite da ESL. Retomando em {espera:.0f}s.")
+        sincronizar_manifestos_async_task.apply_async(
+            (list(adiados), completo), {'adiamentos': adiamentos + 1}, countdown=espera,
+        )
+
+    return resultados
+
+
+@shared_task
+def preaquecer_manifestos_task():
+    """
+    Beat: sincroniza em segundo plano os manifestos do dia (relatório 2972 por data de serviço)
+    dos motoristas cadastrados, para a busca no app já encontrar tudo local.
+    """
+    try:
+        log_ids, resumo = preaquecer()
+    except LimiteESLExcedido as e:
+        # Pré-aquecimento nunca disputa orçamento com o app: tenta no próximo ciclo
+        logger.info(f"⏳ Pré-aquecimento adiado: {e}")
+        return str(e)
+
+    if log_ids:
+        sincronizar_manifestos_async_task.delay(log_ids)
+        logger.info(f"🔥 Pré-aquecimento {resumo['data']}: {resumo}")
+    return resumo
 
 
 
@@ -399,95 +386,23 @@ def enviar_baixa_esl_task(self, baixa_id):
     - E-mail de erro SOMENTE na falha final
     """
 
-    from .models import BaixaNF
-    from django.utils import timezone
-    from datetime import timezone as dt_timezone
-    import requests
-
-    TOKEN = "jziCXNF8xTasaEGJGxysrTFXtDRUmdobh9HCGHiwmEzaENWLiaddLA"
-    URL_ESL = "https://quickdelivery.eslcloud.com.br/api/invoice_occurrences"
-
     try:
-        baixa = BaixaNF.objects.select_related(
-            'nota_fiscal',
-            'ocorrencia',
-            'nota_fiscal__manifesto__motorista'
-        ).get(id=baixa_id)
-
-        nf = baixa.nota_fiscal
-        motorista = nf.manifesto.motorista.nome_completo
-        url_foto = baixa.comprovante_foto_url or ""
-        codigo_ocorrencia = int(baixa.ocorrencia.codigo_tms) if baixa.ocorrencia else 1
-
-        # Data exatamente como registrada (UTC)
-        data_utc = baixa.data_baixa.astimezone(dt_timezone.utc)
-        data_ocorrencia_str = data_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-
-        # Lógica de envio de foto
-        if codigo_ocorrencia in [1, 2]:
-            invoice_data = {
-                "key": nf.chave_acesso,
-                "delivery_receipt_url": url_foto
-            }
-            freight_data = {}
-        else:
-            invoice_data = {
-                "key": nf.chave_acesso,
-                "delivery_receipt_url": ""
-            }
-            freight_data = {
-                "delivery_receipt_url": url_foto
-            } if url_foto else {}
-
-        payload = {
-            "invoice_occurrence": {
-                "receiver": baixa.recebedor or "Nao identificado",
-                "document_number": baixa.documento_recebedor or "",
-                "comments": f"Baixa via App - Motorista: {motorista}. Obs: {baixa.observacao or ''}",
-                "occurrence_at": data_ocorrencia_str,
-                "occurrence": {
-                    "code": codigo_ocorrencia
-                },
-                "invoice": invoice_data,
-                "manifest": {
-                    "id": nf.manifesto.numero_manifesto
-                }
-            }
-        }
-
-        if freight_data:
-            payload["invoice_occurrence"]["freight"] = freight_data
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {TOKEN}"
-        }
-
-        response = requests.post(
-            URL_ESL,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        response.raise_for_status()
-
-        # ✅ SUCESSO
-        baixa.processado_tms = True
-        baixa.integrado_tms = True
-        baixa.data_integracao = timezone.now()
-        baixa.log_erro_tms = "Sucesso: Integrado com ESL"
-        baixa.save()
+        baixa = carregar_baixa(baixa_id)
+        enviar_baixa(baixa)
 
     except BaixaNF.DoesNotExist:
         return f"Baixa {baixa_id} não encontrada"
 
+    except LimiteESLExcedido as exc:
+        # Limite, 429 ou disjuntor aberto: a baixa espera a ESL voltar sem contar como falha
+        raise self.retry(exc=exc, countdown=exc.espera, max_retries=settings.ESL_MAX_ADIAMENTOS)
+
     except requests.exceptions.HTTPError as exc:
-        status = exc.response.status_code if exc.response else None
-        msg_erro = f"Erro {status}: {exc.response.text if exc.response else str(exc)}"
+        # Response com erro é "falsy": comparar com None, senão o status nunca é lido
+        status = exc.response.status_code if exc.response is not None else None
+        msg_erro = f"Erro {status}: {exc.response.text if exc.response is not None else str(exc)}"
 
-        baixa.log_erro_tms = msg_erro[:500]
-        baixa.integrado_tms = False
-        baixa.save()
+        registrar_falha_baixa(baixa, msg_erro)
 
         # ❌ NÃO RETRYA erro de validação (4xx)
         if status and 400 <= status < 500:
@@ -500,3 +415,84 @@ def enviar_baixa_esl_task(self, baixa_id):
 
         enviar_email_erro_tms_task.delay(baixa_id, msg_erro)
         return f"Falha definitiva ESL (422): {msg_erro}"
+
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+        # ESL fora do ar/lenta: o disjuntor já contou a falha; tenta de novo mais tarde
+        registrar_falha_baixa(baixa, f"ESL indisponível: {exc}")
+
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=60)
+
+        enviar_email_erro_tms_task.delay(baixa_id, baixa.log_erro_tms)
+        return f"Falha definitiva ESL (conexão): {exc}"
+
+
+@shared_task
+def drenar_integracoes_esl_task():
+    """
+    Beat: envia para a ESL as baixas da fila de saída (IntegracaoBaixaESL).
+    Vários drenadores podem rodar juntos; a reserva com SKIP LOCKED separa os lotes.
+    """
+    # Baixas presas esperando a foto (upload perdido ou esgotado) ganham um novo upload
+    parados = reservar_uploads_parados()
+    if parados:
+        enviar_comprovantes_lote_task.delay(parados)
+
+    resumo = drenar_fila()
+    if any(resumo.values()):
+        logger.info(f"📤 Fila ESL: {resumo}")
+    return resumo
+
+
+@shared_task(bind=True, max_retries=None)
+def enviar_comprovante_task(self, baixa_id):
+    """
+    Sobe a foto do comprovante gravada no disco pela baixa e libera o envio para a ESL.
+    Falhas do FTP tentam de novo com backoff; esgotadas as tentativas, a baixa continua
+    em AGUARDANDO_UPLOAD e o drenador redispara o upload mais tarde.
+    """
+    try:
+        return publicar_comprovante(baixa_id)
+    except BaixaNF.DoesNotExist:
+        return f"Baixa {baixa_id} não encontrada"
+    except ErroArmazenamento as exc:
+        if self.request.retries < settings.COMPROVANTE_UPLOAD_MAX_TENTATIVAS:
+            raise self.retry(exc=exc, countdown=settings.COMPROVANTE_UPLOAD_BACKOFF * 2 ** self.request.retries)
+        logger.error(f"🔴 Upload do comprovante da baixa {baixa_id} falhou: {exc}")
+        liberar_apos_upload(baixa_id, erro=str(exc))
+        return f"Falha no upload: {exc}"
+
+
+@shared_task
+def enviar_comprovantes_lote_task(baixa_ids):
+    """Redisparo do drenador: sobe as fotos paradas em paralelo pelas sessões FTP do processo."""
+    resumo = publicar_comprovantes(baixa_ids)
+    if any(resumo.values()):
+        logger.info(f"📸 Comprovantes parados: {resumo}")
+    return resumo
+
+
+@shared_task(bind=True, max_retries=None)
+def ingerir_ocorrencias_esl_task(self):
+    """
+    Beat: lê o feed de ocorrências da ESL a partir do cursor salvo e grava o HistoricoOcorrencia.
+    Sem cursor (nenhuma sincronização ainda), não lê nada: o cursor nasce perto do fim do feed.
+    Uma execução por vez (trava no Redis); o comando de backfill usa a mesma trava no feed principal.
+    """
+    adquiriu, _ = travas.adquirir(TRAVA_FEED, self.request.id, 15 * 60)
+    if not adquiriu:
+        return "Ingestão já em andamento."
+
+    try:
+        descartar_pendentes_antigos()
+        resumo = ingerir_feed(CURSOR_FEED, max_paginas=settings.ESL_FEED_MAX_PAGINAS)
+    except LimiteESLExcedido as e:
+        # Sem orçamento agora: o próximo ciclo do beat continua do cursor
+        logger.info(f"⏳ Feed de ocorrências adiado: {e}")
+        return str(e)
+    finally:
+        travas.liberar(TRAVA_FEED, self.request.id)
+
+    if resumo['eventos']:
+        logger.info(f"🗂️ Feed de ocorrências: {resumo}")
+    return resumo
@@ -12,7 +12,7 @@ from .serializers import (
     ManifestoBuscaSerializer, ManifestoSerializer, 
     BaixaNFCreateSerializer, OcorrenciaSerializer
 )
-from .tasks import buscar_manifesto_completo_task
+from .services import solicitar_sincronizacao
 
 class ManifestoFinalizacaoView(APIView):
     def post(self, request):
@@ -62,25 +62,21 @@ class AtualizarManifestoView(views.APIView):
     
     def post(self, request):
         numero_manifesto = request.data.get('numero_manifesto')
-        motorista = request.user.motorista_profile # Ajuste conforme seu modelo
+        motorista = request.user.motorista_perfil
 
         if not numero_manifesto:
             return Response({"erro": "Número do manifesto é obrigatório"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 1. Criamos um log de busca marcado como 'ATUALIZACAO'
-        log = ManifestoBuscaLog.objects.create(
-            motorista=motorista,
-            numero_manifesto=numero_manifesto,
-            status='PENDENTE'
-        )
-
-        # 2. Chamamos a mesma Task que você já tem
-        # Ela vai percorrer a API da ESL e adicionar o que estiver faltando
-        buscar_manifesto_completo_task.delay(log.id)
+        # Mesma Task da busca: percorre a API da ESL e adiciona o que estiver faltando.
+        # Se o manifesto já estiver sincronizando, só devolve o log em andamento.
+        log, situacao = solicitar_sincronizacao(numero_manifesto, motorista)
+        if situacao == 'OCUPADO':
+            return Response({"erro": "Manifesto em sincronização por outro motorista."}, status=status.HTTP_409_CONFLICT)
 
         return Response({
             "mensagem": "Sincronização iniciada. As novas notas aparecerão em instantes.",
-            "log_id": log.id
+            "log_id": log.id,
+            "sincronizacao": situacao
         }, status=status.HTTP_202_ACCEPTED)
 
 class OcorrenciaListView(generics.ListAPIView):
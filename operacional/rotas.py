@@ -1,16 +1,16 @@
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 import requests, json
 from django.views.decorators.csrf import csrf_exempt
-from manifesto.models import NotaFiscal, Manifesto
+from manifesto.models import NotaFiscal, Manifesto, NFe
+from manifesto.services import cadastrar_nfes, busca_nota
+from core.chave_nfe import decodificar, limpar, motivo_invalida
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
-
-
-TOKEN = "zyUq31Mq6gMcYGzV4zL7HTsdnS7pULjaQoxGbkPZ1cLDoxT3d-Xukw"
-URL_TMS = "https://quickdelivery.eslcloud.com.br/api/analytics/reports/9873/data"
+from core.esl.cache import consultar_relatorio_cache
 
 
 @csrf_exempt
@@ -18,16 +18,33 @@ URL_TMS = "https://quickdelivery.eslcloud.com.br/api/analytics/reports/9873/data
 def buscar_e_importar_nfe(request):
     data = json.loads(request.body)
     numero = data.get('numero')
-    cnpj_emissor = data.get('cnpj_emissor')
-    chave = data.get('chave')
+    cnpj_emissor = limpar(data.get('cnpj_emissor')) or None
+    chave = limpar(data.get('chave')) or None
     manifesto_id = data.get('manifesto_id') # Recebido apenas no momento de salvar
 
-    # 1. BUSCA LOCAL PRIMEIRO
+    # 0. CHAVE DIGITADA: valida e extrai número/emitente sem ir ao banco nem à ESL
     if chave:
-        nota_local = NotaFiscal.objects.filter(chave_acesso=chave).first()
+        erro = motivo_invalida(chave)
+        if erro:
+            return JsonResponse({"sucesso": False, "mensagem": f"Chave inválida: {erro}"}, status=400)
+        dados_chave = decodificar(chave)
+        numero = numero or dados_chave.numero
+        cnpj_emissor = cnpj_emissor or dados_chave.cnpj
+    elif not numero:
+        return JsonResponse({"sucesso": False, "mensagem": "Informe o número ou a chave da nota."}, status=400)
+
+    # 1. BUSCA LOCAL PRIMEIRO (cadastro de NF-e, depois notas de outros manifestos)
+    if chave:
+        nota_local = (
+            NFe.objects.filter(chave_acesso=chave).first()
+            or NotaFiscal.objects.filter(chave_acesso=chave).first()
+        )
     else:
         # Busca por número e tenta cruzar com o emissor se você tiver esse dado no banco
-        nota_local = NotaFiscal.objects.filter(numero_nota=numero).first()
+        nota_local = (
+            NFe.objects.filter(numero_nota=limpar(numero).lstrip('0'), emitente_documento=cnpj_emissor).first()
+            or NotaFiscal.objects.filter(numero_nota=numero).first()
+        )
 
     if nota_local and not manifesto_id: # Se achou local e só está buscando dados
         return JsonResponse({
@@ -43,33 +60,26 @@ def buscar_e_importar_nfe(request):
 
     # 2. BUSCA NO TMS (Caso não tenha achado local ou queira salvar)
     if not manifesto_id:
-        payload = {
-            "search": {
-                "invoices": {
-                    "number": int(numero) if numero else None,
-                    "issue_date": "2024-01-01 - 2050-12-31" 
-                }
-            },
-            "page": "1", "per": "100"
-        }
         try:
-            res = requests.get(URL_TMS, headers={"Authorization": f"Bearer {TOKEN}"}, data=json.dumps(payload), timeout=20)
-            if res.status_code == 200:
-                dados = res.json()
-                for nf in dados:
-                    # Filtro por Chave (se informada) ou por CNPJ Emissor
-                    if (chave and nf.get('key') == chave) or (not chave and str(nf.get('issuer_document')).replace('.','').replace('-','') == cnpj_emissor):
-                        return JsonResponse({
-                            "sucesso": True, 
-                            "origem": "tms", 
-                            "dados": {
-                                "numero": nf.get('number'),
-                                "chave": nf.get('key'),
-                                "destinatario": nf.get('receiver_name'),
-                                "endereco": nf.get('receiver_address')
-                            }
-                        })
-                return JsonResponse({"sucesso": False, "mensagem": "Nota não encontrada no TMS."}, status=404)
+            # Com a chave, a busca fica restrita ao mês de emissão dela
+            dados = consultar_relatorio_cache(9873, busca_nota(numero, chave), per=100)
+            for nf in dados:
+                # Filtro por Chave (se informada) ou por CNPJ Emissor
+                if (chave and nf.get('key') == chave) or (not chave and limpar(nf.get('issuer_document')) == cnpj_emissor):
+                    # Entra no cadastro: a próxima busca desta nota (ou a sincronização) não vai à ESL
+                    if nf.get('key'):
+                        cadastrar_nfes({nf['key']: nf})
+                    return JsonResponse({
+                        "sucesso": True, 
+                        "origem": "tms", 
+                        "dados": {
+                            "numero": nf.get('number'),
+                            "chave": nf.get('key'),
+                            "destinatario": nf.get('receiver_name'),
+                            "endereco": nf.get('receiver_address')
+                        }
+                    })
+            return JsonResponse({"sucesso": False, "mensagem": "Nota não encontrada no TMS."}, status=404)
         except Exception as e:
             return JsonResponse({"sucesso": False, "mensagem": str(e)}, status=500)
 
@@ -77,14 +87,27 @@ def buscar_e_importar_nfe(request):
     else:
         manifesto = get_object_or_404(Manifesto, id=manifesto_id)
         # Lógica de criação no banco conforme seu Model
-        nova_nota = NotaFiscal.objects.create(
-            manifesto=manifesto,
-            numero_nota=data.get('numero'),
-            chave_acesso=data.get('chave'),
-            destinatario=data.get('destinatario'),
-            endereco_entrega=data.get('endereco'),
-            status='PENDENTE'
-        )
+        campos = {
+            'numero_nota': numero,
+            'destinatario': data.get('destinatario'),
+            'endereco_entrega': data.get('endereco'),
+            'nfe': NFe.objects.filter(chave_acesso=chave).first() if chave else None,
+            'status': 'PENDENTE',
+        }
+        try:
+            with transaction.atomic():
+                # A chave é única no manifesto (nota_unica_por_manifesto); sem chave não há o que repetir
+                if chave:
+                    nova_nota, criada = NotaFiscal.objects.get_or_create(
+                        manifesto=manifesto, chave_acesso=chave, defaults=campos
+                    )
+                else:
+                    nova_nota, criada = NotaFiscal.objects.create(manifesto=manifesto, chave_acesso=chave, **campos), True
+        except IntegrityError:
+            # Outra requisição vinculou a mesma chave entre o get e o create
+            criada = False
+        if not criada:
+            return JsonResponse({"sucesso": False, "mensagem": "Nota já vinculada a este manifesto."}, status=409)
         return JsonResponse({"sucesso": True, "mensagem": "Nota vinculada com sucesso!"})
     
 from django.http import JsonResponse
@@ -108,7 +131,7 @@ def listar_manifestos_select(request):
 @login_required
 @require_POST # Garante que só aceite chamadas POST (segurança)
 def sincronizar_nota_tms_view(request, nota_id):
-    from manifesto.tasks import enviar_baixa_esl_task
+    from manifesto.integracao_esl import enfileirar_baixa
     try:
         # 1. Verifica se a nota existe
         # (Aqui usamos o ID da nota, a task buscará a 'baixa' vinculada)
@@ -123,8 +146,8 @@ def sincronizar_nota_tms_view(request, nota_id):
                 'mensagem': 'Esta nota ainda não possui uma baixa registrada pelo motorista.'
             }, status=400)
 
-        # 3. Dispara a Task do Celery que faz o envio real e envia e-mail em caso de erro
-        enviar_baixa_esl_task.delay(baixa.id)
+        # 3. Coloca na fila de saída; o drenador faz o envio real e envia e-mail em caso de erro
+        enfileirar_baixa(baixa)
 
         return JsonResponse({
             'sucesso': True,
@@ -42,6 +42,8 @@ def enviar_email_erro_tms_task(self, baixa_id, mensagem_erro):
         ocorrencia_desc = baixa.ocorrencia.descricao if baixa.ocorrencia else 'N/A'
         data_baixa = baixa.data_baixa.strftime('%d/%m/%Y %H:%M')
         foto_url = baixa.comprovante_foto_url if hasattr(baixa, 'comprovante_foto_url') else None
+        # No corpo do e-mail vai a miniatura; a foto inteira fica no link
+        miniatura_url = baixa.comprovante_miniatura_url or foto_url
 
         html_content = f"""
         <table width="600" align="center" cellpadding="0" cellspacing="0" border="0" style="border:1px solid #e2e8f0;">
@@ -78,7 +80,7 @@ def enviar_email_erro_tms_task(self, baixa_id, mensagem_erro):
             <tr>
               <td style="padding:0 20px 15px; font-family: Arial, sans-serif;">
                 <h3 style="margin-bottom:5px;border-bottom:1px solid #dddddd;">📸 Comprovante</h3>
-                {f'<p><a href="{foto_url}" target="_blank">Abrir imagem</a></p><img src="{foto_url}" width="500" style="display:block;border:1px solid #ccc;">' if foto_url else '<p>Sem foto.</p>'}
+                {f'<p><a href="{foto_url}" target="_blank">Abrir imagem</a></p><a href="{foto_url}" target="_blank"><img src="{miniatura_url}" width="320" style="display:block;border:1px solid #ccc;"></a>' if foto_url else '<p>Sem foto.</p>'}
               </td>
             </tr>
             <tr>
@@ -61,6 +61,7 @@ async function abrirHistorico() {
                                             <div class="text-muted small mb-2"><i class="bi bi-chat-left-text me-1"></i>${nf.descricao_detalhada}</div>
                                             
                                             ${nf.foto_comprovante ? `
+                                                ${nf.miniatura_comprovante ? `<img src="${nf.miniatura_comprovante}" loading="lazy" class="rounded border mt-1" style="max-height: 80px; cursor: pointer;" onclick="verFotoCanhoto('${nf.foto_comprovante}')">` : ''}
                                                 <button class="btn btn-sm btn-outline-primary mt-1 w-100" onclick="verFotoCanhoto('${nf.foto_comprovante}')">
                                                     <i class="bi bi-camera me-1"></i> Ver Comprovante
                                                 </button>
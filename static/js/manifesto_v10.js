@@ -10,6 +10,7 @@ const ENDPOINTS = {
 const LOGIN_URL = '/app/login/';
 let loadingModal = null;
 let pollingInterval = null;
+let manifestoSocket = null;
 let manifestoAtual = null;
 let jaMudouDeTela = false;
 
@@ -166,56 +167,95 @@ async function handleManifestoSearch(event) {
     }
 }
 
+// O progresso chega pelo WebSocket (ManifestoConsumer). O polling só entra
+// se o socket não conectar (rede que bloqueia WS, servidor sem ASGI etc.)
 function startPolling() {
     stopPolling();
     jaMudouDeTela = false;
 
-    pollingInterval = setInterval(async () => {
-        try {
-            const response = await authFetch(`${API_BASE}manifesto/status/?numero_manifesto=${manifestoAtual}`);
+    const motoristaId = localStorage.getItem('motorista_id');
+    const access = localStorage.getItem('accessToken');
+    if (!motoristaId || !access || !('WebSocket' in window)) {
+        iniciarPollingFallback();
+        return;
+    }
 
-            // PROTEÇÃO 401: Ignora ciclo se o token estiver renovando
-            if (!response || response.status === 401) {
-                console.warn("Autenticação em renovação...");
-                return;
-            }
+    const protocolo = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${protocolo}://${window.location.host}/ws/manifesto/${motoristaId}/?token=${encodeURIComponent(access)}`);
+    manifestoSocket = socket;
 
-            const data = await response.json();
+    socket.onopen = () => {
+        // A task pode ter andado antes do socket abrir: uma leitura única para alinhar
+        consultarStatusManifesto();
+    };
 
-            // 1. ESTADO DE CARREGAMENTO: Notas aparecendo uma a uma
-            if (data.status === 'ENRIQUECENDO' || data.status === 'AGUARDANDO' || data.status === 'PROCESSANDO') {
-                if (!jaMudouDeTela) {
-                    jaMudouDeTela = true;
-                    loadingModal?.hide();
-                    renderEstruturaLista(manifestoAtual);
-                } else {
-                    atualizarListaViva(manifestoAtual);
-                }
-            }
+    socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (String(data.numero_manifesto) !== String(manifestoAtual)) return;
+        tratarStatusManifesto(data);
+    };
 
-            // 2. ESTADO FINAL: Carga concluída (5 a 50 notas)
-            if (data.status === 'PROCESSADO') {
-                stopPolling();
-                await atualizarListaViva(manifestoAtual);
+    socket.onclose = () => {
+        // Fechou antes do fim da sincronização: segue acompanhando por HTTP
+        if (manifestoSocket === socket) {
+            manifestoSocket = null;
+            iniciarPollingFallback();
+        }
+    };
+}
 
-                const contador = document.getElementById('contador-notas');
-                if (contador) {
-                    contador.className = "badge bg-success animate__animated animate__bounceIn";
-                    contador.innerText = "✅ Sincronização Concluída";
-                }
+function iniciarPollingFallback() {
+    if (pollingInterval) return;
+    pollingInterval = setInterval(consultarStatusManifesto, 3000);
+}
 
-                // Finaliza e recarrega para estabilizar banco local
-                setTimeout(() => { window.location.reload(); }, 1500);
-            }
-            else if (data.status === 'ERRO') {
-                stopPolling();
-                loadingModal?.hide();
-                renderSearchScreen(data.mensagem_erro || 'Erro no processamento', 'error');
-            }
-        } catch (err) {
-            console.error("Erro no ciclo de polling:", err);
+async function consultarStatusManifesto() {
+    try {
+        const response = await authFetch(`${API_BASE}manifesto/status/?numero_manifesto=${manifestoAtual}`);
+
+        // PROTEÇÃO 401: Ignora ciclo se o token estiver renovando
+        if (!response || response.status === 401) {
+            console.warn("Autenticação em renovação...");
+            return;
         }
-    }, 3000);
+
+        tratarStatusManifesto(await response.json());
+    } catch (err) {
+        console.error("Erro ao consultar status do manifesto:", err);
+    }
+}
+
+async function tratarStatusManifesto(data) {
+    // 1. ESTADO DE CARREGAMENTO: Notas aparecendo bloco a bloco
+    if (['AGUARDANDO', 'PRONTO_PREVIEW', 'ENRIQUECENDO', 'PROCESSANDO'].includes(data.status)) {
+        if (!jaMudouDeTela) {
+            jaMudouDeTela = true;
+            loadingModal?.hide();
+            renderEstruturaLista(manifestoAtual);
+        } else {
+            atualizarListaViva(manifestoAtual);
+        }
+    }
+
+    // 2. ESTADO FINAL: Carga concluída (5 a 50 notas)
+    if (data.status === 'PROCESSADO') {
+        stopPolling();
+        await atualizarListaViva(manifestoAtual);
+
+        const contador = document.getElementById('contador-notas');
+        if (contador) {
+            contador.className = "badge bg-success animate__animated animate__bounceIn";
+            contador.innerText = "✅ Sincronização Concluída";
+        }
+
+        // Finaliza e recarrega para estabilizar banco local
+        setTimeout(() => { window.location.reload(); }, 1500);
+    }
+    else if (data.status === 'ERRO') {
+        stopPolling();
+        loadingModal?.hide();
+        renderSearchScreen(data.mensagem_erro || 'Erro no processamento', 'error');
+    }
 }
 
 // =====================================================
@@ -328,7 +368,7 @@ async function atualizarListaViva(numeroManifesto) {
                                     ${baixada ? '<i class="bi bi-check-circle-fill text-success" style="font-size: 1.2rem;"></i>' : '<i class="bi bi-truck text-primary" style="font-size: 1.2rem;"></i>'}
                                 </span>
                             </div>
-                            <p class="small text-muted mb-1">👤 ${nf.destinatario}</p>
+                            <p class="small text-muted mb-1">${nf.enriquecimento_pendente ? '<span class="spinner-border spinner-border-sm me-1" role="status"></span>' : '👤'} ${nf.destinatario}</p>
                             <p class="small text-muted mb-2" style="font-size: 0.75rem;"><i class="bi bi-geo-alt"></i> ${nf.endereco_entrega}</p>
                             ${!baixada ?
                                 `<button class="btn btn-sm btn-primary w-100" onclick="abrirModalBaixa('${nf.numero_nota}', '${nf.chave_acesso}')">Dar Baixa</button>` :
@@ -718,6 +758,11 @@ async function iniciarSincronismo(numeroManifesto) {
 
 function stopPolling() {
     if (pollingInterval) { clearInterval(pollingInterval); pollingInterval = null; }
+    if (manifestoSocket) {
+        const socket = manifestoSocket;
+        manifestoSocket = null; // evita que o onclose ative o fallback
+        socket.close();
+    }
 }
 
 function initModals() {
@@ -747,7 +792,7 @@ function abrirModalDetalhes(dados) {
                 ${dados.ocorrencia || 'Não informada'}
             </span>
         </div>
-        ${dados.foto_url ? `<img src="${dados.foto_url}" class="img-fluid rounded border shadow-sm w-100 mb-3">` : ''}
+        ${dados.foto_url ? `<a href="${dados.foto_url}" target="_blank"><img src="${dados.miniatura_url || dados.foto_url}" class="img-fluid rounded border shadow-sm w-100 mb-3"></a>` : ''}
     `;
     new bootstrap.Modal(document.getElementById('modalDetalhes')).show();
 }